@@ -0,0 +1,93 @@
+"""
+접수 확인(ACK) 주문
+
+ORDER_ACK=true이면 코인 주문(limit_order / market_order / market_entry / market_close 등)의 응답을 가장 작게 받는다.
+주문 결과에서 쓰는 값은 id(hatikoBase의 orderID_list)와 로그용 수량 정도인데
+기본 주문은 거래소가 체결 내역 / 수수료까지 담은 응답을 만들고, ccxt가 그것을 통합 주문 구조로 변환한다.
+
+- Binance : newOrderRespType=ACK (ccxt 기본값은 현물 FULL(체결 내역 포함), 선물 RESULT)
+- Gate 현물 : action_mode=ACK
+  두 거래소는 ccxt create_order_request로 요청을 만들고 주문 endpoint를 직접 호출한다. (응답 변환 parse_order 생략)
+- 그 외 : 응답이 이미 id 정도뿐이거나(Bybit / OKX / Bitget / MEXC) 작은 응답 옵션이 없다(Upbit, Gate 선물).
+  ccxt create_order 결과를 같은 형태로 줄이기만 한다.
+
+결과 : {"id", "clientOrderId", "status", "symbol", "type", "side", "amount", "price", "cost", "info"}
+  amount / price는 요청한 값이다. (ACK 응답에는 체결 정보가 없다) 체결 수량은 fetch_order로 조회한다.
+  status는 응답에 있을 때만 (Binance 현물 ACK에는 없다)
+
+체결 수량을 바로 쓰는 경로(/hedge, /arbitrage : 장부 기록, 업비트 수량 계산)는 disable()로 그 요청에서만 ACK를 끈다.
+"""
+from contextvars import ContextVar
+
+# 직접 호출 경로에서 처리하는 params (이 외의 params가 있으면 ccxt create_order로 보낸다)
+RAW_PARAMS = {"reduceOnly", "positionSide"}
+
+# 현재 context(요청 task, asyncio.to_thread 호출)에서 ACK 주문 사용 여부
+enabled = ContextVar("order_ack", default=True)
+
+SLIM_KEYS = ("id", "clientOrderId", "status", "symbol", "type", "side", "amount", "price", "cost", "info")
+
+
+def binance_endpoint(client, market):
+    if market["linear"]:
+        return client.fapiPrivatePostOrder
+    if market["inverse"]:
+        return client.dapiPrivatePostOrder
+    if market["spot"]:
+        return client.privatePostOrder
+    return None
+
+
+def gate_endpoint(client, market):
+    return client.privateSpotPostOrders if market["spot"] else None
+
+
+# 거래소 -> (작은 응답 요청 params, 주문 endpoint, 응답의 id 키, 응답의 client id 키)
+RAW_ORDERS = {
+    "binance": ({"newOrderRespType": "ACK"}, binance_endpoint, "orderId", "clientOrderId"),
+    "gate": ({"action_mode": "ACK"}, gate_endpoint, "id", "text"),
+}
+
+
+def disable():
+    enabled.set(False)
+
+
+def slim_order(order: dict) -> dict:
+    """
+    ccxt 통합 주문 구조 -> ACK 결과
+    """
+    return {key: order.get(key) for key in SLIM_KEYS}
+
+
+def ack_order(client, market: dict, type: str, side: str, amount, price, response: dict, id_key: str, client_id_key: str) -> dict:
+    order_id = response.get(id_key)
+    status = response.get("status")
+    return {
+        "id": None if order_id is None else str(order_id),
+        "clientOrderId": response.get(client_id_key),
+        "status": None if status is None else client.parse_order_status(status),
+        "symbol": market["symbol"],
+        "type": type,
+        "side": side,
+        "amount": amount,
+        "price": price,
+        "cost": None,
+        "info": response,
+    }
+
+
+def create_order(client, symbol: str, type: str, side: str, amount, price=None, params={}) -> dict:
+    """
+    ccxt create_order와 같은 인자로 ACK 주문
+    """
+    raw = RAW_ORDERS.get(client.id)
+    if raw is None or not RAW_PARAMS.issuperset(params):
+        return slim_order(client.create_order(symbol, type, side, amount, price, params))
+    response_params, endpoint, id_key, client_id_key = raw
+    market = client.market(symbol)
+    send = endpoint(client, market)
+    if send is None:
+        return slim_order(client.create_order(symbol, type, side, amount, price, params))
+    request = client.create_order_request(symbol, type, side, amount, price, params | response_params)
+    return ack_order(client, market, type, side, amount, price, send(request), id_key, client_id_key)
@@ -1,19 +1,23 @@
-from exchange.pexchange import ccxt, ccxt_async, httpx
+import ccxt
+from exchange.clients import MarketClients
+import httpx
 from devtools import debug
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import exchange.error as error
 
 
-class Binance:
+class Binance(MarketClients):
     def __init__(self, key, secret):
-        self.client = ccxt.binance(
+        self.setup_clients(
+            ccxt.binance,
             {
                 "apiKey": key,
                 "secret": secret,
                 "options": {"adjustForTimeDifference": True},
-            }
+            },
+            ("spot", "swap", "delivery"),
         )
-        self.client.load_markets()
         self.position_mode = "one-way"
         self.order_info: MarketOrder = None
 
@@ -36,16 +40,19 @@ class Binance:
                 if is_contract:
                     order_info.is_contract = True
                     order_info.contract_size = market.get("contractSize")
-                self.client.options["defaultType"] = "delivery"
+                self.select_client("delivery")
             else:
-                self.client.options["defaultType"] = "swap"
+                self.select_client("swap")
         else:
-            self.client.options["defaultType"] = "spot"
+            self.select_client("spot")
 
     def get_ticker(self, symbol: str):
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol=None, all=False):
@@ -181,7 +188,7 @@ class Binance:
         params = {}
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -253,7 +260,7 @@ class Binance:
 
         try:
             result = retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -348,7 +355,7 @@ class Binance:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -516,7 +523,7 @@ class Binance:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 "limit",
                 order_info.side,
@@ -533,4 +540,19 @@ class Binance:
         
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol)
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol)
+
+    # NextCandle 재주문 : 정정(amend) 엔드포인트 사용, 안 되면 취소 후 재주문
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price, amend=self.amend_order)
+
+    def amend_order(self, order: dict, price: float):
+        # 선물 : PUT /fapi/v1/order (수량은 원래 주문 수량, 응답에 남은 수량 포함)
+        # 현물 : order/cancelReplace 한 번으로 취소 + 재주문 (수량은 남은 수량)
+        if self.client.options["defaultType"] == "spot":
+            amount = order["remaining"]
+        else:
+            amount = order["amount"]
+        return self.client.edit_order(order["id"], order["symbol"], "limit", order["side"], amount, price)
\ No newline at end of file
@@ -1,21 +1,24 @@
 from pprint import pprint
-from exchange.pexchange import ccxt
+import ccxt
+from exchange.clients import MarketClients
 from exchange.database import db
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import exchange.error as error
 from devtools import debug
 
 
-class Bitget:
+class Bitget(MarketClients):
     def __init__(self, key, secret, passphrase=None):
-        self.client = ccxt.bitget(
+        self.setup_clients(
+            ccxt.bitget,
             {
                 "apiKey": key,
                 "secret": secret,
                 "password": passphrase,
-            }
+            },
+            ("spot", "swap", "delivery"),
         )
-        self.client.load_markets()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
@@ -34,20 +37,23 @@ class Bitget:
 
         if order_info.is_futures:
             if order_info.is_coinm:
-                self.client.options["defaultType"] = "delivery"
+                self.select_client("delivery")
                 is_contract = market.get("contract")
                 if is_contract:
                     order_info.is_contract = True
                     order_info.contract_size = market.get("contractSize")
             else:
-                self.client.options["defaultType"] = "swap"
+                self.select_client("swap")
         else:
-            self.client.options["defaultType"] = "spot"
+            self.select_client("spot")
 
     def get_ticker(self, symbol: str):
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol):
@@ -136,7 +142,7 @@ class Bitget:
         params = {}
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -190,7 +196,7 @@ class Bitget:
             retry(self.set_leverage, order_info.leverage, symbol, order_info = order_info, instance = self)
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -222,7 +228,7 @@ class Bitget:
             params = {"reduceOnly": True, "tradeSide":"close"}
         try:
             result = retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 final_side,
@@ -367,7 +373,7 @@ class Bitget:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 "limit",
                 order_info.side,
@@ -384,4 +390,21 @@ class Bitget:
 
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
+
+    # NextCandle 재주문 : 정정(amend) 엔드포인트 사용, 안 되면 취소 후 재주문
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price, amend=self.amend_order)
+
+    def amend_order(self, order: dict, price: float):
+        # 선물 : POST /api/v2/mix/order/modify-order. 남은 수량으로 새 주문이 생기고 주문 id가 바뀐다
+        # 현물 지정가는 정정 불가 -> 예외 -> 취소 후 재주문
+        market = self.client.market(order["symbol"])
+        if market["spot"]:
+            raise ccxt.NotSupported("bitget spot limit order amend")
+        return self.client.edit_order(
+            order["id"], order["symbol"], "limit", order["side"], order["remaining"], price,
+            {"marginCoin": market["settleId"]},
+        )
\ No newline at end of file
@@ -1,27 +1,27 @@
 from pprint import pprint
-from exchange.pexchange import ccxt
+import ccxt
+from exchange.clients import MarketClients
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import time
 import exchange.error as error
 from devtools import debug
 
 
-class Bybit:
+class Bybit(MarketClients):
     def __init__(self, key, secret):
-        self.client = ccxt.bybit(
+        self.setup_clients(
+            ccxt.bybit,
             {
                 "apiKey": key,
                 "secret": secret,
                 "options": {"adjustForTimeDifference": True},
-            }
+            },
+            ("spot", "swap", "delivery"),
         )
-        self.client.load_markets()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
-    def load_time_difference(self):
-        self.client.load_time_difference()
-
     def init_info(self, order_info: MarketOrder):
         self.order_info = order_info
 
@@ -37,20 +37,23 @@ class Bybit:
 
         if order_info.is_futures:
             if order_info.is_coinm:
-                self.client.options["defaultType"] = "delivery"
+                self.select_client("delivery")
                 is_contract = market.get("contract")
                 if is_contract:
                     order_info.is_contract = True
                     order_info.contract_size = market.get("contractSize")
             else:
-                self.client.options["defaultType"] = "swap"
+                self.select_client("swap")
         else:
-            self.client.options["defaultType"] = "spot"
+            self.select_client("spot")
 
     def get_ticker(self, symbol: str):
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol):
@@ -161,7 +164,7 @@ class Bybit:
         params = {}
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -223,7 +226,7 @@ class Bybit:
             self.set_leverage(order_info.leverage, symbol)
         try:
             result = retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -267,7 +270,7 @@ class Bybit:
 
         try:
             result = retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -398,7 +401,7 @@ class Bybit:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 "limit",
                 order_info.side,
@@ -416,4 +419,14 @@ class Bybit:
 
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
+
+    # NextCandle 재주문 : 정정(amend) 엔드포인트 사용, 안 되면 취소 후 재주문
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price, amend=self.amend_order)
+
+    def amend_order(self, order: dict, price: float):
+        # POST /v5/order/amend (가격만 변경, 주문 id 유지)
+        return self.client.edit_order(order["id"], order["symbol"], "limit", order["side"], None, price)
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+상품 유형별(spot / swap / delivery) ccxt client
+
+거래소 adapter마다 상품 유형별로 client를 따로 만든다. (options["defaultType"], requests 세션이 client마다 따로)
+세션은 exchange.connection에서 pool 크기 / keep-alive / DNS 캐시를 설정한다.
+마켓 정보는 첫 client에서 한 번만 불러오고 나머지 client는 set_markets로 같은 정보를 쓴다.
+
+init_info는 options["defaultType"]을 바꾸는 대신 주문에 맞는 client를 고른다.
+고른 client는 현재 context(요청 task, asyncio.to_thread 호출)에만 적용되므로
+같은 거래소에서 현물 주문과 선물 주문이 동시에 진행돼도 서로의 client를 바꾸지 않는다.
+order_info(init_info로 받은 주문)도 같은 방식으로 context마다 따로 들고 있다.
+get_amount / get_balance 등이 self.order_info를 읽는 동안 다른 주문의 init_info가 값을 바꾸지 않는다.
+context에서 고른 적이 없으면 마지막으로 고른 client / order_info를 쓴다. (기존 동작)
+
+주문은 self.create_order로 보낸다. ORDER_ACK이면 접수 확인 응답만 받는다. (exchange.ack)
+"""
+from contextvars import ContextVar
+from exchange import ack, connection
+from exchange.utility import settings
+
+# 첫 client에서 구한 값을 다른 client에도 복사하는 옵션 (adjustForTimeDifference)
+SHARED_OPTIONS = ("timeDifference",)
+
+
+class MarketClients:
+    def setup_clients(self, factory, config: dict, market_types: tuple[str, ...]):
+        options = config.get("options", {})
+        self.clients = {}
+        for market_type in market_types:
+            self.clients[market_type] = factory(config | {"options": options | {"defaultType": market_type}})
+            connection.tune(self.clients[market_type], market_type)
+        self.base_client.load_markets()
+        self.share_markets()
+        self.last_client = self.base_client
+        self.selected_client = ContextVar(f"{self.base_client.id}_client_{id(self)}", default=None)
+        self.last_order_info = None
+        self.selected_order_info = ContextVar(f"{self.base_client.id}_order_info_{id(self)}", default=None)
+
+    @property
+    def base_client(self):
+        return next(iter(self.clients.values()))
+
+    @property
+    def client(self):
+        return self.selected_client.get() or self.last_client
+
+    @property
+    def order_info(self):
+        return self.selected_order_info.get() or self.last_order_info
+
+    @order_info.setter
+    def order_info(self, order_info):
+        self.selected_order_info.set(order_info)
+        if order_info is not None:
+            self.last_order_info = order_info
+
+    def select_client(self, market_type: str):
+        client = self.clients[market_type]
+        self.selected_client.set(client)
+        self.last_client = client
+        return client
+
+    def share_markets(self):
+        base = self.base_client
+        for client in self.clients.values():
+            if client is base:
+                continue
+            client.set_markets(base.markets, base.currencies)
+        self.share_options()
+
+    def share_options(self):
+        base = self.base_client
+        for client in self.clients.values():
+            for key in SHARED_OPTIONS:
+                if client is not base and key in base.options:
+                    client.options[key] = base.options[key]
+
+    def create_order(self, symbol: str, type: str, side: str, amount, price=None, params={}):
+        # retry는 함수 이름(create_order)으로 재시도 규칙을 고르므로 이름을 바꾸지 않는다
+        if settings.ORDER_ACK and ack.enabled.get():
+            return ack.create_order(self.client, symbol, type, side, amount, price, params)
+        return self.client.create_order(symbol, type, side, amount, price, params)
+
+    def reload_markets(self):
+        self.base_client.load_markets(reload=True)
+        self.share_markets()
+
+    def load_time_difference(self):
+        self.base_client.load_time_difference()
+        self.share_options()
@@ -0,0 +1,248 @@
+"""
+거래소 HTTP 연결 관리 (ccxt sync client의 requests 세션)
+
+- pool : client마다 CONNECTION_POOL_SIZE개 연결을 유지한다. (동시 주문 / fan-out 때 연결을 새로 만들지 않도록)
+- TCP keep-alive : 쉬는 동안 NAT / 로드밸런서가 연결을 끊지 않도록 소켓 keep-alive를 켠다.
+- DNS 캐시 : 거래소 세션의 연결 class에서만 host 조회 결과를 DNS_CACHE_TTL초 동안 재사용한다. 연결 오류가 나면 해당 host는 다시 조회한다.
+  (socket.getaddrinfo는 바꾸지 않으므로 PocketBase / Discord / KIS 등 다른 요청의 조회에는 영향이 없다)
+- keep-warm : KEEP_WARM_TIMEFRAME 봉 마감 KEEP_WARM_LEAD초 전에, 사용 중인 client마다 서버 시간 조회를 보낸다.
+  봉 마감 직후 들어오는 주문이 DNS 조회 / TCP 연결 / TLS handshake 없이 바로 나간다.
+- 지표 : "거래소:상품유형"별 요청 수, 새 연결 수, 연결 재사용률, 새 연결 평균 시간(DNS + TCP + TLS) -> GET /connections
+"""
+import time
+import socket
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family, create_connection
+from loguru import logger
+from exchange.utility import settings
+
+KEEPALIVE_IDLE = 30         # 마지막 패킷 후 keep-alive probe까지(초)
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+# 서버 시간 조회(fetchTime)가 없는 거래소는 시세 하나를 조회한다
+WARM_SYMBOLS = {
+    ("gate", "spot"): "BTC/USDT",
+    ("gate", "swap"): "BTC/USDT:USDT",
+    ("upbit", "spot"): "BTC/KRW",
+}
+
+
+def keepalive_options() -> list[tuple]:
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL), ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+        if hasattr(socket, name):   # macOS / Windows에는 일부 옵션이 없다
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return HTTPConnection.default_socket_options + options
+
+
+#region 지표
+class ConnectionMetrics:
+    """
+    주문은 asyncio.to_thread의 worker thread에서 나가므로 값은 lock 안에서만 바꾼다
+    """
+    __slots__ = ("requests", "connects", "connect_seconds", "errors", "last_connect_ms", "lock")
+
+    def __init__(self):
+        self.requests = 0
+        self.connects = 0
+        self.connect_seconds = 0.0
+        self.errors = 0
+        self.last_connect_ms = None
+        self.lock = threading.Lock()
+
+    def add_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def add_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def add_connect(self, elapsed: float):
+        with self.lock:
+            self.connects += 1
+            self.connect_seconds += elapsed
+            self.last_connect_ms = round(elapsed * 1000, 1)
+
+    def dict(self) -> dict:
+        with self.lock:
+            requests, connects, connect_seconds = self.requests, self.connects, self.connect_seconds
+            last_connect_ms, errors = self.last_connect_ms, self.errors
+        return {
+            "requests": requests,
+            "connects": connects,
+            "reuse": round(1 - connects / requests, 4) if requests else None,
+            "connect_ms": round(connect_seconds / connects * 1000, 1) if connects else None,
+            "last_connect_ms": last_connect_ms,
+            "errors": errors,
+        }
+
+
+metrics: dict[str, ConnectionMetrics] = {}
+
+
+def status() -> dict:
+    return {name: metric.dict() for name, metric in metrics.items()}
+
+
+#endregion 지표
+
+
+#region DNS 캐시
+class DnsCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: dict[tuple, tuple[float, list[str]]] = {}
+        self.lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> list[str]:
+        """
+        host -> 주소 목록 (urllib3 create_connection과 같은 family / SOCK_STREAM 조회)
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        addresses = list(dict.fromkeys(sa[0] for *_, sa in socket.getaddrinfo(host, port, allowed_gai_family(), socket.SOCK_STREAM)))
+        with self.lock:
+            self.entries[key] = (now, addresses)
+        return addresses
+
+    def forget(self, host: str):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == host]:
+                del self.entries[key]
+
+
+dns_cache = DnsCache(settings.DNS_CACHE_TTL)
+#endregion DNS 캐시
+
+
+def tuned_connection(base, metric: ConnectionMetrics):
+    """
+    거래소 세션 전용 연결 class : 연결 시간 측정 + DNS 캐시
+    """
+    class TunedConnection(base):
+        def connect(self):
+            started = time.perf_counter()
+            super().connect()
+            metric.add_connect(time.perf_counter() - started)
+
+        def _new_conn(self):
+            if dns_cache.ttl <= 0:
+                return super()._new_conn()
+            try:
+                addresses = dns_cache.resolve(self._dns_host, self.port)
+            except socket.gaierror as e:
+                raise NameResolutionError(self.host, self, e) from e
+            # 조회된 주소에 직접 연결한다 (TLS SNI / 인증서 검증은 그대로 self.host 기준)
+            error = None
+            for address in addresses:
+                try:
+                    return create_connection((address, self.port), self.timeout, source_address=self.source_address, socket_options=self.socket_options)
+                except OSError as e:
+                    error = e
+            if isinstance(error, TimeoutError):
+                raise ConnectTimeoutError(self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})") from error
+            raise NewConnectionError(self, f"Failed to establish a new connection: {error}") from error
+
+    return TunedConnection
+
+
+class TunedAdapter(HTTPAdapter):
+    """
+    pool 크기 / keep-alive 소켓 옵션 / 연결 시간 측정 / DNS 캐시
+    """
+
+    def __init__(self, metric: ConnectionMetrics, pool_size: int):
+        self.metric = metric
+        super().__init__(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault("socket_options", keepalive_options())
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("TimedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": tuned_connection(HTTPConnection, self.metric)}),
+            "https": type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": tuned_connection(HTTPSConnection, self.metric)}),
+        }
+
+    def send(self, request, **kwargs):
+        self.metric.add_request()
+        try:
+            return super().send(request, **kwargs)
+        except ConnectionError:
+            self.metric.add_error()
+            dns_cache.forget(urlsplit(request.url).hostname)
+            raise
+
+
+def tune(client, market_type: str):
+    """
+    ccxt sync client의 requests 세션에 TunedAdapter를 연결
+    """
+    name = f"{client.id}:{market_type}"
+    metric = metrics.setdefault(name, ConnectionMetrics())
+    adapter = TunedAdapter(metric, settings.CONNECTION_POOL_SIZE)
+    client.session.mount("https://", adapter)
+    client.session.mount("http://", adapter)
+
+
+#region keep-warm
+def warm(client, market_type: str):
+    symbol = WARM_SYMBOLS.get((client.id, market_type))
+    if symbol is not None:
+        client.fetch_ticker(symbol)
+    elif client.has.get("fetchTime"):
+        client.fetch_time()
+
+
+def used_clients(bots) -> list[tuple]:
+    # 한 번이라도 요청을 보낸 client만 (쓰지 않는 상품 유형의 host까지 연결하지 않는다)
+    clients = []
+    for bot in bots:
+        for market_type, client in getattr(bot, "clients", {}).items():
+            metric = metrics.get(f"{client.id}:{market_type}")
+            if metric is not None and metric.requests:
+                clients.append((client, market_type))
+    return clients
+
+
+def next_wake(timeframe_seconds: int, lead: float, now: float) -> float:
+    wake = (now // timeframe_seconds + 1) * timeframe_seconds - lead
+    return wake if wake > now else wake + timeframe_seconds
+
+
+async def run_keep_warm(get_bots, timeframe: str, lead: float):
+    import ccxt
+
+    seconds = ccxt.Exchange.parse_timeframe(timeframe)
+    while True:
+        now = time.time()
+        await asyncio.sleep(next_wake(seconds, lead, now) - now)
+        clients = used_clients(get_bots())
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *[asyncio.to_thread(warm, client, market_type) for client, market_type in clients],
+            return_exceptions=True,
+        )
+        failed = [f"{client.id}:{market_type} {result!r}" for (client, market_type), result in zip(clients, results) if isinstance(result, Exception)]
+        if failed:
+            logger.warning(f"[connection] keep-warm 실패 : {failed}")
+        logger.debug(f"[connection] keep-warm {len(clients)}개 client, {(time.perf_counter() - started) * 1000:.0f}ms")
+#endregion keep-warm
+
+
+def start_keep_warm(get_bots) -> asyncio.Task | None:
+    if not settings.KEEP_WARM_TIMEFRAME:
+        return None
+    return asyncio.create_task(run_keep_warm(get_bots, settings.KEEP_WARM_TIMEFRAME, settings.KEEP_WARM_LEAD))
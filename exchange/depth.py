@@ -0,0 +1,103 @@
+"""
+호가창(L2) 기반 주문 수량 / 가격 계산 (DEPTH_SIZING=true)
+
+종목마다 fetch_order_book 결과를 DEPTH_TTL초 동안 캐시하고, 한 번에 아래 값을 미리 계산해 둔다.
+  prices : 최우선 호가부터의 가격
+  dists  : 최우선 호가 대비 가격 차이 비율 (양쪽 모두 오름차순)
+  cums   : 누적 수량
+이후 계산은 누적 배열에서 bisect 한 번으로 끝난다. (레벨 순회 없음)
+
+max_slice()  : 최우선 호가 대비 slippage 이내의 호가만 먹는 최대 수량 (분할 주문 크기)
+kill_price() : amount를 모두 채우는 가격. 단 최우선 호가 대비 slippage 밖으로는 나가지 않는다 (Kill_Confirm)
+"""
+import time
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import NamedTuple
+from loguru import logger
+from exchange.utility import settings
+
+
+class BookSide(NamedTuple):
+    prices: tuple
+    dists: tuple
+    cums: tuple
+
+    @property
+    def best(self) -> float | None:
+        return self.prices[0] if self.prices else None
+
+
+class Book(NamedTuple):
+    bids: BookSide
+    asks: BookSide
+    ts: float
+
+    def taker(self, side: str) -> BookSide:
+        # buy 주문은 매도호가(asks)를, sell 주문은 매수호가(bids)를 먹는다
+        return self.asks if side == "buy" else self.bids
+
+
+def book_side(levels: list) -> BookSide:
+    levels = [level for level in levels if level[1]]
+    if not levels:
+        return BookSide((), (), ())
+    prices = tuple(float(level[0]) for level in levels)
+    best = prices[0]
+    dists = tuple(abs(price - best) / best for price in prices)
+    cums = tuple(accumulate(float(level[1]) for level in levels))
+    return BookSide(prices, dists, cums)
+
+
+_books: dict[tuple, Book] = {}
+_lock = threading.Lock()
+
+
+def get_book(client, symbol: str, ttl: float | None = None, limit: int | None = None) -> Book:
+    ttl = settings.DEPTH_TTL if ttl is None else ttl
+    key = (client.id, symbol)
+    book = _books.get(key)
+    if book is not None and time.time() - book.ts < ttl:
+        return book
+    with _lock:
+        # 다른 스레드가 먼저 갱신했으면 그대로 사용
+        book = _books.get(key)
+        if book is not None and time.time() - book.ts < ttl:
+            return book
+        order_book = client.fetch_order_book(symbol, limit or settings.DEPTH_LIMIT)
+        book = Book(book_side(order_book["bids"]), book_side(order_book["asks"]), time.time())
+        _books[key] = book
+        return book
+
+
+def max_slice(client, symbol: str, side: str, slippage: float | None = None) -> float | None:
+    """
+    side 주문 하나가 최우선 호가 대비 slippage 안에서 체결될 수 있는 최대 수량. 호가가 없으면 None
+    수량은 호가창 단위 그대로 (현물 : 코인 수, 선물 : 계약 수 = ccxt 주문 수량 단위)
+    """
+    slippage = settings.DEPTH_SLIPPAGE if slippage is None else slippage
+    levels = get_book(client, symbol).taker(side)
+    if not levels.prices:
+        return None
+    return levels.cums[bisect_right(levels.dists, slippage) - 1]
+
+
+def kill_price(client, symbol: str, side: str, amount: float, slippage: float | None = None) -> float | None:
+    """
+    amount를 모두 채우는 지정가 (sweep 가격). 최우선 호가 대비 slippage를 넘지 않게 제한한다.
+    호가가 부족하면 제한 가격으로 주문해서 남는 수량은 호가에 걸어둔다. 호가가 없으면 None
+    """
+    slippage = settings.DEPTH_KILL_SLIPPAGE if slippage is None else slippage
+    levels = get_book(client, symbol).taker(side)
+    if not levels.prices:
+        return None
+    index = bisect_left(levels.cums, amount)
+    if side == "buy":
+        bound = levels.best * (1 + slippage)
+        price = min(levels.prices[index], bound) if index < len(levels.prices) else bound
+    else:
+        bound = levels.best * (1 - slippage)
+        price = max(levels.prices[index], bound) if index < len(levels.prices) else bound
+    logger.debug(f"[depth] {symbol} {side} {amount} -> {price} (best {levels.best}, level {index})")
+    return float(client.price_to_precision(symbol, price))
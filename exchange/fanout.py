@@ -0,0 +1,166 @@
+"""
+계좌 그룹 주문 (fan-out)
+
+웹훅 하나(group 지정)를 그룹에 속한 모든 계좌에 동시에 주문한다.
+  ACCOUNT_GROUPS = {"main": {"BINANCE": 1, "BINANCE_SUB1": 0.5, "KIS1": 1, "KIS2": 2}}
+  ACCOUNTS = {"BINANCE_SUB1": {"exchange": "BINANCE", "key": "...", "secret": "..."}}
+
+- 계좌 이름은 거래소 이름(기본 키), KIS1~KIS4, 또는 ACCOUNTS에 추가한 하위 계좌.
+- 계좌마다 거래소 객체가 따로 있다. (ccxt 세션 / rate limit, KIS connection pool 모두 계좌별)
+- 신호의 거래소와 같은 거래소 계좌에만 주문한다. (주식 신호면 KIS 계좌)
+- 수량은 계좌별로 계산한다. percent 주문은 각 계좌 잔고 기준이고, amount / cost는 그룹의 배율을 곱한다.
+- 계좌별 결과(성공/실패, 주문 id, 주문 응답, 걸린 시간)를 모아서 반환한다. 전체 시간은 가장 느린 계좌 기준이다.
+- KIS 계좌는 단일 계좌 /order와 같이 수량(amount)으로만 주문한다. (percent 주문은 계좌별 실패로 기록)
+"""
+import time
+import asyncio
+import traceback
+from typing import NamedTuple
+from fastapi import HTTPException
+from exchange.utility import settings
+import exchange.error as error
+from exchange.model import CRYPTO_EXCHANGES, MarketOrder
+from exchange.pexchange import get_exchange, load_adapter, KIS_ACCOUNTS
+
+# ACCOUNTS에 추가한 하위 계좌의 거래소 객체
+accounts = {}
+
+
+class AccountResult(NamedTuple):
+    account: str
+    exchange: str
+    result: dict | None
+    error: str | None
+    elapsed_ms: float
+    order_info: MarketOrder | None = None     # 이 계좌에 보낸 주문 (배율 적용, order_name에 계좌 표시)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def order_id(self) -> str | None:
+        if not self.result:
+            return None
+        if self.exchange == "KIS":
+            # KIS 주문 응답 : {"rt_cd", "msg1", "output": {"ODNO", ...}}
+            return (self.result.get("output") or {}).get("ODNO")
+        return self.result.get("id")
+
+
+class FanOutResult(NamedTuple):
+    group: str
+    results: list[AccountResult]
+    elapsed_ms: float
+
+    @property
+    def ok(self) -> bool:
+        return all(result.ok for result in self.results)
+
+    def dict(self) -> dict:
+        return {
+            "group": self.group,
+            "ok": self.ok,
+            "elapsed_ms": self.elapsed_ms,
+            "accounts": {
+                # 응답에는 예외 메시지만, 전체 traceback은 로그로
+                result.account: {
+                    "ok": result.ok,
+                    "order_id": result.order_id,
+                    "result": result.result,
+                    "elapsed_ms": result.elapsed_ms,
+                    "error": result.error and result.error.strip().splitlines()[-1],
+                }
+                for result in self.results
+            },
+        }
+
+
+def account_exchange(account: str) -> str:
+    if account in KIS_ACCOUNTS:
+        return "KIS"
+    if account in settings.ACCOUNTS:
+        return settings.ACCOUNTS[account]["exchange"].upper()
+    return account
+
+
+def group_accounts(group: str, order_info: MarketOrder) -> dict[str, float]:
+    """
+    그룹에서 신호의 거래소에 주문할 계좌 -> 수량 배율
+    """
+    members = settings.ACCOUNT_GROUPS.get(group)
+    if not members:
+        raise HTTPException(status_code=404, detail=f"{group} 계좌 그룹이 없습니다")
+    target = "KIS" if order_info.is_stock else order_info.exchange
+    return {account: scale for account, scale in members.items() if account_exchange(account) == target}
+
+
+def get_account(account: str):
+    if account in KIS_ACCOUNTS:
+        return get_exchange("KRX", int(account[3:]))
+    if account in CRYPTO_EXCHANGES:
+        return get_exchange(account)
+    bot = accounts.get(account)
+    if bot is None:
+        config = settings.ACCOUNTS[account]
+        exchange_name = config["exchange"].upper()
+        if exchange_name in ("BITGET", "OKX"):
+            bot = load_adapter(exchange_name)(config["key"], config["secret"], config.get("passphrase"))
+        else:
+            bot = load_adapter(exchange_name)(config["key"], config["secret"])
+        accounts[account] = bot
+    return bot
+
+
+def account_order(order_info: MarketOrder, account: str, scale: float, kis_number: int | None = None) -> MarketOrder:
+    update = {"order_name": f"{order_info.order_name} [{account}]"}
+    if scale != 1:
+        if order_info.amount is not None:
+            update["amount"] = order_info.amount * scale
+        if order_info.cost is not None:
+            update["cost"] = order_info.cost * scale
+    if kis_number is not None:
+        update["kis_number"] = kis_number
+    return order_info.copy(update=update)
+
+
+def market_order(bot, order_info: MarketOrder):
+    """
+    /order의 주문 분기 (코인 : 진입 / 종료 / 매수 / 매도)
+    """
+    bot.init_info(order_info)
+    if order_info.is_entry:
+        return bot.market_entry(order_info)
+    elif order_info.is_close:
+        return bot.market_close(order_info)
+    elif order_info.is_buy:
+        return bot.market_buy(order_info)
+    elif order_info.is_sell:
+        return bot.market_sell(order_info)
+
+
+async def execute_account(account: str, order_info: MarketOrder, scale: float) -> AccountResult:
+    started = time.perf_counter()
+    exchange_name = account_exchange(account)
+    order = account_order(order_info, account, scale, int(account[3:]) if exchange_name == "KIS" else None)
+    try:
+        # 처음 쓰는 계좌는 객체 생성(마켓 정보 로드 등)이 오래 걸리므로 스레드에서
+        bot = await asyncio.to_thread(get_account, account)
+        if exchange_name == "KIS":
+            if order.amount is None:
+                raise error.UnSupportedFeatureError("KIS - percent 주문 (amount를 지정하세요)")
+            bot.init_info(order)
+            # 수량 변환(정수)은 단일 계좌 /order와 같이 주문 요청을 만들 때 한다
+            result = await bot.acreate_order(order.exchange, order.base, order.type.lower(), order.side.lower(), order.amount)
+        else:
+            result = await asyncio.to_thread(market_order, bot, order)
+    except Exception:
+        return AccountResult(account, exchange_name, None, traceback.format_exc(), round((time.perf_counter() - started) * 1000, 1), order)
+    return AccountResult(account, exchange_name, result, None, round((time.perf_counter() - started) * 1000, 1), order)
+
+
+async def fan_out(group: str, order_info: MarketOrder) -> FanOutResult:
+    started = time.perf_counter()
+    members = group_accounts(group, order_info)
+    results = await asyncio.gather(*[execute_account(account, order_info, scale) for account, scale in members.items()])
+    return FanOutResult(group, list(results), round((time.perf_counter() - started) * 1000, 1))
@@ -0,0 +1,168 @@
+"""
+헷지 / 차익거래 포지션 장부 ("kimp", "arbitrage")
+
+(collection, base, exchange)별 누적 수량은 store.db(ledger 테이블)에만 있다. add / close는 그 행 하나를
+SQL 한 문장으로 바로 바꾸고(로컬 SQLite, 외부 호출 없음), 조회도 매번 store.db에서 읽는다.
+프로세스가 죽어도 체결된 포지션은 남고, 여러 워커(run.py --workers N)가 같은 합계를 본다.
+LEDGER_POCKET_SYNC=true면 PocketBase에도 같은 내용을 LEDGER_FLUSH_INTERVAL초마다 모아서 백그라운드로 반영한다.
+업그레이드 후 첫 실행에는 LEDGER_POCKET_SYNC와 상관없이 PocketBase 기록을 읽어서 가져오고, ledger_meta에 표시를 남긴다.
+표시가 있으면 장부가 비어 있어도 다시 가져오지 않는다. (모두 종료한 포지션이 재시작 후 되살아나지 않도록)
+가져오지 못하면 열린 포지션이 0으로 보이므로 에러 알림을 보내고, 다음 실행 때 다시 시도한다.
+
+store.db 연결(sqlite3)은 만든 스레드에서만 쓸 수 있으므로 add / close는 event loop에서 호출한다.
+PocketBase 가져오기(import_once)는 leader 프로세스에서만 실행한다.
+"""
+import time
+import asyncio
+import traceback
+from loguru import logger
+from exchange.utility import settings, log_error_message
+
+COLLECTIONS = ("kimp", "arbitrage")
+POCKET_IMPORTED = "pocket_imported"     # ledger_meta key : PocketBase 기록을 가져온 시각
+
+
+class Ledger:
+    def __init__(self, db):
+        self.db = db
+        self.pocket_ops: list[tuple] = []   # ("create", collection, data) / ("close", collection, base, exchange)
+        self.task = None
+
+    #region 장부
+    def get(self, collection: str, base: str) -> dict[str, float]:
+        rows = self.db.fetch_all("SELECT exchange, amount FROM ledger WHERE collection = ? AND base = ?;", (collection, base))
+        return {exchange: amount for exchange, amount in rows if amount}
+
+    def amount(self, collection: str, base: str, exchange: str) -> float:
+        row = self.db.fetch_one("SELECT amount FROM ledger WHERE collection = ? AND base = ? AND exchange = ?;", (collection, base, exchange))
+        return 0.0 if row is None else row[0]
+
+    def add(self, collection: str, base: str, exchange: str, amount: float, quote: str | None = None):
+        # 더하기까지 SQL 한 문장이라 다른 워커가 동시에 더해도 빠지는 수량이 없다
+        self.db.excute(
+            """
+            INSERT INTO ledger (collection, base, exchange, amount) VALUES (?, ?, ?, ?)
+            ON CONFLICT(collection, base, exchange) DO UPDATE SET amount = amount + excluded.amount;
+            """,
+            (collection, base, exchange, amount),
+        )
+        if settings.LEDGER_POCKET_SYNC:
+            self.pocket_ops.append(("create", collection, {"exchange": exchange, "base": base, "quote": quote, "amount": amount}))
+
+    def close(self, collection: str, base: str, exchange: str) -> float:
+        with self.db.con:
+            rows = self.db.con.execute(
+                "DELETE FROM ledger WHERE collection = ? AND base = ? AND exchange = ? RETURNING amount;", (collection, base, exchange)
+            ).fetchall()
+        if settings.LEDGER_POCKET_SYNC:
+            self.pocket_ops.append(("close", collection, base, exchange))
+        return rows[0][0] if rows else 0.0
+    #endregion 장부
+
+    #region store.db
+    def load(self) -> int:
+        self.db.excute(
+            """
+            CREATE TABLE IF NOT EXISTS ledger (
+                collection TEXT,
+                base TEXT,
+                exchange TEXT,
+                amount REAL,
+                PRIMARY KEY (collection, base, exchange)
+            );
+            """,
+            {},
+        )
+        self.db.excute("CREATE TABLE IF NOT EXISTS ledger_meta (key TEXT PRIMARY KEY, value TEXT);", {})
+        return self.db.fetch_one("SELECT COUNT(*) FROM ledger;", {})[0]
+
+    def get_meta(self, key: str) -> str | None:
+        row = self.db.fetch_one("SELECT value FROM ledger_meta WHERE key = ?;", (key,))
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str):
+        self.db.excute(
+            "INSERT INTO ledger_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value;",
+            (key, value),
+        )
+    #endregion store.db
+
+    #region PocketBase 동기화
+    async def import_pocket(self):
+        """
+        PocketBase 기록을 합산해서 가져온다 (이전 버전에서 넘어온 경우, 한 번만)
+        """
+        from exchange import pocket
+
+        totals = {}
+        for collection in COLLECTIONS:
+            for record in await pocket.get_full_list(collection):
+                key = (collection, record.base, record.exchange)
+                totals[key] = totals.get(key, 0.0) + record.amount
+        return totals
+
+    async def sync_pocket(self, ops: list[tuple]):
+        from exchange import pocket
+
+        for op in ops:
+            try:
+                if op[0] == "create":
+                    _, collection, data = op
+                    await pocket.create(collection, data)
+                else:
+                    _, collection, base, exchange = op
+                    records = await pocket.get_full_list(collection, query_params={"filter": f'base = "{base}" && exchange = "{exchange}"'})
+                    await pocket.delete_many(collection, [record.id for record in records])
+            except Exception:
+                log_error_message(traceback.format_exc(), "장부 PocketBase 동기화")
+    #endregion PocketBase 동기화
+
+    async def start(self):
+        """
+        장부를 쓰는 프로세스(워커)마다 : 테이블 준비 + PocketBase 반영 task
+        """
+        self.load()
+        if settings.LEDGER_POCKET_SYNC:
+            self.task = asyncio.create_task(self.run(settings.LEDGER_FLUSH_INTERVAL))
+
+    async def import_once(self):
+        """
+        leader 프로세스 하나에서만 : 업그레이드 후 첫 실행이면 PocketBase 기록을 가져온다
+        """
+        if self.get_meta(POCKET_IMPORTED) is not None:
+            return
+        if self.load():
+            # 표시가 생기기 전 버전에서 이미 가져온 장부
+            self.set_meta(POCKET_IMPORTED, str(time.time()))
+            return
+        try:
+            imported = await self.import_pocket()
+        except Exception:
+            log_error_message(traceback.format_exc(), "장부 PocketBase 가져오기")
+            return
+        # 포지션과 표시를 한 transaction으로 (중간에 죽어도 두 번 가져오지 않는다)
+        with self.db.con:
+            self.db.con.executemany(
+                "INSERT INTO ledger (collection, base, exchange, amount) VALUES (?, ?, ?, ?);",
+                [key + (amount,) for key, amount in imported.items() if amount],
+            )
+            self.db.con.execute("INSERT OR REPLACE INTO ledger_meta (key, value) VALUES (?, ?);", (POCKET_IMPORTED, str(time.time())))
+        logger.info(f"[ledger] PocketBase에서 {len(imported)}개 포지션 가져옴")
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            if self.pocket_ops:
+                ops, self.pocket_ops = self.pocket_ops, []
+                await self.sync_pocket(ops)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.pocket_ops:
+            ops, self.pocket_ops = self.pocket_ops, []
+            await self.sync_pocket(ops)
@@ -0,0 +1,350 @@
+"""
+프로세스 간 공유 시세 캐시 (MARKET_CACHE=true)
+
+multiprocessing.shared_memory 세그먼트 하나에 고정 크기 레코드 배열을 두고
+writer 프로세스 하나가 거래소별 전체 현재가를 갱신한다.
+다른 워커/shard 프로세스는 같은 세그먼트를 복사 없이 읽는다. (주문 경로의 현재가 조회 대신)
+종목 규칙(정밀도, 최소/최대 수량)은 넣지 않는다. 주문하는 ccxt client는 어차피 자기 markets가 있어야 하므로
+공유해도 워커 메모리가 줄지 않는다.
+
+레이아웃
+  header : magic(4s) | index_seq(Q) | count(I) | capacity(I) | writer_pid(I) | writer_heartbeat(d)
+  record : seq(Q) | key(48s) | last(d) | price_ts(d)
+
+레코드마다 seqlock을 사용한다. writer는 쓰기 전에 seq를 홀수로, 쓰고 나서 짝수로 올리고,
+reader는 seq가 짝수이고 읽기 전후 seq가 같을 때만 값을 사용한다.
+레코드는 추가만 되고 지워지지 않으므로 reader는 key -> slot 위치를 한 번만 찾으면 된다.
+writer는 header의 다른 값을 먼저 쓰고 magic을 마지막에 쓴다. reader는 magic이 보일 때까지 ATTACH_TIMEOUT초 기다리고,
+그래도 없으면 캐시 없이 동작한다.
+"""
+import os
+import time
+import struct
+import asyncio
+from typing import NamedTuple
+from multiprocessing import shared_memory, resource_tracker
+from loguru import logger
+from exchange.utility import settings
+
+
+MAGIC = b"POA2"
+HEADER = struct.Struct("<4sQIIId")
+HEADER_SIZE = 64
+RECORD = struct.Struct("<Q48sdd")
+SEQ = struct.Struct("<Q")
+PRICE = struct.Struct("<dd")
+PRICE_OFFSET = SEQ.size + 48
+KEY_SIZE = 48
+DEFAULT_CAPACITY = 16384
+MAX_SPIN = 10000  # writer가 쓰는 도중에 죽은 경우 무한 대기 방지
+ATTACH_TIMEOUT = 2.0  # 방금 만들어진 세그먼트의 header를 기다리는 시간(초)
+
+# writer가 시세를 받아오는 시장 종류 (ccxt fetch_tickers의 type)
+MARKET_TYPES = {
+    "UPBIT": ("spot",),
+    "BINANCE": ("spot", "swap"),
+    "BYBIT": ("spot", "swap"),
+    "BITGET": ("spot", "swap"),
+    "OKX": ("spot", "swap"),
+    "MEXC": ("spot", "swap"),
+    "GATE": ("spot", "swap"),
+}
+
+
+class Quote(NamedTuple):
+    exchange: str
+    symbol: str
+    last: float
+    price_ts: float
+
+
+def make_key(exchange: str, symbol: str) -> bytes:
+    return f"{exchange.upper()}:{symbol}".encode()[:KEY_SIZE]
+
+
+def number(value) -> float:
+    try:
+        return float(value) if value is not None else float("nan")
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class MarketCache:
+    def __init__(self, name: str, capacity: int = DEFAULT_CAPACITY, writer: bool = False):
+        self.name = name
+        self.writer = writer
+        self.slots = {}
+        self.known = 0
+        if writer:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + RECORD.size * capacity)
+            # magic은 마지막에 (reader가 magic을 보면 나머지 header도 다 쓰여 있다)
+            HEADER.pack_into(self.shm.buf, 0, bytes(len(MAGIC)), 0, 0, capacity, os.getpid(), time.time())
+            self.shm.buf[: len(MAGIC)] = MAGIC
+        else:
+            self.shm = attach_untracked(name)
+        self.buf = self.shm.buf
+        magic, _, _, self.capacity, _, _ = wait_header(self.buf, ATTACH_TIMEOUT)
+        if magic != MAGIC:
+            self.buf = None
+            self.shm.close()
+            raise ValueError(f"{name} : market cache 세그먼트가 아닙니다")
+
+    @classmethod
+    def open_or_create(cls, name: str, capacity: int = DEFAULT_CAPACITY):
+        """
+        세그먼트를 먼저 만든 프로세스가 writer, 나머지는 reader
+        writer 프로세스가 죽고 남은 세그먼트(header를 다 쓰기 전에 죽은 경우 포함)는 지우고 새로 만든다.
+        """
+        try:
+            return cls(name, capacity, writer=True)
+        except FileExistsError:
+            pass
+        shm = attach_untracked(name)
+        writer_pid = wait_header(shm.buf, ATTACH_TIMEOUT)[4]
+        if pid_alive(writer_pid):
+            shm.close()
+            return cls(name)
+        logger.info(f"[market_cache] writer(pid={writer_pid})가 없어서 세그먼트를 다시 만듭니다")
+        if os.name != "nt":
+            resource_tracker.register(shm._name, "shared_memory")  # unlink 시 unregister 짝 맞추기
+            shm.unlink()
+        shm.close()
+        return cls(name, capacity, writer=True)
+
+    #region header
+    @property
+    def count(self) -> int:
+        return HEADER.unpack_from(self.buf, 0)[2]
+
+    @property
+    def writer_pid(self) -> int:
+        return HEADER.unpack_from(self.buf, 0)[4]
+
+    @property
+    def writer_heartbeat(self) -> float:
+        return HEADER.unpack_from(self.buf, 0)[5]
+
+    def heartbeat(self):
+        magic, index_seq, count, capacity, _, _ = HEADER.unpack_from(self.buf, 0)
+        HEADER.pack_into(self.buf, 0, magic, index_seq, count, capacity, os.getpid(), time.time())
+    #endregion header
+
+    #region read
+    def slot_of(self, key: bytes) -> int | None:
+        slot = self.slots.get(key)
+        if slot is None and self.count > self.known:
+            # writer가 새로 추가한 레코드의 key만 읽어서 index에 추가
+            count = self.count
+            for index in range(self.known, count):
+                offset = HEADER_SIZE + RECORD.size * index + SEQ.size
+                self.slots[bytes(self.buf[offset : offset + KEY_SIZE]).rstrip(b"\0")] = index
+            self.known = count
+            slot = self.slots.get(key)
+        return slot
+
+    def read(self, slot: int) -> tuple | None:
+        offset = HEADER_SIZE + RECORD.size * slot
+        for _ in range(MAX_SPIN):
+            before = SEQ.unpack_from(self.buf, offset)[0]
+            if before & 1:
+                continue
+            record = RECORD.unpack_from(self.buf, offset)
+            if SEQ.unpack_from(self.buf, offset)[0] == before:
+                return record
+        return None
+
+    def get(self, exchange: str, symbol: str) -> Quote | None:
+        slot = self.slot_of(make_key(exchange, symbol))
+        record = self.read(slot) if slot is not None else None
+        if record is None:
+            return None
+        _, _, *values = record
+        return Quote(exchange.upper(), symbol, *values)
+
+    def price(self, exchange: str, symbol: str, max_age: float) -> float | None:
+        slot = self.slot_of(make_key(exchange, symbol))
+        if slot is None:
+            return None
+        offset = HEADER_SIZE + RECORD.size * slot
+        for _ in range(MAX_SPIN):
+            before = SEQ.unpack_from(self.buf, offset)[0]
+            if before & 1:
+                continue
+            last, price_ts = PRICE.unpack_from(self.buf, offset + PRICE_OFFSET)
+            if SEQ.unpack_from(self.buf, offset)[0] == before:
+                break
+        else:
+            return None
+        if last != last or time.time() - price_ts > max_age:  # nan 또는 오래된 값
+            return None
+        return last
+    #endregion read
+
+    #region write (writer 프로세스만)
+    def write(self, key: bytes, *values):
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.count
+            if slot >= self.capacity:
+                return
+            self.slots[key] = slot
+            self.known = slot + 1
+            offset = HEADER_SIZE + RECORD.size * slot
+            RECORD.pack_into(self.buf, offset, 1, key, *values)
+            SEQ.pack_into(self.buf, offset, 2)
+            # 레코드를 다 쓴 다음에 count를 올려야 reader가 빈 레코드를 보지 않는다.
+            magic, index_seq, count, capacity, pid, beat = HEADER.unpack_from(self.buf, 0)
+            HEADER.pack_into(self.buf, 0, magic, index_seq + 1, count + 1, capacity, pid, beat)
+            return
+        offset = HEADER_SIZE + RECORD.size * slot
+        seq = SEQ.unpack_from(self.buf, offset)[0]
+        SEQ.pack_into(self.buf, offset, seq + 1)
+        RECORD.pack_into(self.buf, offset, seq + 1, key, *values)
+        SEQ.pack_into(self.buf, offset, seq + 2)
+
+    def set_price(self, exchange: str, symbol: str, last: float, price_ts: float | None = None):
+        key = make_key(exchange, symbol)
+        slot = self.slots.get(key)
+        if slot is None:
+            return self.write(key, number(last), price_ts or time.time())
+        offset = HEADER_SIZE + RECORD.size * slot
+        seq = SEQ.unpack_from(self.buf, offset)[0]
+        SEQ.pack_into(self.buf, offset, seq + 1)
+        PRICE.pack_into(self.buf, offset + PRICE_OFFSET, number(last), price_ts or time.time())
+        SEQ.pack_into(self.buf, offset, seq + 2)
+    #endregion write (writer 프로세스만)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "role": "writer" if self.writer else "reader",
+            "count": self.count,
+            "capacity": self.capacity,
+            "bytes": self.shm.size,
+            "writer_pid": self.writer_pid,
+            "writer_heartbeat_age": round(time.time() - self.writer_heartbeat, 1),
+        }
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.writer:
+            self.shm.unlink()
+
+
+def attach_untracked(name: str) -> shared_memory.SharedMemory:
+    """
+    reader는 resource_tracker에 등록하지 않고 연결한다.
+    (등록하면 reader 종료 시 세그먼트가 지워지고, shard처럼 writer와 tracker를 공유하면 writer 등록이 지워진다)
+    """
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def wait_header(buf, timeout: float) -> tuple:
+    """
+    다른 프로세스가 세그먼트를 만든 직후(아직 0으로 채워진 상태)에 연결한 경우 magic이 쓰일 때까지 기다린다
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        header = HEADER.unpack_from(buf, 0)
+        if header[0] == MAGIC or time.monotonic() >= deadline:
+            return header
+        time.sleep(0.01)
+
+
+def pid_alive(pid: int) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+##############################################################################
+# writer
+##############################################################################
+
+async def run_writer(cache: MarketCache, exchanges: list[str], interval: float, retry_interval: float = 60.0):
+    """
+    거래소별 public ccxt client로 interval초마다 전체 시세를 갱신
+    (주문용 bot의 client와 분리해서 defaultType 변경과 충돌하지 않는다)
+    load_markets(fetch_tickers에 필요)에 실패한 거래소는 retry_interval초마다 다시 시도한다.
+    """
+    import ccxt
+
+    clients = {}
+    failed_at = {}
+    while True:
+        started = time.time()
+        for exchange_name in exchanges:
+            if exchange_name in clients or started - failed_at.get(exchange_name, 0) < retry_interval:
+                continue
+            try:
+                client = getattr(ccxt, exchange_name.lower())({"enableRateLimit": True})
+                await asyncio.to_thread(client.load_markets)
+            except Exception as e:
+                failed_at[exchange_name] = started
+                logger.error(f"[market_cache] {exchange_name} load_markets 실패 : {e}")
+                continue
+            clients[exchange_name] = client
+
+        for exchange_name, client in clients.items():
+            for market_type in MARKET_TYPES.get(exchange_name, ("spot",)):
+                try:
+                    tickers = await asyncio.to_thread(client.fetch_tickers, None, {"type": market_type})
+                except Exception as e:
+                    logger.error(f"[market_cache] {exchange_name} {market_type} fetch_tickers 실패 : {e}")
+                    continue
+                for symbol, ticker in tickers.items():
+                    if ticker.get("last") is not None:
+                        cache.set_price(exchange_name, symbol, ticker["last"], (ticker.get("timestamp") or started * 1000) / 1000)
+        cache.heartbeat()
+        await asyncio.sleep(max(interval - (time.time() - started), 0))
+
+
+##############################################################################
+# 프로세스 전역 캐시
+##############################################################################
+
+cache: MarketCache | None = None
+
+
+def attach(create: bool = True) -> MarketCache | None:
+    """
+    MARKET_CACHE=true 인 경우 세그먼트에 연결 (create=False 이면 reader로만 연결 시도)
+    """
+    global cache
+    if cache is not None or not settings.MARKET_CACHE:
+        return cache
+    try:
+        cache = MarketCache.open_or_create(settings.MARKET_CACHE_NAME) if create else MarketCache(settings.MARKET_CACHE_NAME)
+    except (FileNotFoundError, ValueError) as e:
+        # 세그먼트가 없거나 header가 끝내 쓰이지 않은 경우 (writer가 초기화 중에 죽음, 다른 버전) 캐시 없이 동작
+        logger.warning(f"[market_cache] 연결 안 함 : {e!r}")
+        cache = None
+    return cache
+
+
+def detach():
+    global cache
+    if cache is not None:
+        cache.close()
+        cache = None
+
+
+def cached_price(exchange: str, symbol: str) -> float | None:
+    """
+    공유 캐시의 현재가 (캐시가 없거나 MARKET_CACHE_MAX_AGE 보다 오래된 경우 None)
+    """
+    if cache is None:
+        return None
+    return cache.price(exchange, symbol, settings.MARKET_CACHE_MAX_AGE)
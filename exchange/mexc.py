@@ -1,27 +1,27 @@
 from pprint import pprint
-from exchange.pexchange import ccxt
+import ccxt
+from exchange.clients import MarketClients
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import time
 import exchange.error as error
 from devtools import debug
 
 
-class Mexc:
+class Mexc(MarketClients):
     def __init__(self, key, secret):
-        self.client = ccxt.mexc(
+        self.setup_clients(
+            ccxt.mexc,
             {
                 "apiKey": key,
                 "secret": secret,
                 "options": {"adjustForTimeDifference": True},
-            }
+            },
+            ("spot", "swap"),
         )
-        self.client.load_markets()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
-    def load_time_difference(self):
-        self.client.load_time_difference()
-
     def init_info(self, order_info: MarketOrder):
         self.order_info = order_info
 
@@ -39,14 +39,17 @@ class Mexc:
             if order_info.is_coinm:
                 raise error.UnSupportedFeatureError("mexc - coinm")
             else:
-                self.client.options["defaultType"] = "swap"
+                self.select_client("swap")
         else:
-            self.client.options["defaultType"] = "spot"
+            self.select_client("spot")
 
     def get_ticker(self, symbol: str):
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_futures_position(self, symbol):
@@ -281,7 +284,7 @@ class Mexc:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 "limit",
                 order_info.side,
@@ -299,4 +302,10 @@ class Mexc:
 
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
+
+    # NextCandle 재주문 : 취소 후 재주문 (정정 엔드포인트 미사용)
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price)
\ No newline at end of file
@@ -3,6 +3,9 @@ from typing import Literal
 import os
 from pathlib import Path
 from enum import Enum
+from types import MappingProxyType
+from exchange.strategy import HATIKO_SIGNALS, LEVELS, Signal
+from exchange.order_state import OrderState, LevelState, IDLE, state_key, next_state
 from devtools import debug
 
 CRYPTO_LITERAL = Literal["BINANCE", "UPBIT", "BYBIT", "BITGET", "OKX", "MEXC", "GATE"]
@@ -112,20 +115,75 @@ class Settings(BaseSettings):
     KIS1_ACCOUNT_CODE: str | None = None
     KIS1_KEY: str | None = None
     KIS1_SECRET: str | None = None
+    KIS1_HTS_ID: str | None = None  # 실시간 체결통보 구독용 (KIS_WS)
     KIS2_ACCOUNT_NUMBER: str | None = None
     KIS2_ACCOUNT_CODE: str | None = None
     KIS2_KEY: str | None = None
     KIS2_SECRET: str | None = None
+    KIS2_HTS_ID: str | None = None  # 실시간 체결통보 구독용 (KIS_WS)
     KIS3_ACCOUNT_NUMBER: str | None = None
     KIS3_ACCOUNT_CODE: str | None = None
     KIS3_KEY: str | None = None
     KIS3_SECRET: str | None = None
+    KIS3_HTS_ID: str | None = None  # 실시간 체결통보 구독용 (KIS_WS)
     KIS4_ACCOUNT_NUMBER: str | None = None
     KIS4_ACCOUNT_CODE: str | None = None
     KIS4_KEY: str | None = None
     KIS4_SECRET: str | None = None
+    KIS4_HTS_ID: str | None = None  # 실시간 체결통보 구독용 (KIS_WS)
     DB_ID: str = "poa@admin.com"
     DB_PASSWORD: str = "poabot!@#$"
+    POCKETBASE_URL: str = "http://127.0.0.1:8090"
+    # eager : 서버 시작 직후 백그라운드로 미리 생성 / lazy : 첫 요청 때 생성 (첫 주문이 load_markets 만큼 늦어진다)
+    STARTUP_MODE: Literal["lazy", "eager"] = "eager"
+    # local : 프로세스 메모리 (워커 1개) / sqlite : STATE_PATH 파일을 여러 워커가 공유
+    STATE_BACKEND: Literal["local", "sqlite"] = "local"
+    STATE_PATH: str = "./data/state.db"
+    # off : 한 프로세스에서 처리 / exchange : 거래소별 shard 프로세스에서 처리 (메인 프로세스는 요청 전달만)
+    SHARD_MODE: Literal["off", "exchange"] = "off"
+    # 프로세스 간 공유 시세 캐시 (shared memory)
+    MARKET_CACHE: bool = False
+    MARKET_CACHE_NAME: str = "poa_market"
+    MARKET_CACHE_INTERVAL: float = 3.0  # writer 시세 갱신 주기(초)
+    MARKET_CACHE_MAX_AGE: float = 5.0  # 이보다 오래된 시세는 사용하지 않고 거래소에서 조회
+    # 전략 상태 hot-standby 복제 (primary : 변경을 전송 / standby : 수신 후 /replication/promote 로 승격)
+    REPLICATION_ROLE: Literal["off", "primary", "standby"] = "off"
+    REPLICATION_ADDRESS: str = "127.0.0.1:8701"  # "host:port" 또는 "unix:/path/to/socket"
+    # Hatiko 청산 주문 분할 (immediate : 한 번에 / twap : SLICE_TWAP_SECONDS 동안 나눠서 / iceberg : 체결되면 다음 slice)
+    SLICE_MODE: Literal["immediate", "twap", "iceberg"] = "immediate"
+    SLICE_TWAP_SECONDS: float = 60.0
+    SLICE_TWAP_COUNT: int = 5
+    SLICE_ICEBERG_CASH: float = 10000.0  # iceberg slice 하나의 크기(달러)
+    # 호가창 기반 주문 크기 / Kill_Confirm 가격 (false면 100,000달러 단위 분할, 현재가 * 0.99)
+    DEPTH_SIZING: bool = False
+    DEPTH_TTL: float = 1.0  # 호가창 캐시 유지 시간(초)
+    DEPTH_LIMIT: int = 50  # 조회할 호가 레벨 수
+    DEPTH_SLIPPAGE: float = 0.002  # 주문 하나가 최우선 호가 대비 먹을 수 있는 최대 가격 차이 (0.2%)
+    DEPTH_KILL_SLIPPAGE: float = 0.01  # Kill_Confirm 청산가의 최우선 호가 대비 최대 가격 차이 (1%)
+    # 헷지 / 차익거래 장부 (store.db, add / close 때 바로 저장). POCKET_SYNC면 PocketBase에도 FLUSH_INTERVAL초마다 모아서 반영
+    LEDGER_FLUSH_INTERVAL: float = 1.0
+    LEDGER_POCKET_SYNC: bool = False
+    # KIS 주문 경로 HTTP/2 (h2 패키지가 설치된 경우에만 적용, 아니면 HTTP/1.1 keep-alive)
+    KIS_HTTP2: bool = False
+    # 해외주식 현재가 캐시 유지 시간(초). 주문가(현재가 ± mintick*50) 계산에 사용, KIS1~KIS4 공유
+    KIS_QUOTE_TTL: float = 0.5
+    # KIS 주문에 hashkey 헤더 포함 여부 (KIS API에서 선택 항목, false면 /uapi/hashkey 호출 없음)
+    KIS_HASHKEY: bool = False
+    # KIS 실시간 체결통보 WebSocket (KIS{n}_HTS_ID가 있는 계좌만). QUOTES는 해외주식 실시간 시세 구독 종목 (예: ["DNASAAPL"])
+    KIS_WS: bool = False
+    KIS_WS_QUOTES: list[str] = []
+    # 계좌 그룹 주문 : {"그룹": {"계좌": 수량 배율}}. 계좌는 거래소 이름, KIS1~KIS4, 또는 ACCOUNTS의 하위 계좌
+    ACCOUNT_GROUPS: dict[str, dict[str, float]] = {}
+    # 하위 계좌 : {"BINANCE_SUB1": {"exchange": "BINANCE", "key": "...", "secret": "...", "passphrase": "..."}}
+    ACCOUNTS: dict[str, dict[str, str]] = {}
+    # 거래소 HTTP 연결 : client당 연결 pool 크기, 거래소 host DNS 캐시 시간(초, 0이면 사용 안 함)
+    CONNECTION_POOL_SIZE: int = 10
+    DNS_CACHE_TTL: float = 300.0
+    # 봉 마감 KEEP_WARM_LEAD초 전에 사용 중인 거래소 연결을 미리 깨운다 (예: "1h", "15m". 없으면 사용 안 함)
+    KEEP_WARM_TIMEFRAME: str | None = None
+    KEEP_WARM_LEAD: float = 2.0
+    # 코인 주문 응답을 접수 확인(ACK)만 받는다. 결과에는 id / client id / status와 요청한 수량 / 가격만 있다 (exchange.ack)
+    ORDER_ACK: bool = False
 
     class Config:
         env_file = env_path  # ".env"
@@ -206,6 +264,7 @@ class OrderRequest(BaseModel):
     profit_price: float | None = None
     order_name: str = "주문"
     kis_number: int | None = 1
+    group: str | None = None  # 계좌 그룹 (ACCOUNT_GROUPS). 있으면 그룹의 모든 계좌에 주문
     hedge: str | None = None
     unified_symbol: str | None = None
     is_crypto: bool | None = None
@@ -362,6 +421,17 @@ class ArbiData(BaseModel):
                 values[key] = value.upper()
         return values
 
+class ReplicationPromote(BaseModel):
+    password: str
+    listen: bool = False
+
+    @validator("password")
+    def password_validate(cls, v):
+        setting = Settings()
+        if v != setting.PASSWORD:
+            raise ValueError("비밀번호가 틀렸습니다")
+        return v
+
 class HatikoOrder(MarketOrder):
     # order mode
     mode: Literal["Near", "NextCandle", "Close"] | None = None
@@ -409,59 +479,90 @@ class HatikoOrder(MarketOrder):
 
 class IndividualOrder:
     """
-    MarketOrder와 동일한 파라미터 이름을 가진 "인스턴스" 멤버변수를 가지고 있다.
+    HatikoOrder를 가격 레벨별로 나눈 가벼운 주문 객체.
+    모든 레벨이 하나의 불변 원본(base)을 공유하고, 레벨마다 달라지는 값만 자기 자신에 기록한다. (copy-on-write)
+    MarketOrder와 동일한 이름으로 속성을 읽고 쓸 수 있다.
     """
-    def __init__(self, order_info: MarketOrder):
-        # OrderRequest 정적 변수
-        self.exchange = order_info.exchange
-        self.base = order_info.base
-        self.quote = order_info.quote
-        self.type = order_info.type
-        self.side = order_info.side
-        self.amount = order_info.amount
-        self.price = order_info.price
-        self.cost = order_info.cost
-        self.percent = order_info.percent
-        self.amount_by_percent = order_info.amount_by_percent
-        self.leverage = order_info.leverage
-        self.stop_price = order_info.stop_price
-        self.profit_price = order_info.profit_price
-        self.order_name = order_info.order_name
-        self.kis_number = order_info.kis_number
-        self.hedge = order_info.hedge
-        self.unified_symbol = order_info.unified_symbol
-        self.is_crypto = order_info.is_crypto
-        self.is_stock = order_info.is_stock
-        self.is_spot = order_info.is_spot
-        self.is_futures = order_info.is_futures
-        self.is_coinm = order_info.is_coinm
-        self.is_entry = order_info.is_entry
-        self.is_close = order_info.is_close
-        self.is_buy = order_info.is_buy
-        self.is_sell = order_info.is_sell
-        self.is_contract = order_info.is_contract
-        self.contract_size = order_info.contract_size
-        self.margin_mode = order_info.margin_mode
-
-        # OrderBase 정적 변수
-        self.password = order_info.password
+    # 원본에서 가져오는 필드 (OrderRequest + OrderBase)
+    FIELDS = (
+        "exchange", "base", "quote", "type", "side", "amount", "price", "cost", "percent", "amount_by_percent",
+        "leverage", "stop_price", "profit_price", "order_name", "kis_number", "hedge", "unified_symbol",
+        "is_crypto", "is_stock", "is_spot", "is_futures", "is_coinm", "is_entry", "is_close", "is_buy", "is_sell",
+        "is_total", "is_contract", "contract_size", "margin_mode", "password",
+    )
+    # 레벨별 override (slot에 직접 저장)
+    OVERRIDES = ("price", "order_name", "amount", "side")
+
+    __slots__ = ("_base", "_changed") + OVERRIDES
+
+    def __init__(self, order_info: "MarketOrder | MappingProxyType", price: float | None = None,
+                 order_name: str | None = None, amount: float | None = None, side: str | None = None):
+        base = order_info if isinstance(order_info, MappingProxyType) else self.freeze(order_info)
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_changed", None)
+        if price is not None:
+            object.__setattr__(self, "price", price)
+        if order_name is not None:
+            object.__setattr__(self, "order_name", order_name)
+        if amount is not None:
+            object.__setattr__(self, "amount", amount)
+        if side is not None:
+            object.__setattr__(self, "side", side)
+
+    @classmethod
+    def freeze(cls, order_info) -> MappingProxyType:
+        """
+        여러 레벨이 공유할 불변 원본을 만든다. alert 하나당 한 번만 호출하면 된다.
+        """
+        return MappingProxyType({name: getattr(order_info, name, None) for name in cls.FIELDS})
+
+    def __getattr__(self, name):
+        # slot이 비어있거나 slot에 없는 이름일 때만 호출됨 -> 변경분, 원본 순서로 찾는다
+        if name.startswith("_"):
+            raise AttributeError(name)
+        changed = self._changed
+        if changed is not None and name in changed:
+            return changed[name]
+        try:
+            return self._base[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        if name in IndividualOrder.OVERRIDES:
+            object.__setattr__(self, name, value)
+            return
+        # 원본은 건드리지 않고 이 레벨의 변경분에만 기록
+        changed = self._changed
+        if changed is None:
+            changed = {}
+            object.__setattr__(self, "_changed", changed)
+        changed[name] = value
+
+    def dict(self, exclude_none: bool = False) -> dict:
+        result = {name: getattr(self, name) for name in self.FIELDS}
+        if exclude_none:
+            result = {key: value for key, value in result.items() if value is not None}
+        return result
 
 class HatikoInfo:
-    # [static] order_name 리스트
-    nearSignal_list = ["nearLong1", "nearLong2", "nearLong3", "nearLong4",
-                       "nearShort1", "nearShort2", "nearShort3", "nearShort4"]
-    entrySignal_list = ["Long1", "Long2", "Long3", "Long4",
-                        "Short1", "Short2", "Short3", "Short4"]
-    nextSignal_list = ["NextCandle_L1", "NextCandle_L2", "NextCandle_L3", "NextCandle_L4",
-                       "NextCandle_S1", "NextCandle_S2", "NextCandle_S3", "NextCandle_S4"]
-    nextCloseSignal_list = ["NextCandle_LF", "NextCandle_SF"]
-    closeSignal_list = ["close Longs on open", "close Shorts on open",
-                        "TakeProfit_nearL1", "TakeProfit_nearL2", "TakeProfit_nearL3", "TakeProfit_nearL4", 
-                        "TakeProfit_nearS1", "TakeProfit_nearS2", "TakeProfit_nearS3", "TakeProfit_nearS4", 
-                        "TakeProfit_L1", "TakeProfit_L2", "TakeProfit_L3", "TakeProfit_L4",
-                        "TakeProfit_S1", "TakeProfit_S2", "TakeProfit_S3", "TakeProfit_S4",
-                        "close_Longs", "close_Shorts"]
-    ignoreSignal_list = ["Long_Flag", "Short_Flag", "Long_Flag_Cancel", "Short_Flag_Cancel"]
+    # [static] order_name 리스트 (exchange.strategy.HATIKO_SIGNALS에서 kind별로 뽑은 것)
+    nearSignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "near"]
+    entrySignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "entry"]
+    nextSignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "next"]
+    nextCloseSignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "next_close"]
+    closeSignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "close"]
+    ignoreSignal_list = [name for name, signal in HATIKO_SIGNALS.items() if signal.kind == "ignore"]
+
+    # [static] 상태값 이름 (bind 시 store에 저장되는 값들)
+    SCALAR_FIELDS = ("nMaxLong", "nMaxShort", "nIgnoreLong", "nIgnoreShort", "liquidationMDD")
+    DICT_FIELDS = ("nearLong1_dic", "nearLong2_dic", "nearLong3_dic", "nearLong4_dic",
+                   "nearShort1_dic", "nearShort2_dic", "nearShort3_dic", "nearShort4_dic",
+                   "closePrice_dic", "levelState_dic")
+    LIST_FIELDS = ("Long1_list", "Long2_list", "Long3_list", "Long4_list",
+                   "Short1_list", "Short2_list", "Short3_list", "Short4_list",
+                   "nearLong1_ignore_list", "nearLong2_ignore_list", "nearLong3_ignore_list", "nearLong4_ignore_list",
+                   "nearShort1_ignore_list", "nearShort2_ignore_list", "nearShort3_ignore_list", "nearShort4_ignore_list")
     
     def __init__(self, nMaxLong=2, nMaxShort=1, nIgnoreLong=0, nIgnoreShort=0):
         # 종목 개수 관리
@@ -507,77 +608,139 @@ class HatikoInfo:
         # 지정가 Hatiko용 closePrice 딕셔너리
         # base(종목명) : closePrice(청산가격)
         self.closePrice_dic = {} # 미리청산 기능 사용 시 필요
+
+        # (base, side, level)별 주문 상태 (exchange.order_state)
+        # "BTC:Long1" : LevelState(state, order_ids, since), "BTC" : 종목 전체 상태(KILL_PENDING)
+        # near딕셔너리 / entry리스트는 상태 전이 시 같이 갱신되는 조회용 값이다.
+        self.levelState_dic = {}
     
     #region match 함수
 
+    def nearDicOf(self, signal: Signal) -> dict:
+        """
+        signal(side, level)에 해당하는 near딕셔너리를 반환
+        예시) Signal("NextCandle_L1", "next", "Long", 1) -> nearLong1_dic
+        """
+        return getattr(self, f"near{signal.side}{signal.level}_dic")
+
+    def entryListOf(self, signal: Signal) -> list:
+        return getattr(self, f"{signal.side}{signal.level}_list")
+
+    def nearIgnoreListOf(self, signal: Signal) -> list:
+        return getattr(self, f"near{signal.side}{signal.level}_ignore_list")
+
+    def nearDics(self, side: str | None = None) -> tuple:
+        """
+        side("Long"/"Short")의 near딕셔너리 4개를 반환. side가 None이면 8개 모두
+        """
+        return tuple(getattr(self, f"near{s}{level}_dic") for s in self._sides(side) for level in LEVELS)
+
+    def entryLists(self, side: str | None = None) -> tuple:
+        return tuple(getattr(self, f"{s}{level}_list") for s in self._sides(side) for level in LEVELS)
+
+    def nearIgnoreLists(self, side: str | None = None) -> tuple:
+        return tuple(getattr(self, f"near{s}{level}_ignore_list") for s in self._sides(side) for level in LEVELS)
+
+    @staticmethod
+    def _sides(side: str | None) -> tuple:
+        return ("Long", "Short") if side is None else (side,)
+
+    @staticmethod
+    def _levelSignal(order_name) -> Signal | None:
+        # near/entry/next 시그널만 레벨별 변수와 연결된다
+        signal = HATIKO_SIGNALS.get(order_name)
+        if signal is not None and signal.kind in ("near", "entry", "next"):
+            return signal
+
     def matchNearDic(self, order_name):
         """
         order_name에 따라 해당하는 near딕셔너리를 반환
         예시) input : "NextCandle_L1" -> output : "nearLong1_dic"
         """
-        if order_name in ["nearLong1", "Long1", "NextCandle_L1"]:
-            return self.nearLong1_dic
-        if order_name in ["nearLong2", "Long2", "NextCandle_L2"]:
-            return self.nearLong2_dic
-        if order_name in ["nearLong3", "Long3", "NextCandle_L3"]:
-            return self.nearLong3_dic
-        if order_name in ["nearLong4", "Long4", "NextCandle_L4"]:
-            return self.nearLong4_dic
-        if order_name in ["nearShort1", "Short1", "NextCandle_S1"]:
-            return self.nearShort1_dic
-        if order_name in ["nearShort2", "Short2", "NextCandle_S2"]:
-            return self.nearShort2_dic
-        if order_name in ["nearShort3", "Short3", "NextCandle_S3"]:
-            return self.nearShort3_dic
-        if order_name in ["nearShort4", "Short4", "NextCandle_S4"]:
-            return self.nearShort4_dic
-        
+        signal = self._levelSignal(order_name)
+        if signal is not None:
+            return self.nearDicOf(signal)
+
     def matchEntryList(self, order_name):
         """
         order_name에 따라 해당하는 entry리스트를 반환
         예시) input : "NextCandle_L1" -> output : "Long1"
         """
-        if order_name in ["nearLong1", "Long1", "NextCandle_L1"]:
-            return self.Long1_list
-        if order_name in ["nearLong2", "Long2", "NextCandle_L2"]:
-            return self.Long2_list
-        if order_name in ["nearLong3", "Long3", "NextCandle_L3"]:
-            return self.Long3_list
-        if order_name in ["nearLong4", "Long4", "NextCandle_L4"]:
-            return self.Long4_list
-        if order_name in ["nearShort1", "Short1", "NextCandle_S1"]:
-            return self.Short1_list
-        if order_name in ["nearShort2", "Short2", "NextCandle_S2"]:
-            return self.Short2_list
-        if order_name in ["nearShort3", "Short3", "NextCandle_S3"]:
-            return self.Short3_list
-        if order_name in ["nearShort4", "Short4", "NextCandle_S4"]:
-            return self.Short4_list
-        
+        signal = self._levelSignal(order_name)
+        if signal is not None:
+            return self.entryListOf(signal)
+
     def matchNearIgnoreList(self, order_name):
         """
         order_name에 따라 해당하는 near_ignore리스트를 반환
         예시) input : "NextCandle_L1" -> output : "nearLong1_ignore_list"
         """
-        if order_name in ["nearLong1", "Long1", "NextCandle_L1"]:
-            return self.nearLong1_ignore_list
-        if order_name in ["nearLong2", "Long2", "NextCandle_L2"]:
-            return self.nearLong2_ignore_list
-        if order_name in ["nearLong3", "Long3", "NextCandle_L3"]:
-            return self.nearLong3_ignore_list
-        if order_name in ["nearLong4", "Long4", "NextCandle_L4"]:
-            return self.nearLong4_ignore_list
-        if order_name in ["nearShort1", "Short1", "NextCandle_S1"]:
-            return self.nearShort1_ignore_list
-        if order_name in ["nearShort2", "Short2", "NextCandle_S2"]:
-            return self.nearShort2_ignore_list
-        if order_name in ["nearShort3", "Short3", "NextCandle_S3"]:
-            return self.nearShort3_ignore_list
-        if order_name in ["nearShort4", "Short4", "NextCandle_S4"]:
-            return self.nearShort4_ignore_list
+        signal = self._levelSignal(order_name)
+        if signal is not None:
+            return self.nearIgnoreListOf(signal)
     
     #endregion match 함수
 
+    #region 주문 상태 머신
+
+    def stateOf(self, base: str, signal: Signal | None = None) -> LevelState:
+        """
+        base의 레벨(signal.side, signal.level) 상태. signal이 None이면 종목 전체 상태
+        상태 머신 도입 전에 저장된 객체는 near딕셔너리 / entry리스트로부터 상태를 만든다.
+        """
+        current = self.levelState_dic.get(state_key(base, signal))
+        if current is not None:
+            return current
+        if signal is None or signal.level is None:
+            return IDLE
+        if base in self.entryListOf(signal):
+            return LevelState(OrderState.ENTRY_FILLED, tuple(self.nearDicOf(signal).get(base, ())))
+        if base in self.nearDicOf(signal):
+            return LevelState(OrderState.NEAR_PENDING, tuple(self.nearDicOf(signal)[base]))
+        return IDLE
+
+    def transition(self, base: str, signal: Signal | None, to: OrderState, order_ids=None, expect=None) -> LevelState | None:
+        """
+        상태를 to로 원자적으로 바꾸고 새 상태를 반환. 허용되지 않는 전이(또는 현재 상태가 expect에 없음)이면 None
+        레벨 상태가 바뀌면 near딕셔너리 / entry리스트도 같이 갱신한다.
+        """
+        from exchange.state import compute
+
+        result = []
+        def _next(current):
+            current = current if current is not None else self.stateOf(base, signal)
+            new = next_state(current, to, order_ids, expect)
+            result.append(new)
+            if new is None:
+                return current if current != IDLE else None
+            return new if new.state != OrderState.IDLE else None
+        compute(self.levelState_dic, state_key(base, signal), _next)
+        new = result[-1]
+        if new is not None and signal is not None and signal.level is not None:
+            near_dic, entry_list = self.nearDicOf(signal), self.entryListOf(signal)
+            if new.state == OrderState.NEAR_PENDING:
+                near_dic[base] = list(new.order_ids)
+            elif new.state == OrderState.ENTRY_FILLED:
+                if base not in entry_list:
+                    entry_list.append(base)
+            elif new.state == OrderState.IDLE:
+                near_dic.pop(base, None)
+                if base in entry_list:
+                    entry_list.remove(base)
+        return new
+
+    def levelSignals(self, side: str | None = None) -> tuple:
+        # 레벨별 상태에 사용하는 signal (side, level)
+        return tuple(HATIKO_SIGNALS[f"near{s}{level}"] for s in self._sides(side) for level in LEVELS)
+
+    def levelsIn(self, base: str, states, side: str | None = None) -> list:
+        """
+        base의 레벨 중 상태가 states에 있는 레벨의 signal 리스트
+        """
+        return [signal for signal in self.levelSignals(side) if self.stateOf(base, signal).state in states]
+
+    #endregion 주문 상태 머신
+
     #region request 호출용 함수
 
     def getHatikoInfo(self):
@@ -611,6 +774,7 @@ class HatikoInfo:
                 "nearShort2_ignore_list" : str(self.nearShort2_ignore_list),
                 "nearShort3_ignore_list" : str(self.nearShort3_ignore_list),
                 "nearShort4_ignore_list" : str(self.nearShort4_ignore_list),
+                "levelState_dic" : str({key: value.state.value for key, value in self.levelState_dic.items()}),
                 }
 
             return res
@@ -654,4 +818,127 @@ class HatikoInfo:
         availableCashRate = 1 - safetyMarginPercent / 100
         entryRate = availableCashRate / (nEnvelope * nMax - nNear * availableCashRate)
         return entryRate
+
+    #region 공유 상태 (multi-worker)
+
+    def bind(self, store, key: str):
+        """
+        STATE_BACKEND=sqlite 인 경우 모든 워커가 같은 상태를 보도록 store에 연결한다. (local이면 그대로)
+        replication을 사용하는 경우에도 변경을 standby로 보내기 위해 store에 연결한다.
+        store에 값이 아직 없을 때만 현재 값이 초기값으로 저장된다.
+        """
+        if not store.tracked:
+            return self
+        prefix = f"hatiko/{key}"
+        values = store.dict(f"{prefix}/vars", {name: getattr(self, name) for name in self.SCALAR_FIELDS})
+        for name in self.DICT_FIELDS:
+            object.__setattr__(self, name, store.dict(f"{prefix}/{name}", getattr(self, name)))
+        for name in self.LIST_FIELDS:
+            object.__setattr__(self, name, store.list(f"{prefix}/{name}", getattr(self, name)))
+        for name in self.SCALAR_FIELDS:
+            self.__dict__.pop(name, None)
+        object.__setattr__(self, "_vars", values)
+        return self
+
+    def __getattr__(self, name):
+        # bind 이후 nMaxLong 등은 store에서 읽는다
+        values = self.__dict__.get("_vars")
+        if values is not None and name in self.SCALAR_FIELDS:
+            return values[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        values = self.__dict__.get("_vars")
+        if values is not None:
+            if name in self.SCALAR_FIELDS:
+                values[name] = value
+                return
+            if name in self.DICT_FIELDS or name in self.LIST_FIELDS:
+                getattr(self, name).replace(value)
+                return
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        # pickle 파일에는 store 연결 없이 값만 저장
+        state = {name: getattr(self, name) for name in self.SCALAR_FIELDS}
+        state |= {name: getattr(self, name).copy() for name in self.DICT_FIELDS}
+        state |= {name: getattr(self, name).copy() for name in self.LIST_FIELDS}
+        return state
+
+    def __setstate__(self, state):
+        # 이전 버전에서 저장된 파일에 없는 값(levelState_dic 등)은 빈 값으로 시작
+        self.__dict__.update({name: {} for name in self.DICT_FIELDS})
+        self.__dict__.update({name: [] for name in self.LIST_FIELDS})
+        self.__dict__.update(state)
+
+    #endregion 공유 상태 (multi-worker)
     
+
+
+class KctrendInfo:
+    """
+    [켈트너 + Hatiko in Upbit] 전략 상태
+    종목(base) 집합으로 관리해서 진입 여부 확인과 개수 계산이 종목 수와 상관없이 O(1)이다.
+    HatikoInfo와 같은 방식으로 pickle 파일에 저장되고, sqlite / replication 사용 시 store에 연결된다.
+    """
+    # [static] 상태값 이름 (bind 시 store에 저장되는 값들)
+    SET_FIELDS = ("kctrend_long_set",
+                  "hatiko_long1_set", "hatiko_long2_set", "hatiko_long3_set", "hatiko_long4_set")
+
+    def __init__(self):
+        # 켈트너 추세 전략 Long 진입 중인 종목들
+        self.kctrend_long_set = set()
+
+        # Hatiko 전략 Long1~4 진입 중인 종목들
+        self.hatiko_long1_set = set()
+        self.hatiko_long2_set = set()
+        self.hatiko_long3_set = set()
+        self.hatiko_long4_set = set()
+
+    def hatikoSetOf(self, level: int) -> set:
+        return getattr(self, f"hatiko_long{level}_set")
+
+    def hatikoSets(self) -> tuple:
+        return tuple(self.hatikoSetOf(level) for level in LEVELS)
+
+    def inHatiko(self, base: str) -> bool:
+        return any(base in hatiko_set for hatiko_set in self.hatikoSets())
+
+    def hatikoCount(self) -> int:
+        # Hatiko 전략 전체 진입 개수 (모든 레벨)
+        return sum(len(hatiko_set) for hatiko_set in self.hatikoSets())
+
+    def hatikoCountOf(self, base: str) -> int:
+        # base가 진입 중인 Hatiko 레벨 수
+        return sum(base in hatiko_set for hatiko_set in self.hatikoSets())
+
+    def removeHatiko(self, base: str):
+        for hatiko_set in self.hatikoSets():
+            hatiko_set.discard(base)
+
+    def getKctrendInfo(self):
+        res = {name: str(sorted(getattr(self, name))) for name in self.SET_FIELDS}
+        return res
+
+    def resetKctrendInfo(self):
+        for name in self.SET_FIELDS:
+            getattr(self, name).clear()
+        return "Intialize kctrend & hatiko Variables Completed!!!"
+
+    def bind(self, store, key: str):
+        """
+        HatikoInfo.bind와 동일. store에 값이 아직 없을 때만 현재 값이 초기값으로 저장된다.
+        """
+        if not store.tracked:
+            return self
+        for name in self.SET_FIELDS:
+            setattr(self, name, store.setof(f"kctrend/{key}/{name}", getattr(self, name)))
+        return self
+
+    def __getstate__(self):
+        # pickle 파일에는 store 연결 없이 값만 저장
+        return {name: set(getattr(self, name)) for name in self.SET_FIELDS}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
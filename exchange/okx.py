@@ -1,22 +1,24 @@
 import ccxt
-import ccxt.async_support as ccxt_async
+from exchange.clients import MarketClients
 from devtools import debug
 
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import exchange.error as error
 from decimal import Decimal
 
 
-class Okx:
+class Okx(MarketClients):
     def __init__(self, key, secret, passphrase):
-        self.client = ccxt.okx(
+        self.setup_clients(
+            ccxt.okx,
             {
                 "apiKey": key,
                 "secret": secret,
                 "password": passphrase,
-            }
+            },
+            ("spot", "swap"),
         )
-        self.client.load_markets()
         self.order_info: MarketOrder = None
         self.position_mode = "one-way"
 
@@ -32,9 +34,9 @@ class Okx:
             order_info.contract_size = market.get("contractSize")
 
         if order_info.is_futures:
-            self.client.options["defaultType"] = "swap"
+            self.select_client("swap")
         else:
-            self.client.options["defaultType"] = "spot"
+            self.select_client("spot")
 
     def get_amount_precision(self, symbol):
         market = self.client.market(symbol)
@@ -60,6 +62,9 @@ class Okx:
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_balance(self, base: str):
@@ -176,7 +181,7 @@ class Okx:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -295,7 +300,7 @@ class Okx:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -349,7 +354,7 @@ class Okx:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -489,7 +494,7 @@ class Okx:
 
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 symbol,
                 "limit",
                 order_info.side,
@@ -506,4 +511,14 @@ class Okx:
 
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol, params={"acknowledged": True})
+
+    # NextCandle 재주문 : 정정(amend) 엔드포인트 사용, 안 되면 취소 후 재주문
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price, amend=self.amend_order)
+
+    def amend_order(self, order: dict, price: float):
+        # POST /api/v5/trade/amend-order (가격만 변경, 주문 id 유지)
+        return self.client.edit_order(order["id"], order["symbol"], "limit", order["side"], None, price)
\ No newline at end of file
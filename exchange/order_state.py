@@ -0,0 +1,70 @@
+"""
+Hatiko 주문 상태 머신
+
+(거래소, 시장)은 HatikoInfo 객체 하나에 대응하고, 그 안에서 (base, side, level)마다 상태를 하나씩 가진다.
+Kill_Confirm 대기는 레벨이 아니라 종목 전체의 상태이므로 level 없이 (base)로 관리한다.
+
+    IDLE ──near──> NEAR_PENDING ──entry / 체결 확인──> ENTRY_FILLED
+                     │  ▲ (NextCandle 재주문)             │
+                     └──┘                                  │
+    NEAR_PENDING / ENTRY_FILLED ──close──> CLOSING ──완료──> IDLE
+    CLOSING ──청산 실패──> 원래 상태로 복구
+    IDLE(base) ──close 완료──> KILL_PENDING ──Kill_Confirm──> IDLE
+
+전이는 TRANSITIONS에 있는 것만 허용되고, 현재 상태 확인과 변경은 한 번에(원자적으로) 일어난다.
+허용되지 않는 전이는 거래소 호출 없이 바로 거절된다.
+"""
+import time
+from enum import Enum
+from types import MappingProxyType
+from typing import NamedTuple
+
+
+class OrderState(str, Enum):
+    IDLE = "IDLE"
+    NEAR_PENDING = "NEAR_PENDING"   # near 지정가 주문이 걸려 있음 (order_ids)
+    ENTRY_FILLED = "ENTRY_FILLED"   # 진입 완료
+    CLOSING = "CLOSING"             # 청산 처리 중
+    KILL_PENDING = "KILL_PENDING"   # 시간차 시장가 청산 대기 (종목 단위)
+
+
+TRANSITIONS = MappingProxyType({
+    OrderState.IDLE: frozenset({OrderState.NEAR_PENDING, OrderState.KILL_PENDING}),
+    OrderState.NEAR_PENDING: frozenset({OrderState.NEAR_PENDING, OrderState.ENTRY_FILLED, OrderState.CLOSING, OrderState.IDLE}),
+    OrderState.ENTRY_FILLED: frozenset({OrderState.CLOSING}),
+    OrderState.CLOSING: frozenset({OrderState.IDLE, OrderState.NEAR_PENDING, OrderState.ENTRY_FILLED}),
+    OrderState.KILL_PENDING: frozenset({OrderState.IDLE}),
+})
+
+
+class LevelState(NamedTuple):
+    state: OrderState = OrderState.IDLE
+    order_ids: tuple = ()
+    since: float = 0.0
+
+
+IDLE = LevelState()
+
+
+def state_key(base: str, signal=None) -> str:
+    """
+    signal(side, level)이 없으면 종목 전체 상태 key
+    예시) ("BTC", Signal(..., "Long", 1)) -> "BTC:Long1",  ("BTC", None) -> "BTC"
+    """
+    if signal is None or signal.level is None:
+        return base
+    return f"{base}:{signal.side}{signal.level}"
+
+
+def next_state(current: LevelState, to: OrderState, order_ids=None, expect=None) -> LevelState | None:
+    """
+    current -> to 전이 결과. 허용되지 않거나 현재 상태가 expect에 없으면 None
+    order_ids를 주지 않으면 기존 order_ids를 유지한다. (IDLE로 가면 비움)
+    """
+    if expect is not None and current.state not in expect:
+        return None
+    if to not in TRANSITIONS[current.state]:
+        return None
+    if order_ids is None:
+        order_ids = () if to == OrderState.IDLE else current.order_ids
+    return LevelState(to, tuple(order_ids), time.time())
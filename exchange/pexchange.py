@@ -1,79 +1,61 @@
-import ccxt
-import ccxt.async_support as ccxt_async
-import httpx
 from fastapi import HTTPException
-from pydantic import BaseModel
-from .binance import Binance
-from .upbit import Upbit
-from .bybit import Bybit
-from .bitget import Bitget
-from .okx import Okx
-from .mexc import Mexc
-from .gate import Gate
-from .stock import KoreaInvestment
 from exchange.utility import settings, log_message
 from .database import db
 from typing import Literal
-import pendulum
+from importlib import import_module
 import time
-from devtools import debug
 from loguru import logger
 
 
 from .model import CRYPTO_EXCHANGES, STOCK_EXCHANGES, MarketOrder
 
 
-class Exchange(BaseModel):
-    UPBIT: Upbit | None = None
-    BINANCE: Binance | None = None
-    BYBIT: Bybit | None = None
-    BITGET: Bitget | None = None
-    OKX: Okx | None = None
-    MEXC: Mexc | None = None
-    GATE: Gate | None = None
-    KIS1: KoreaInvestment | None = None
-    KIS2: KoreaInvestment | None = None
-    KIS3: KoreaInvestment | None = None
-    KIS4: KoreaInvestment | None = None
+# 거래소 이름 -> (모듈, 클래스). 실제 import는 처음 사용할 때 한다.
+ADAPTERS = {
+    "UPBIT": ("exchange.upbit", "Upbit"),
+    "BINANCE": ("exchange.binance", "Binance"),
+    "BYBIT": ("exchange.bybit", "Bybit"),
+    "BITGET": ("exchange.bitget", "Bitget"),
+    "OKX": ("exchange.okx", "Okx"),
+    "MEXC": ("exchange.mexc", "Mexc"),
+    "GATE": ("exchange.gate", "Gate"),
+    "KIS": ("exchange.stock.kis", "KoreaInvestment"),
+}
 
-    class Config:
-        arbitrary_types_allowed = True
+KIS_ACCOUNTS = ("KIS1", "KIS2", "KIS3", "KIS4")
 
 
+def load_adapter(exchange_name: str):
+    """
+    거래소 클래스를 import 해서 반환 (import는 모듈 캐시에 의해 한 번만 일어난다)
+    """
+    module_name, class_name = ADAPTERS["KIS" if exchange_name in KIS_ACCOUNTS else exchange_name]
+    return getattr(import_module(module_name), class_name)
+
+
+# 생성된 거래소 객체. key : "BINANCE", "KIS1" ...
 payload = {}
 
 
 def get_exchange(exchange_name: str, kis_number=None):
-    global payload
     if exchange_name in CRYPTO_EXCHANGES:
-        KEY, SECRET, PASSPHRASE = check_key(exchange_name)
-        if not payload.get(exchange_name):
+        bot = payload.get(exchange_name)
+        if bot is None:
+            KEY, SECRET, PASSPHRASE = check_key(exchange_name)
             if exchange_name in ("BITGET", "OKX"):
-                payload |= {
-                    exchange_name: globals()[exchange_name.title()](
-                        KEY, SECRET, PASSPHRASE
-                    )
-                }
+                bot = load_adapter(exchange_name)(KEY, SECRET, PASSPHRASE)
             else:
-                if not payload.get(exchange_name):
-                    payload |= {
-                        exchange_name: globals()[exchange_name.title()](KEY, SECRET)
-                    }
-
-        return Exchange(**payload)
+                bot = load_adapter(exchange_name)(KEY, SECRET)
+            payload[exchange_name] = bot
+        return bot
 
-    elif exchange_name in ("KRX", "NASDAQ", "NYSE", "AMEX"):
+    elif exchange_name in STOCK_EXCHANGES:
         _kis = f"KIS{kis_number}"
-        key = check_key(_kis)
-        KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE = key
-        if not payload.get(_kis):
-            payload |= {
-                _kis: globals()["KoreaInvestment"](
-                    KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE, kis_number
-                )
-            }
-        exchange = Exchange(**payload)
-        kis: KoreaInvestment = exchange.dict()[_kis]
+        kis = payload.get(_kis)
+        if kis is None:
+            KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE = check_key(_kis)
+            kis = load_adapter(_kis)(KEY, SECRET, ACCOUNT_NUMBER, ACCOUNT_CODE, kis_number)
+            payload[_kis] = kis
         kis.auth()
         return kis
 
@@ -83,14 +65,57 @@ def get_bot(
         "BINANCE", "UPBIT", "BYBIT", "BITGET", "KRX", "NASDAQ", "NYSE", "AMEX", "OKX", "MEXC", "GATE"
     ],
     kis_number=None,
-) -> Binance | Upbit | Bybit | Bitget | KoreaInvestment | Okx | Mexc | Gate:
+):
     exchange_name = exchange_name.upper()
-    if exchange_name in CRYPTO_EXCHANGES:
-        return get_exchange(exchange_name, kis_number).dict()[exchange_name]
-    elif exchange_name in STOCK_EXCHANGES:
+    if exchange_name in CRYPTO_EXCHANGES or exchange_name in STOCK_EXCHANGES:
         return get_exchange(exchange_name, kis_number)
 
 
+def has_key(exchange_name) -> bool:
+    """
+    Settings에 해당 거래소(또는 KIS 계좌)의 키가 모두 있는지 확인 (로그/예외 없음)
+    """
+    settings_dict = settings.dict()
+    if exchange_name in CRYPTO_EXCHANGES:
+        return bool(settings_dict.get(f"{exchange_name}_KEY") and settings_dict.get(f"{exchange_name}_SECRET"))
+    elif exchange_name in KIS_ACCOUNTS:
+        return all(
+            settings_dict.get(f"{exchange_name}_{field}")
+            for field in ("KEY", "SECRET", "ACCOUNT_NUMBER", "ACCOUNT_CODE")
+        )
+    return False
+
+
+def configured_exchanges() -> list[str]:
+    """
+    키가 설정된 거래소 및 KIS 계좌 목록
+    """
+    return [name for name in CRYPTO_EXCHANGES + KIS_ACCOUNTS if has_key(name)]
+
+
+def preload_exchanges(shard: str | None = None):
+    """
+    [STARTUP_MODE=eager, 기본값] 키가 설정된 거래소 객체를 미리 생성 (load_markets, KIS 인증 포함)
+    shard : shard 프로세스인 경우 해당 shard의 거래소만 생성
+    """
+    from exchange.shard import shard_of
+
+    loaded = []
+    for name in configured_exchanges():
+        if shard is not None and shard_of(name) != shard:
+            continue
+        try:
+            if name in KIS_ACCOUNTS:
+                get_exchange("KRX", int(name[-1]))
+            else:
+                get_exchange(name)
+        except Exception:
+            log_message(f"Preload Failed - {name}")
+        else:
+            loaded.append(name)
+    return loaded
+
+
 def check_key(exchange_name):
     settings_dict = settings.dict()
     if exchange_name in CRYPTO_EXCHANGES:
@@ -106,7 +131,7 @@ def check_key(exchange_name):
             log_message(msg)
             raise HTTPException(status_code=404, detail=msg)
         return key, secret, passphrase
-    elif exchange_name in ("KIS1", "KIS2", "KIS3", "KIS4"):
+    elif exchange_name in KIS_ACCOUNTS:
         key = settings_dict.get(f"{exchange_name}_KEY")
         secret = settings_dict.get(f"{exchange_name}_SECRET")
         account_number = settings_dict.get(f"{exchange_name}_ACCOUNT_NUMBER")
@@ -118,6 +143,8 @@ def check_key(exchange_name):
 
 
 def get_today_timestamp(timezone="Asia/Seoul"):
+    import pendulum
+
     today = pendulum.today(timezone)
     today_start = int(today.start_of("day").timestamp() * 1000)
     today_end = int(today.end_of("day").timestamp() * 1000)
@@ -130,7 +157,7 @@ def retry(
     order_info: MarketOrder,
     max_attempts=3,
     delay=1,
-    instance: Binance | Bybit | Bitget | Upbit | Okx | Mexc | Gate = None,
+    instance=None,
 ):
     attempts = 0
 
@@ -211,8 +238,7 @@ def retry(
                             params if i == 5 else arg for i, arg in enumerate(args)
                         )
                     elif "check your server timestamp" in str(e):
-                        bybit: Bybit = instance
-                        bybit.load_time_difference()
+                        instance.load_time_difference()
                     else:
                         attempts = max_attempts
 
@@ -338,3 +364,61 @@ def retry(
                 raise
             else:
                 logger.error(f"재시도 {max_attempts - attempts}번 남았음")
+
+
+def reprice_order(bot, order_id: str, symbol: str, new_price: float, amend=None, create=None) -> dict:
+    """
+    미체결 지정가 주문을 new_price로 옮긴다. (NextCandle 재주문)
+    amend(order, price) : 거래소 정정(amend) 엔드포인트. 없거나 실패하면 취소 후 재주문
+    create(amount, price) : 재주문 함수 (기본 bot.limit_order(bot.order_info, amount, price))
+
+    반환 : {"id", "remaining", "side", "status", "amended"}
+      status "open"     : new_price로 걸려 있는 주문 (id는 정정 후 id. 거래소에 따라 바뀔 수 있음)
+      status "closed"   : 이미 모두 체결돼서 재주문 안 함 (id None)
+      status "canceled" : 이미 취소돼 있어서 재주문 안 함 (id None)
+    """
+    order = bot.fetch_order(order_id, symbol)
+    result = {
+        "id": None,
+        "remaining": float(order.get("remaining") or 0),
+        "side": order["side"],
+        "status": order["status"],
+        "amended": False,
+    }
+    if order["status"] != "open":
+        return result
+
+    price = float(bot.client.price_to_precision(symbol, new_price))
+    if order.get("price") is not None and float(order["price"]) == price:
+        # 같은 가격이면 정정할 필요 없음 (binance는 같은 가격 정정을 에러로 거절)
+        return result | {"id": order_id}
+
+    if amend is not None:
+        try:
+            amended = amend(order, price)
+        except Exception as e:
+            logger.error(f"[{bot.client.id}] {order_id} 주문 정정 실패, 취소 후 재주문 : {e}")
+        else:
+            remaining = amended.get("remaining")
+            return result | {
+                "id": amended.get("id") or order_id,
+                "remaining": float(remaining) if remaining is not None else result["remaining"],
+                "amended": True,
+            }
+
+    # 취소 후 재주문. 취소 응답에 남은 수량이 없으면 다시 조회
+    canceled = bot.client.cancel_order(order_id, symbol)
+    if canceled.get("status") != "canceled" or canceled.get("remaining") is None:
+        canceled = bot.fetch_order(order_id, symbol)
+        if canceled["status"] == "open":
+            # bybit 등은 취소 직후 조회하면 아직 open으로 나온다. 취소 요청은 성공했으므로 취소된 것으로 본다
+            canceled = order | {"status": "canceled"}
+    remaining = float(canceled.get("remaining") or 0)
+    if canceled["status"] == "closed" or remaining <= 0:
+        return result | {"status": "closed", "remaining": 0.0}
+
+    if create is None:
+        created = bot.limit_order(bot.order_info, remaining, price)
+    else:
+        created = create(remaining, price)
+    return result | {"id": created["id"], "remaining": remaining}
@@ -1,60 +1,179 @@
-from pocketbase import PocketBase
-import jwt
-from exchange.utility import log_message, log_error_message, settings
+"""
+PocketBase 클라이언트 (httpx.AsyncClient 연결 풀 재사용)
+
+- 처음 요청할 때 연결/인증한다. (import 시점에 네트워크 연결 X)
+- 토큰 만료 시각은 인증할 때 한 번만 읽어서 숫자로 들고 있고, 만료 REFRESH_MARGIN초 전에
+  백그라운드에서 auth-refresh 한다. 요청마다 JWT를 디코딩하지 않는다.
+- 401이 오면 한 번 재인증 후 다시 보낸다.
+- delete_many는 여러 레코드 삭제를 같은 연결 풀에서 동시에 보낸다. (PocketBase 0.8에는 batch API가 없음)
+
+로컬 테스트용 대체 서버 : python tools/pocket_standin.py serve --port 8090
+"""
 import time
+import base64
+import asyncio
 import traceback
+from types import SimpleNamespace
+import httpx
+import orjson
+from exchange.utility import log_error_message, settings
+
+REFRESH_MARGIN = 300        # 만료 5분 전에 갱신
+DELETE_CONCURRENCY = 8
+PER_PAGE = 200
 
-pb = PocketBase("http://127.0.0.1:8090")
 
+def token_expiry(token: str) -> float:
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return float(orjson.loads(base64.urlsafe_b64decode(payload))["exp"])
 
-def auth():
-    try:
-        DB_ID = settings.DB_ID
-        DB_PASSWORD = settings.DB_PASSWORD
-        pb.admins.auth_with_password(DB_ID, DB_PASSWORD)
-    except Exception as e:
-        raise Exception("DB auth error")
 
+class PocketBaseClient:
+    def __init__(self, url: str, identity: str, password: str):
+        self.url = url.rstrip("/")
+        self.identity = identity
+        self.password = password
+        self.token: str | None = None
+        self.expires = 0.0
+        self.http: httpx.AsyncClient | None = None
+        self.auth_lock = asyncio.Lock()
+        self.refresh_task = None
 
-def reauth():
-    try:
-        token = pb.auth_store.base_token
-        decoded_token = jwt.decode(token, options={"verify_signature": False})
-        expire_time = decoded_token["exp"]
-        current_time = int(time.time())
-        if current_time > expire_time:
-            auth()
-    except:
-        raise Exception("DB reauth error")
+    def connect(self) -> httpx.AsyncClient:
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=DELETE_CONCURRENCY * 2, max_keepalive_connections=DELETE_CONCURRENCY),
+            )
+        return self.http
 
+    #region 인증
+    def set_token(self, token: str):
+        self.token = token
+        self.expires = token_expiry(token)
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self.refresh_loop())
 
-def create(collection, data):
-    try:
-        reauth()
-        pb.collection(collection).create(data)
-    except:
-        raise Exception("DB create error")
+    async def auth(self):
+        response = await self.connect().post(
+            "/api/admins/auth-with-password", json={"identity": self.identity, "password": self.password}
+        )
+        if response.status_code != 200:
+            raise Exception(f"DB auth error : {response.status_code}")
+        self.set_token(response.json()["token"])
 
+    async def ensure_token(self) -> str:
+        if self.token is None or time.time() >= self.expires - REFRESH_MARGIN:
+            async with self.auth_lock:
+                # 먼저 들어간 요청이 인증했으면 그대로 사용
+                if self.token is None or time.time() >= self.expires - REFRESH_MARGIN:
+                    await self.auth()
+        return self.token
 
-def delete(collection, id):
-    try:
-        reauth()
-        pb.collection(collection).delete(id)
-    except:
-        raise Exception("DB delete error")
+    async def refresh(self):
+        async with self.auth_lock:
+            response = await self.connect().post("/api/admins/auth-refresh", headers={"Authorization": self.token})
+            if response.status_code == 200:
+                self.set_token(response.json()["token"])
+            else:
+                await self.auth()
 
+    async def refresh_loop(self):
+        while self.token is not None:
+            await asyncio.sleep(max(1.0, self.expires - REFRESH_MARGIN - time.time()))
+            try:
+                await self.refresh()
+            except Exception:
+                log_error_message(traceback.format_exc(), "DB reauth error")
+                self.token = None
+                return
+    #endregion 인증
 
-def get_full_list(collection, batch_size=200, query_params=None):
-    try:
-        reauth()
-        return pb.collection(collection).get_full_list(
-            batch=batch_size, query_params=query_params
-        )
-    except:
-        raise Exception("DB get_full_list error")
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        token = await self.ensure_token()
+        response = await self.connect().request(method, path, headers={"Authorization": token}, **kwargs)
+        if response.status_code == 401:
+            async with self.auth_lock:
+                await self.auth()
+            response = await self.connect().request(method, path, headers={"Authorization": self.token}, **kwargs)
+        return response
+
+    async def create(self, collection: str, data: dict) -> dict:
+        response = await self.request("POST", f"/api/collections/{collection}/records", json=data)
+        if response.status_code != 200:
+            raise Exception(f"DB create error : {response.status_code}")
+        return response.json()
+
+    async def delete(self, collection: str, id: str):
+        response = await self.request("DELETE", f"/api/collections/{collection}/records/{id}")
+        if response.status_code not in (200, 204, 404):
+            raise Exception(f"DB delete error : {response.status_code}")
+
+    async def delete_many(self, collection: str, ids: list[str]):
+        semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+        async def delete(id):
+            async with semaphore:
+                await self.delete(collection, id)
+
+        await asyncio.gather(*[delete(id) for id in ids])
+
+    async def get_full_list(self, collection: str, batch_size: int = PER_PAGE, query_params: dict | None = None) -> list:
+        items = []
+        page = 1
+        while True:
+            params = {"page": page, "perPage": batch_size} | (query_params or {})
+            response = await self.request("GET", f"/api/collections/{collection}/records", params=params)
+            if response.status_code != 200:
+                raise Exception(f"DB get_full_list error : {response.status_code}")
+            body = response.json()
+            items += [SimpleNamespace(**item) for item in body["items"]]
+            if page >= body.get("totalPages", 1) or not body["items"]:
+                return items
+            page += 1
+
+    async def aclose(self):
+        self.token = None
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+
+pb: PocketBaseClient | None = None
+
+
+def get_client() -> PocketBaseClient:
+    """
+    PocketBase 클라이언트는 처음 사용할 때 생성한다. (연결/인증은 첫 요청 때)
+    """
+    global pb
+    if pb is None:
+        pb = PocketBaseClient(settings.POCKETBASE_URL, settings.DB_ID, settings.DB_PASSWORD)
+    return pb
+
+
+async def create(collection, data):
+    return await get_client().create(collection, data)
+
+
+async def delete(collection, id):
+    await get_client().delete(collection, id)
+
+
+async def delete_many(collection, ids):
+    await get_client().delete_many(collection, ids)
+
+
+async def get_full_list(collection, batch_size=PER_PAGE, query_params=None):
+    return await get_client().get_full_list(collection, batch_size, query_params)
 
 
-try:
-    auth()
-except:
-    log_error_message(traceback.format_exc(), "DB auth error")
+async def close():
+    global pb
+    if pb is not None:
+        await pb.aclose()
+        pb = None
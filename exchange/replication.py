@@ -0,0 +1,397 @@
+"""
+전략 상태 hot-standby 복제 (REPLICATION_ROLE)
+
+primary : store 변경(HatikoInfo의 near/entry/ignore 리스트, kctrend 리스트, Flag)마다 seq 번호를 붙여
+          연결된 standby로 전송한다. 최근 변경은 메모리 로그에 보관하고, standby가 로그보다 뒤처져
+          있거나 primary가 재시작된 경우(epoch 변경)에는 전체 snapshot을 먼저 보낸다.
+standby : primary에 접속해서 변경을 자기 store에 반영한다. 웹훅 주문은 받지 않고(503),
+          거래소 client는 미리 로드해 둔다. /replication/promote (POST, password) 호출 시 primary로 승격한다.
+
+프레임 : [4byte 길이][payload]
+연결 : primary가 nonce를 보내고 standby가 자기 nonce를 보낸다. 이후 모든 프레임은 [HMAC-SHA256 32byte][JSON]이다.
+       HMAC key는 PASSWORD이고 (PASSWORD 자체는 보내지 않는다), 두 nonce와 방향, 프레임 번호를 같이 서명하므로
+       PASSWORD를 모르면 primary인 척 하거나 지난 프레임을 다시 보낼 수 없다. 서명이 틀리면 연결을 끊는다.
+값 : pickle 대신 orjson. JSON에 없는 타입(tuple / set / frozenset / dict / LevelState / OrderState)은
+     {"태그": 값} 형태로 명시적으로 바꾸고, 그 외 타입은 보내지 않는다. (encode / decode)
+복제는 이 프로세스의 store 변경만 보내므로 run.py는 REPLICATION_ROLE이 켜져 있으면 workers=1로 실행한다.
+"""
+import os
+import hmac
+import time
+import uuid
+import struct
+import asyncio
+import hashlib
+import threading
+from collections import deque
+import orjson
+from loguru import logger
+from exchange.utility import settings
+from exchange.state import Store
+from exchange.order_state import OrderState, LevelState
+
+# standby 상태에서 받지 않는 요청 (주문/전략 웹훅)
+STANDBY_BLOCKED = ("/", "/order", "/hatiko", "/kctrendandhatiko", "/kctrendandhatiko_limit", "/hedge", "/arbitrage")
+
+LENGTH = struct.Struct("!I")
+COUNTER = struct.Struct("!Q")
+MAC_SIZE = hashlib.sha256().digest_size
+NONCE_SIZE = 16
+LOG_SIZE = 10000
+RECONNECT_DELAY = 1.0
+RECONNECT_DELAY_MAX = 10.0
+
+
+def parse_address(address: str):
+    if address.startswith("unix:"):
+        return address[len("unix:"):], None
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(size)
+
+
+def frame(payload: bytes) -> bytes:
+    return LENGTH.pack(len(payload)) + payload
+
+
+#region 값 인코딩
+def encode(value):
+    """
+    store 값 -> JSON으로 보낼 수 있는 값. JSON object는 항상 {"태그": 값} 하나다.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, OrderState):
+        return {"O": value.value}
+    if isinstance(value, LevelState):
+        return {"L": [value.state.value, [encode(item) for item in value.order_ids], value.since]}
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    if isinstance(value, tuple):
+        return {"t": [encode(item) for item in value]}
+    if isinstance(value, frozenset):
+        return {"f": [encode(item) for item in value]}
+    if isinstance(value, set):
+        return {"s": [encode(item) for item in value]}
+    if isinstance(value, dict):
+        return {"d": [[encode(key), encode(item)] for key, item in value.items()]}
+    raise TypeError(f"복제할 수 없는 타입 : {type(value).__name__}")
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    (tag, data), = value.items()
+    if tag == "O":
+        return OrderState(data)
+    if tag == "L":
+        state, order_ids, since = data
+        return LevelState(OrderState(state), tuple(decode(item) for item in order_ids), since)
+    if tag == "t":
+        return tuple(decode(item) for item in data)
+    if tag == "f":
+        return frozenset(decode(item) for item in data)
+    if tag == "s":
+        return {decode(item) for item in data}
+    if tag == "d":
+        return {decode(key): decode(item) for key, item in data}
+    raise ValueError(f"알 수 없는 태그 : {tag}")
+#endregion 값 인코딩
+
+
+#region 서명
+class AuthError(Exception):
+    pass
+
+
+class Channel:
+    """
+    연결 하나의 프레임 서명 / 확인. session = primary nonce + standby nonce
+    방향("P" : primary -> standby, "S" : standby -> primary)마다 프레임 번호를 따로 센다.
+    """
+
+    def __init__(self, session: bytes, send: bytes, receive: bytes):
+        self.key = settings.PASSWORD.encode()
+        self.session = session
+        self.send_label, self.receive_label = send, receive
+        self.sent = 0
+        self.received = 0
+
+    def mac(self, label: bytes, counter: int, payload: bytes) -> bytes:
+        return hmac.new(self.key, self.session + label + COUNTER.pack(counter) + payload, hashlib.sha256).digest()
+
+    def seal(self, message) -> bytes:
+        payload = orjson.dumps(message)
+        self.sent += 1
+        return frame(self.mac(self.send_label, self.sent, payload) + payload)
+
+    async def read(self, reader: asyncio.StreamReader):
+        data = await read_frame(reader)
+        mac, payload = data[:MAC_SIZE], data[MAC_SIZE:]
+        self.received += 1
+        if not hmac.compare_digest(mac, self.mac(self.receive_label, self.received, payload)):
+            raise AuthError("프레임 서명 불일치")
+        return orjson.loads(payload)
+#endregion 서명
+
+
+##############################################################################
+# primary
+##############################################################################
+
+class ReplicationServer:
+    def __init__(self, store: Store, address: str):
+        self.store = store
+        self.address = address
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.log = deque(maxlen=LOG_SIZE)
+        self.lock = threading.Lock()
+        self.standbys = {}
+        self.server = None
+        self.loop = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.store.add_listener(self.on_change)
+        host, port = parse_address(self.address)
+        if port is None:
+            if os.path.exists(host):
+                os.remove(host)
+            self.server = await asyncio.start_unix_server(self.handle, path=host)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"[replication] primary 시작 : {self.address} (epoch={self.epoch})")
+
+    async def stop(self):
+        if self.store.listeners.count(self.on_change):
+            self.store.listeners.remove(self.on_change)
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.standbys):
+            writer.close()
+
+    def on_change(self, op: str, key: str, value):
+        # store 변경은 다른 스레드에서도 일어날 수 있으므로 seq는 lock 안에서 붙이고 전송은 event loop에서
+        with self.lock:
+            self.seq += 1
+            self.log.append((self.seq, op, key, value))
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.flush)
+
+    def snapshot(self):
+        with self.lock:
+            seq = self.seq
+        items = {key: encode(value) for key, value in self.store.items().items()}
+        return {"type": "snapshot", "epoch": self.epoch, "seq": seq, "items": items}
+
+    def flush(self):
+        for writer, sent in list(self.standbys.items()):
+            if writer.is_closing():
+                self.standbys.pop(writer, None)
+                continue
+            self.send_since(writer, sent["seq"])
+
+    def send_since(self, writer, last_seq: int):
+        with self.lock:
+            entries = [entry for entry in self.log if entry[0] > last_seq]
+            oldest = self.log[0][0] if self.log else self.seq + 1
+            seq = self.seq
+        channel = self.standbys[writer]["channel"]
+        if last_seq < oldest - 1:
+            # 로그에서 이미 빠진 변경이 있으면 snapshot부터 다시
+            message = self.snapshot()
+            writer.write(channel.seal(message))
+            self.standbys[writer]["seq"] = message["seq"]
+            return self.send_since(writer, message["seq"])
+        if entries:
+            entries = [[seq, op, key, encode(value)] for seq, op, key, value in entries]
+            writer.write(channel.seal({"type": "entries", "epoch": self.epoch, "entries": entries}))
+        self.standbys[writer]["seq"] = max(seq, last_seq) if not entries else entries[-1][0]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        try:
+            nonce = os.urandom(NONCE_SIZE)
+            writer.write(frame(nonce))
+            peer_nonce = await read_frame(reader)
+            channel = Channel(nonce + peer_nonce, b"P", b"S")
+            hello = await channel.read(reader)
+            last_seq = hello.get("seq", 0) if hello.get("epoch") == self.epoch else -1
+            self.standbys[writer] = {"seq": last_seq, "since": time.time(), "channel": channel}
+            logger.info(f"[replication] standby 연결 : {peer} (seq={last_seq})")
+            self.send_since(writer, last_seq)
+            # standby는 주기적으로 ack(seq)를 보낸다 (lag 확인용)
+            while True:
+                ack = await channel.read(reader)
+                self.standbys[writer]["ack"] = ack.get("seq")
+        except AuthError:
+            logger.error(f"[replication] 인증 실패 : {peer}")
+        except (asyncio.IncompleteReadError, ConnectionError, orjson.JSONDecodeError):
+            pass
+        finally:
+            self.standbys.pop(writer, None)
+            writer.close()
+            logger.info(f"[replication] standby 연결 종료 : {peer}")
+
+    def status(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "standbys": [
+                {"peer": str(writer.get_extra_info("peername")), "sent": info["seq"], "ack": info.get("ack"), "lag": self.seq - (info.get("ack") or 0)}
+                for writer, info in self.standbys.items()
+            ],
+        }
+
+
+##############################################################################
+# standby
+##############################################################################
+
+class ReplicationClient:
+    def __init__(self, store: Store, address: str, on_apply=None):
+        self.store = store
+        self.address = address
+        self.on_apply = on_apply
+        self.epoch = None
+        self.seq = 0
+        self.connected = False
+        self.last_received = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                host, port = parse_address(self.address)
+                if port is None:
+                    reader, writer = await asyncio.open_unix_connection(host)
+                else:
+                    reader, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+            delay = RECONNECT_DELAY
+            self.connected = True
+            logger.info(f"[replication] primary 연결 : {self.address} (seq={self.seq})")
+            try:
+                peer_nonce = await read_frame(reader)
+                nonce = os.urandom(NONCE_SIZE)
+                writer.write(frame(nonce))
+                channel = Channel(peer_nonce + nonce, b"S", b"P")
+                writer.write(channel.seal({"epoch": self.epoch, "seq": self.seq}))
+                while True:
+                    self.apply(await channel.read(reader))
+                    writer.write(channel.seal({"seq": self.seq}))
+            except AuthError:
+                # PASSWORD가 다르거나 primary가 아닌 곳에 연결됨. 받은 값은 반영하지 않는다
+                logger.error(f"[replication] primary 인증 실패 : {self.address}")
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.error("[replication] primary 연결 끊김, 재접속 시도")
+            finally:
+                self.connected = False
+                writer.close()
+            await asyncio.sleep(delay)
+
+    def apply(self, message: dict):
+        backend = self.store.backend
+        if message["type"] == "snapshot":
+            for key in set(backend.keys()) - set(message["items"]):
+                backend.delete(key)
+            for key, value in message["items"].items():
+                backend.set(key, decode(value))
+            self.epoch, self.seq = message["epoch"], message["seq"]
+        elif message["type"] == "entries":
+            for seq, op, key, value in message["entries"]:
+                if seq <= self.seq:
+                    continue
+                if op == "set":
+                    backend.set(key, decode(value))
+                else:
+                    backend.delete(key)
+                self.seq = seq
+        self.last_received = time.time()
+        if self.on_apply is not None:
+            self.on_apply()
+
+    def status(self) -> dict:
+        return {
+            "primary": self.address,
+            "connected": self.connected,
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "last_received_age": round(time.time() - self.last_received, 1) if self.last_received else None,
+        }
+
+
+##############################################################################
+# 프로세스 전역 상태
+##############################################################################
+
+role = settings.REPLICATION_ROLE
+server: ReplicationServer | None = None
+client: ReplicationClient | None = None
+
+
+async def start(store: Store, on_apply=None):
+    global server, client
+    if role == "primary":
+        server = ReplicationServer(store, settings.REPLICATION_ADDRESS)
+        await server.start()
+    elif role == "standby":
+        client = ReplicationClient(store, settings.REPLICATION_ADDRESS, on_apply)
+        client.start()
+
+
+async def stop():
+    if server is not None:
+        await server.stop()
+    if client is not None:
+        await client.stop()
+
+
+async def promote(store: Store, listen: bool = False) -> dict:
+    """
+    standby -> primary 승격. 복제를 멈추고 이후 웹훅을 직접 처리한다.
+    listen=True 이면 같은 주소로 primary 서버를 열어 기존 primary를 standby로 붙일 수 있다. (기존 primary가 죽은 경우)
+    """
+    global role, client, server
+    if role != "standby":
+        return {"role": role, "promoted": False}
+    await client.stop()
+    last = client.status()
+    client = None
+    role = "primary"
+    if listen:
+        server = ReplicationServer(store, settings.REPLICATION_ADDRESS)
+        await server.start()
+    logger.info(f"[replication] primary로 승격 (seq={last['seq']})")
+    return {"role": role, "promoted": True, "seq": last["seq"]}
+
+
+def status() -> dict:
+    res = {"role": role}
+    if server is not None:
+        res |= server.status()
+    if client is not None:
+        res |= client.status()
+    return res
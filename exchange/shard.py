@@ -0,0 +1,411 @@
+"""
+거래소별 워커 프로세스 (SHARD_MODE=exchange)
+
+메인 프로세스는 요청을 받아서 거래소별 shard 프로세스로 넘기기만 하고,
+각 shard는 main.app을 그대로 import 해서 자기 거래소의 bot과 전략 상태만 가진다.
+한 거래소가 느려지거나(재시도, time sync) 죽어도 다른 거래소 처리에는 영향이 없다.
+
+IPC : multiprocessing Pipe (send_bytes/recv_bytes가 길이 단위로 framing)
+프레임 : [4byte 헤더길이][orjson 헤더][body bytes]
+"""
+import os
+import sys
+import time
+import struct
+import asyncio
+import threading
+import traceback
+import multiprocessing
+import orjson
+from loguru import logger
+from exchange.model import CRYPTO_EXCHANGES, STOCK_EXCHANGES
+
+
+# shard 프로세스 안에서는 이 환경변수에 shard 이름이 들어있다.
+SHARD_ENV = "POA_SHARD"
+
+# body의 exchange 값으로 shard를 고르는 POST 경로
+BODY_ROUTES = ("/", "/order", "/price", "/hatiko", "/kctrendandhatiko", "/kctrendandhatiko_limit")
+
+# 경로의 첫번째 값(거래소)으로 shard를 고르는 GET 경로
+PATH_ROUTES = ("/hatikoinfo/", "/reset_hatikoinfo/", "/set_hatikoinfo/")
+
+# 모든 shard와 메인 프로세스에 같이 보내는 GET 경로 (Flag, 전체 리셋 등)
+BROADCAST_ROUTES = (
+    "/change_discord",
+    "/change_log",
+    "/change_kill_confirm",
+    "/set_kill_minute/",
+    "/reset_hatikoinfo_all",
+    "/set_hatikoinfo_all/",
+    "/reset_kctrendandhatiko",
+    "/reload_markets",
+)
+
+HEARTBEAT_INTERVAL = 2.0
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 30.0
+
+
+def current_shard() -> str | None:
+    return os.environ.get(SHARD_ENV)
+
+
+def shard_of(exchange_name: str | None) -> str | None:
+    """
+    거래소 이름 -> shard 이름 (주식 거래소는 모두 KIS shard)
+    """
+    if not exchange_name:
+        return None
+    exchange_name = exchange_name.upper()
+    if exchange_name in STOCK_EXCHANGES or exchange_name.startswith("KIS"):
+        return "KIS"
+    if exchange_name in CRYPTO_EXCHANGES:
+        return exchange_name
+    return None
+
+
+def shard_names() -> list[str]:
+    """
+    키가 설정된 거래소마다 shard 하나 (KIS 계좌들은 KIS shard 하나)
+    """
+    from exchange.pexchange import configured_exchanges
+
+    names = []
+    for name in configured_exchanges():
+        shard = shard_of(name)
+        if shard not in names:
+            names.append(shard)
+    return names
+
+
+#region framing
+def pack(header: dict, body: bytes = b"") -> bytes:
+    head = orjson.dumps(header)
+    return struct.pack("!I", len(head)) + head + body
+
+
+def unpack(frame: bytes) -> tuple[dict, bytes]:
+    (size,) = struct.unpack_from("!I", frame)
+    return orjson.loads(frame[4 : 4 + size]), frame[4 + size :]
+#endregion framing
+
+
+async def call_asgi(app, method: str, path: str, query: str = "", headers=(), body: bytes = b"", client=("127.0.0.1", 0)):
+    """
+    ASGI app을 HTTP 서버 없이 직접 호출하고 (status, headers, body)를 반환
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+        "client": client,
+        "server": ("127.0.0.1", 0),
+    }
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    response = {"status": 500, "headers": [], "body": []}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], b"".join(response["body"])
+
+
+##############################################################################
+# 메인 프로세스 (router / supervisor)
+##############################################################################
+
+class Shard:
+    def __init__(self, name: str):
+        self.name = name
+        self.process = None
+        self.conn = None
+        self.reader = None
+        self.pending = {}
+        self.started_at = None
+        self.last_heartbeat = None
+        self.restarts = 0
+        self.handled = 0
+        self.failed = 0
+        self.restart_delay = RESTART_DELAY
+
+    def health(self) -> dict:
+        now = time.time()
+        return {
+            "alive": self.process is not None and self.process.is_alive(),
+            "pid": self.process.pid if self.process is not None else None,
+            "uptime": round(now - self.started_at, 1) if self.started_at else None,
+            "heartbeat_age": round(now - self.last_heartbeat, 1) if self.last_heartbeat else None,
+            "inflight": len(self.pending),
+            "handled": self.handled,
+            "failed": self.failed,
+            "restarts": self.restarts,
+        }
+
+
+class ShardManager:
+    def __init__(self, names: list[str]):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.shards = {name: Shard(name) for name in names}
+        self.loop = None
+        self.next_id = 0
+        self.supervisor = None
+        self.closing = False
+
+    #region 프로세스 관리
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        for shard in self.shards.values():
+            self.spawn(shard)
+        self.supervisor = asyncio.create_task(self.supervise())
+
+    def spawn(self, shard: Shard):
+        parent_conn, child_conn = self.ctx.Pipe()
+        process = self.ctx.Process(target=shard_main, args=(shard.name, child_conn), name=f"shard-{shard.name}", daemon=True)
+        process.start()
+        child_conn.close()
+        shard.process, shard.conn = process, parent_conn
+        shard.started_at, shard.last_heartbeat = time.time(), None
+        shard.reader = threading.Thread(target=self.read_loop, args=(shard, parent_conn), daemon=True)
+        shard.reader.start()
+        logger.info(f"[shard] {shard.name} 시작 (pid={process.pid})")
+
+    async def supervise(self):
+        """
+        죽은 shard를 찾아서 재시작 (연속으로 죽으면 대기 시간을 늘린다)
+        """
+        while not self.closing:
+            await asyncio.sleep(1)
+            for shard in self.shards.values():
+                if shard.process.is_alive() or self.closing:
+                    continue
+                logger.error(f"[shard] {shard.name} 종료됨 (exitcode={shard.process.exitcode}), {shard.restart_delay}초 후 재시작")
+                self.fail_pending(shard, "shard 프로세스가 종료되었습니다")
+                await asyncio.sleep(shard.restart_delay)
+                if time.time() - shard.started_at > RESTART_DELAY_MAX:
+                    shard.restart_delay = RESTART_DELAY
+                else:
+                    shard.restart_delay = min(shard.restart_delay * 2, RESTART_DELAY_MAX)
+                shard.restarts += 1
+                self.spawn(shard)
+
+    async def stop(self, timeout: float = 10.0):
+        self.closing = True
+        if self.supervisor is not None:
+            self.supervisor.cancel()
+        for shard in self.shards.values():
+            try:
+                shard.conn.send_bytes(pack({"type": "stop"}))
+            except (OSError, ValueError):
+                pass
+        deadline = time.time() + timeout
+        for shard in self.shards.values():
+            await asyncio.to_thread(shard.process.join, max(deadline - time.time(), 0))
+            if shard.process.is_alive():
+                shard.process.terminate()
+    #endregion 프로세스 관리
+
+    #region IPC
+    def read_loop(self, shard: Shard, conn):
+        while True:
+            try:
+                header, body = unpack(conn.recv_bytes())
+            except (EOFError, OSError):
+                break
+            if header["type"] == "heartbeat":
+                shard.last_heartbeat = time.time()
+                continue
+            future = shard.pending.pop(header.get("id"), None)
+            if future is not None:
+                self.loop.call_soon_threadsafe(self.resolve, future, (header["status"], header["headers"], body))
+
+    @staticmethod
+    def resolve(future, result):
+        if not future.done():
+            future.set_result(result)
+
+    def fail_pending(self, shard: Shard, message: str):
+        body = orjson.dumps({"error": message, "shard": shard.name})
+        for future in shard.pending.values():
+            self.resolve(future, (503, [("content-type", "application/json")], body))
+            shard.failed += 1
+        shard.pending.clear()
+
+    async def forward(self, shard_name: str, method: str, path: str, query: str, headers, body: bytes):
+        shard = self.shards[shard_name]
+        self.next_id += 1
+        request_id = self.next_id
+        future = self.loop.create_future()
+        shard.pending[request_id] = future
+        header = {"type": "request", "id": request_id, "method": method, "path": path, "query": query, "headers": headers}
+        try:
+            shard.conn.send_bytes(pack(header, body))
+        except (OSError, ValueError):
+            shard.pending.pop(request_id, None)
+            shard.failed += 1
+            return 503, [("content-type", "application/json")], orjson.dumps({"error": "shard에 연결할 수 없습니다", "shard": shard_name})
+        result = await future
+        shard.handled += 1
+        return result
+    #endregion IPC
+
+    def health(self) -> dict:
+        return {name: shard.health() for name, shard in self.shards.items()}
+
+    def route(self, method: str, path: str, body: bytes) -> str | None:
+        """
+        요청을 처리할 shard 이름 (None이면 메인 프로세스에서 처리)
+        """
+        if method == "POST" and path in BODY_ROUTES:
+            try:
+                exchange_name = orjson.loads(body).get("exchange")
+            except (orjson.JSONDecodeError, AttributeError):
+                return None
+            shard = shard_of(exchange_name)
+        elif method == "GET" and path.startswith(PATH_ROUTES):
+            shard = shard_of(path.split("/")[2])
+        else:
+            return None
+        return shard if shard in self.shards else None
+
+
+class ShardMiddleware:
+    """
+    메인 프로세스에서 요청을 shard로 넘기는 ASGI middleware
+    whitelist 검사가 먼저 실행되도록 whitelist middleware 보다 먼저 등록해야 한다. (안쪽에 위치)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        manager: ShardManager = getattr(scope.get("app").state, "shards", None) if scope["type"] == "http" else None
+        if manager is None:
+            return await self.app(scope, receive, send)
+
+        method, path = scope["method"], scope["path"]
+        is_broadcast = method == "GET" and (path in BROADCAST_ROUTES or path.startswith(tuple(r for r in BROADCAST_ROUTES if r.endswith("/"))))
+        if not is_broadcast and not (method == "POST" and path in BODY_ROUTES) and not (method == "GET" and path.startswith(PATH_ROUTES)):
+            return await self.app(scope, receive, send)
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        query = scope.get("query_string", b"").decode()
+        headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]]
+
+        if is_broadcast:
+            names = list(manager.shards)
+            results = await asyncio.gather(
+                call_asgi(self.app, method, path, query, headers, body, scope.get("client")),
+                *[manager.forward(name, method, path, query, headers, body) for name in names],
+            )
+            content = {}
+            for name, (status_code, _, result_body) in zip(["main"] + names, results):
+                try:
+                    content[name] = orjson.loads(result_body)
+                except orjson.JSONDecodeError:
+                    content[name] = result_body.decode(errors="replace")
+            return await self.respond(send, 200, [("content-type", "application/json")], orjson.dumps(content))
+
+        shard = manager.route(method, path, body)
+        if shard is None:
+            status_code, response_headers, response_body = await call_asgi(
+                self.app, method, path, query, headers, body, scope.get("client")
+            )
+        else:
+            status_code, response_headers, response_body = await manager.forward(shard, method, path, query, headers, body)
+        return await self.respond(send, status_code, response_headers, response_body)
+
+    @staticmethod
+    async def respond(send, status_code, headers, body):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+##############################################################################
+# shard 프로세스
+##############################################################################
+
+def shard_main(name: str, conn):
+    os.environ[SHARD_ENV] = name
+    try:
+        asyncio.run(serve_shard(name, conn))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve_shard(name: str, conn):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from main import app
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    send_lock = threading.Lock()
+
+    def send_frame(header: dict, body: bytes = b""):
+        with send_lock:
+            conn.send_bytes(pack(header, body))
+
+    async def handle(header: dict, body: bytes):
+        try:
+            status_code, headers, response_body = await call_asgi(
+                app, header["method"], header["path"], header["query"], header["headers"], body
+            )
+        except Exception:
+            logger.error(f"[shard] {name} 처리 에러\n{traceback.format_exc()}")
+            status_code, headers, response_body = 500, [("content-type", "application/json")], orjson.dumps({"error": "shard 처리 에러"})
+        send_frame({"type": "response", "id": header["id"], "status": status_code, "headers": headers}, response_body)
+
+    def read_loop():
+        while True:
+            try:
+                header, body = unpack(conn.recv_bytes())
+            except (EOFError, OSError):
+                header, body = {"type": "stop"}, b""
+            if header["type"] == "stop":
+                loop.call_soon_threadsafe(stop.set)
+                break
+            asyncio.run_coroutine_threadsafe(handle(header, body), loop)
+
+    async def heartbeat():
+        # event loop가 멈춰 있으면 heartbeat도 멈추므로 heartbeat_age로 확인 가능
+        while True:
+            send_frame({"type": "heartbeat"})
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    await app.router.startup()
+    heartbeat_task = asyncio.create_task(heartbeat())
+    threading.Thread(target=read_loop, daemon=True).start()
+    await stop.wait()
+    heartbeat_task.cancel()
+    await app.router.shutdown()
@@ -0,0 +1,259 @@
+"""
+주문 분할 엔진 (immediate / twap / iceberg)
+
+plan_slices()는 종목 규칙(최소/최대 수량, 수량 정밀도)으로 분할 수량과 주문 시각을 한 번에 계산한다.
+  immediate : 최대 수량 단위로 나눠서 한 번에 주문 (기존 100,000달러 단위 분할과 같음)
+  twap      : duration초 동안 count개로 균등 분할해서 일정 간격으로 주문
+  iceberg   : visible 수량만 걸어두고, 체결되면 다음 slice를 주문
+
+SliceJob은 첫 slice를 요청 안에서 바로 주문하고(주문 성공 여부를 바로 알 수 있게),
+나머지 일정은 asyncio task로 실행한다. slice마다 주문 id와 체결 수량을 fills에 기록한다.
+실행 중인 job은 key(예: "BINANCE:BTC/USDT:USDT")로 관리해서 Kill_Confirm 등에서 취소할 수 있다.
+"""
+import math
+import time
+import asyncio
+from enum import Enum
+from typing import NamedTuple, Callable
+from loguru import logger
+
+ICEBERG_POLL = 2.0   # iceberg 체결 확인 주기(초)
+JOB_HISTORY = 100    # 끝난 job을 status에 남겨두는 개수
+
+
+class SliceMode(str, Enum):
+    IMMEDIATE = "immediate"
+    TWAP = "twap"
+    ICEBERG = "iceberg"
+
+
+class SlicePlan(NamedTuple):
+    mode: SliceMode
+    amounts: tuple          # slice 수량 (정밀도 적용)
+    delays: tuple           # 시작 시각 기준 주문 시각(초). iceberg는 모두 0 (앞 slice 체결 후 주문)
+    dropped: float = 0.0    # 최소 수량 / 정밀도 미만이라 주문하지 못한 나머지
+
+    @property
+    def total(self) -> float:
+        return sum(self.amounts)
+
+
+class SliceFill(NamedTuple):
+    index: int
+    amount: float
+    order_id: str | None = None
+    filled: float = 0.0
+    status: str = "pending"     # pending / open / closed / canceled / error
+    at: float = 0.0
+    error: str | None = None
+
+
+def plan_slices(
+    total: float,
+    min_amount: float,
+    max_amount: float,
+    precision: Callable[[float], float] = float,
+    mode: SliceMode | str = SliceMode.IMMEDIATE,
+    duration: float = 0.0,
+    count: int = 1,
+    visible: float | None = None,
+) -> SlicePlan:
+    """
+    total을 slice 수량 벡터로 나눈다.
+    precision(amount) : 거래소 수량 정밀도로 내림 (예: lambda a: float(client.amount_to_precision(symbol, a)))
+    모든 slice는 min_amount 이상, max_amount 이하. 남는 수량이 min_amount 미만이면 마지막 slice에 합치고,
+    합쳐서 max_amount를 넘으면 버린다. 정밀도 아래 자투리도 주문하지 못하므로 dropped에 포함된다.
+    """
+    mode = SliceMode(mode)
+    if total <= 0 or total < min_amount:
+        return SlicePlan(mode, (), (), max(total, 0.0))
+
+    if mode == SliceMode.TWAP:
+        # 최대 수량을 넘지 않고, 최소 수량 이상이 되는 개수로 조정
+        n = max(int(count), math.ceil(total / max_amount))
+        if min_amount > 0:
+            n = min(n, max(1, int(total // min_amount)))
+        size = precision(total / n)
+    elif mode == SliceMode.ICEBERG:
+        size = precision(min(max(visible or max_amount, min_amount), max_amount))
+        n = int(total // size)
+    else:
+        size = precision(max_amount)
+        n = int(total // size)
+
+    amounts = [size] * n
+    # 10 - 3.33 * 3 = 0.00999... 처럼 float 오차로 정밀도 한 칸이 내림에 사라지지 않게 반올림 후 내림
+    rest = precision(round(total - size * n, 12))
+    if rest >= min_amount and rest > 0:
+        amounts.append(rest)
+    elif rest > 0 and amounts and amounts[-1] + rest <= max_amount:
+        amounts[-1] = precision(round(amounts[-1] + rest, 12))
+    dropped = max(round(total - sum(amounts), 12), 0.0)
+
+    if mode == SliceMode.TWAP and len(amounts) > 1:
+        interval = duration / (len(amounts) - 1)
+        delays = tuple(round(interval * i, 3) for i in range(len(amounts)))
+    else:
+        delays = (0.0,) * len(amounts)
+    return SlicePlan(mode, tuple(amounts), delays, dropped)
+
+
+class SliceJob:
+    """
+    SlicePlan 하나의 실행.
+    place(amount) -> order dict : 주문 함수 (동기/비동기 모두 가능, 재시도는 place 쪽에서)
+    fetch(order_id) -> order dict : 체결 확인 함수 (iceberg 필수, twap은 끝난 뒤 체결 수량 갱신에 사용)
+    on_fill(job, fill, event) : slice 주문("placed") / 체결 상태 변경("updated") / 주문 실패("error") 때마다 호출
+    """
+    def __init__(self, key: str, plan: SlicePlan, place, fetch=None, on_fill=None, poll: float = ICEBERG_POLL):
+        if plan.mode == SliceMode.ICEBERG and fetch is None:
+            raise ValueError("iceberg 분할에는 fetch가 필요합니다")
+        self.key = key
+        self.plan = plan
+        self.place = place
+        self.fetch = fetch
+        self.on_fill = on_fill
+        self.poll = poll
+        self.fills = [SliceFill(i, amount) for i, amount in enumerate(plan.amounts)]
+        self.started = time.time()
+        self.finished = None
+        self.task = None
+
+    async def _call(self, func, *args):
+        result = func(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def _record(self, index: int, event: str, **kwargs):
+        self.fills[index] = self.fills[index]._replace(**kwargs)
+        if self.on_fill is not None:
+            try:
+                self.on_fill(self, self.fills[index], event)
+            except Exception as e:
+                logger.error(f"[slicing] {self.key} on_fill 실패 : {e}")
+
+    async def place_slice(self, index: int) -> dict | None:
+        try:
+            order = await self._call(self.place, self.plan.amounts[index])
+        except Exception as e:
+            self._record(index, "error", status="error", at=time.time(), error=str(e))
+            raise
+        self._record(
+            index,
+            "placed",
+            order_id=order.get("id"),
+            filled=float(order.get("filled") or 0),
+            status=order.get("status") or "open",
+            at=time.time(),
+        )
+        return order
+
+    async def refresh(self, index: int) -> SliceFill:
+        fill = self.fills[index]
+        if self.fetch is None or fill.order_id is None:
+            return fill
+        order = await self._call(self.fetch, fill.order_id)
+        if order.get("status") != fill.status or float(order.get("filled") or 0) != fill.filled:
+            self._record(index, "updated", filled=float(order.get("filled") or 0), status=order.get("status") or fill.status)
+        return self.fills[index]
+
+    async def start(self) -> bool:
+        """
+        첫 slice를 바로 주문하고 나머지는 task로 실행. 주문을 하나라도 냈으면 True
+        """
+        if not self.plan.amounts:
+            self.finished = time.time()
+            return False
+        await self.place_slice(0)
+        if len(self.plan.amounts) == 1:
+            self.finished = time.time()
+            return True
+        if self.plan.mode == SliceMode.IMMEDIATE:
+            # 한 번에 주문 (요청 안에서 끝까지)
+            for index in range(1, len(self.plan.amounts)):
+                await self.place_slice(index)
+            self.finished = time.time()
+            return True
+        self.task = asyncio.create_task(self.run(1))
+        register(self)
+        return True
+
+    async def run(self, start: int = 0):
+        try:
+            for index in range(start, len(self.plan.amounts)):
+                if self.plan.mode == SliceMode.ICEBERG:
+                    await self.wait_filled(index - 1)
+                else:
+                    await asyncio.sleep(max(0.0, self.started + self.plan.delays[index] - time.time()))
+                await self.place_slice(index)
+            if self.plan.mode == SliceMode.TWAP:
+                for index in range(len(self.plan.amounts)):
+                    await self.refresh(index)
+        except asyncio.CancelledError:
+            logger.info(f"[slicing] {self.key} 취소됨 ({self.placed}/{len(self.plan.amounts)} slice 주문)")
+            raise
+        except Exception as e:
+            logger.error(f"[slicing] {self.key} 중단 ({self.placed}/{len(self.plan.amounts)} slice 주문) : {e}")
+        finally:
+            self.finished = time.time()
+
+    async def wait_filled(self, index: int):
+        while index >= 0:
+            fill = await self.refresh(index)
+            if fill.status == "closed":
+                return
+            if fill.status in ("canceled", "expired", "rejected", "error"):
+                raise RuntimeError(f"slice {index} {fill.status}")
+            await asyncio.sleep(self.poll)
+
+    def cancel(self) -> bool:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            return True
+        return False
+
+    @property
+    def placed(self) -> int:
+        return sum(1 for fill in self.fills if fill.order_id is not None)
+
+    @property
+    def filled(self) -> float:
+        return sum(fill.filled for fill in self.fills)
+
+    def status(self) -> dict:
+        return {
+            "key": self.key,
+            "mode": self.plan.mode.value,
+            "total": self.plan.total,
+            "dropped": self.plan.dropped,
+            "placed": self.placed,
+            "filled": self.filled,
+            "running": self.task is not None and not self.task.done(),
+            "started": self.started,
+            "finished": self.finished,
+            "slices": [fill._asdict() for fill in self.fills],
+        }
+
+
+# 실행 중(또는 최근 끝난) job. key -> job
+jobs: dict[str, SliceJob] = {}
+
+
+def register(job: SliceJob):
+    previous = jobs.pop(job.key, None)
+    if previous is not None and previous is not job:
+        previous.cancel()
+    jobs[job.key] = job
+    if len(jobs) > JOB_HISTORY:
+        for key in [key for key, old in jobs.items() if old.finished is not None][: len(jobs) - JOB_HISTORY]:
+            jobs.pop(key, None)
+
+
+def cancel_jobs(key: str) -> bool:
+    job = jobs.get(key)
+    return job.cancel() if job is not None else False
+
+
+def status() -> list[dict]:
+    return [job.status() for job in jobs.values()]
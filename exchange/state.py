@@ -0,0 +1,664 @@
+import os
+import sqlite3
+import pickle
+import asyncio
+import threading
+from types import MappingProxyType
+from contextlib import contextmanager
+from pathlib import Path
+from exchange.utility import settings
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+current_file_direcotry = os.path.dirname(os.path.realpath(__file__))
+parent_directory = Path(current_file_direcotry).parent
+
+
+##############################################################################
+# File Lock
+##############################################################################
+
+class FileLock:
+    """
+    프로세스 간 잠금 (POSIX : flock, Windows : msvcrt.locking)
+    같은 프로세스 안의 스레드끼리는 threading.Lock으로 한 번 더 막는다.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.thread_lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self.thread_lock.acquire(blocking):
+            return False
+        file = open(self.path, "a+b")
+        try:
+            if os.name == "nt":
+                file.seek(0)
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                msvcrt.locking(file.fileno(), mode, 1)
+            else:
+                flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(file.fileno(), flags)
+        except OSError:
+            file.close()
+            self.thread_lock.release()
+            return False
+        self.file = file
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        try:
+            if os.name == "nt":
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+            self.thread_lock.release()
+
+    @property
+    def locked(self) -> bool:
+        return self.file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+##############################################################################
+# State Backend
+##############################################################################
+
+class LocalBackend:
+    """
+    프로세스 내부 메모리 저장소 (워커 1개, 기존 동작과 동일)
+    """
+
+    shared = False
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    def get_versioned(self, key: str):
+        with self.lock:
+            return self.data.get(key, (None, 0))
+
+    def get(self, key: str, default=None):
+        value, version = self.get_versioned(key)
+        return default if version == 0 else value
+
+    def cas(self, key: str, version: int, value) -> bool:
+        """
+        현재 version이 일치할 때만 value로 교체 (version 0 = 아직 없는 key)
+        """
+        with self.lock:
+            if self.data.get(key, (None, 0))[1] != version:
+                return False
+            self.data[key] = (value, version + 1)
+            return True
+
+    def set(self, key: str, value):
+        with self.lock:
+            self.data[key] = (value, self.data.get(key, (None, 0))[1] + 1)
+
+    def delete(self, key: str):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def keys(self, prefix: str = "") -> list[str]:
+        with self.lock:
+            return [key for key in self.data if key.startswith(prefix)]
+
+    def lock_for(self, name: str):
+        return self.locks.setdefault(name, threading.Lock())
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """
+    여러 워커 프로세스가 공유하는 저장소 (SQLite WAL)
+    value는 pickle로 저장하고, key마다 version을 두어 compare-and-swap을 지원한다.
+
+    읽은 값은 (value, version)으로 캐시한다. PRAGMA data_version은 다른 연결(워커)이 commit했을 때만 바뀌므로
+    바뀌지 않았으면 캐시를 그대로 쓴다. (읽을 때마다 SELECT + unpickle 하지 않음)
+    이 연결에서 쓴 key는 캐시에서 지운다. 캐시된 값은 여러 곳에서 같이 보므로 꺼낸 값을 직접 바꾸면 안 된다.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.cache = {}
+        self.data_version = None
+        self.con = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL;")
+        self.con.execute("PRAGMA synchronous=NORMAL;")
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                version INTEGER NOT NULL
+            );
+            """
+        )
+
+    def get_versioned(self, key: str):
+        with self.lock:
+            data_version = self.con.execute("PRAGMA data_version;").fetchone()[0]
+            if data_version != self.data_version:
+                self.cache.clear()
+                self.data_version = data_version
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+            row = self.con.execute("SELECT value, version FROM kv WHERE key = ?;", (key,)).fetchone()
+            result = (None, 0) if row is None else (pickle.loads(row[0]), row[1])
+            self.cache[key] = result
+            return result
+
+    def get(self, key: str, default=None):
+        value, version = self.get_versioned(key)
+        return default if version == 0 else value
+
+    def cas(self, key: str, version: int, value) -> bool:
+        """
+        현재 version이 일치할 때만 value로 교체 (version 0 = 아직 없는 key)
+        """
+        blob = pickle.dumps(value)
+        with self.lock:
+            self.cache.pop(key, None)
+            if version == 0:
+                cur = self.con.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, version) VALUES (?, ?, 1);", (key, blob)
+                )
+            else:
+                cur = self.con.execute(
+                    "UPDATE kv SET value = ?, version = version + 1 WHERE key = ? AND version = ?;",
+                    (blob, key, version),
+                )
+        return cur.rowcount == 1
+
+    def set(self, key: str, value):
+        blob = pickle.dumps(value)
+        with self.lock:
+            self.cache.pop(key, None)
+            self.con.execute(
+                """
+                INSERT INTO kv (key, value, version) VALUES (?, ?, 1)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1;
+                """,
+                (key, blob),
+            )
+
+    def delete(self, key: str):
+        with self.lock:
+            self.cache.pop(key, None)
+            self.con.execute("DELETE FROM kv WHERE key = ?;", (key,))
+
+    def keys(self, prefix: str = "") -> list[str]:
+        with self.lock:
+            rows = self.con.execute(
+                "SELECT key FROM kv WHERE substr(key, 1, ?) = ?;", (len(prefix), prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def lock_for(self, name: str):
+        if name not in self.locks:
+            self.locks[name] = FileLock(f"{self.path}.{name}.lock")
+        return self.locks[name]
+
+    def close(self):
+        with self.lock:
+            self.con.close()
+
+
+##############################################################################
+# Store
+##############################################################################
+
+class Store:
+    """
+    전략 상태 저장소
+    STATE_BACKEND=local  : 프로세스 메모리 (기존 동작)
+    STATE_BACKEND=sqlite : STATE_PATH의 SQLite 파일을 모든 워커가 공유
+    tracked=True 이면 local이어도 전략 상태를 store 컨테이너에 보관해서 변경을 listener로 알린다. (replication)
+    """
+
+    def __init__(self, backend, tracked: bool = False):
+        self.backend = backend
+        self.leader_lock = None
+        self.is_leader = not backend.shared
+        self.tracked = tracked or backend.shared
+        self.listeners = []
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    def add_listener(self, listener):
+        """
+        listener(op, key, value) : 이 프로세스에서 일어난 변경마다 호출 (op : "set" / "delete")
+        """
+        self.listeners.append(listener)
+
+    def emit(self, op: str, key: str, value=None):
+        for listener in self.listeners:
+            listener(op, key, value)
+
+    def items(self, prefix: str = "") -> dict:
+        return {key: self.backend.get(key) for key in self.backend.keys(prefix)}
+
+    def get(self, key: str, default=None):
+        return self.backend.get(key, default)
+
+    def get_versioned(self, key: str):
+        return self.backend.get_versioned(key)
+
+    def set(self, key: str, value):
+        self.backend.set(key, value)
+        self.emit("set", key, value)
+
+    def cas(self, key: str, version: int, value) -> bool:
+        if not self.backend.cas(key, version, value):
+            return False
+        self.emit("set", key, value)
+        return True
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+        self.emit("delete", key)
+
+    def keys(self, prefix: str = "") -> list[str]:
+        return self.backend.keys(prefix)
+
+    def setdefault(self, key: str, value):
+        """
+        key가 없을 때만 value를 저장하고, 저장된 값을 반환
+        """
+        self.cas(key, 0, value)
+        return self.backend.get(key, value)
+
+    def update(self, key: str, func, default=None):
+        """
+        func(현재값) 결과로 key를 갱신 (다른 워커와 충돌하면 다시 읽어서 재시도)
+        return (이전값, 새값)
+        """
+        while True:
+            value, version = self.backend.get_versioned(key)
+            if version == 0:
+                value = default() if callable(default) else default
+            new_value = func(value)
+            if self.cas(key, version, new_value):
+                return value, new_value
+
+    @contextmanager
+    def lock(self, name: str):
+        """
+        이름 단위 잠금 (sqlite : 프로세스 간 파일 잠금). await를 포함하지 않는 짧은 구간에만 사용
+        """
+        lock = self.backend.lock_for(name)
+        lock.acquire()
+        try:
+            yield
+        finally:
+            lock.release()
+
+    #region Leader 선출
+    def try_become_leader(self) -> bool:
+        """
+        타이머/종료시 저장 같은 작업은 leader 워커 하나만 실행한다.
+        leader 파일 잠금을 잡은 프로세스가 leader이며, 프로세스가 죽으면 잠금이 풀려 다른 워커가 이어받는다.
+        """
+        if self.is_leader:
+            return True
+        if self.leader_lock is None:
+            self.leader_lock = self.backend.lock_for("leader")
+        self.is_leader = self.leader_lock.acquire(blocking=False)
+        return self.is_leader
+
+    async def elect_leader(self, interval: float = 5.0, on_elected=None):
+        """
+        leader가 될 때까지 interval 초마다 재시도 (startup에서 백그라운드 task로 실행)
+        on_elected는 leader가 된 뒤 한 번 호출한다. (coroutine 함수면 await)
+        """
+        while not self.try_become_leader():
+            await asyncio.sleep(interval)
+        if on_elected is not None:
+            result = on_elected()
+            if asyncio.iscoroutine(result):
+                await result
+
+    def resign_leader(self):
+        if self.shared and self.leader_lock is not None and self.leader_lock.locked:
+            self.leader_lock.release()
+            self.is_leader = False
+    #endregion Leader 선출
+
+    #region 공유 컨테이너
+    def list(self, key: str, initial=None):
+        """
+        local : 일반 list / sqlite, replication : key에 저장되는 SharedList
+        """
+        if not self.tracked:
+            return list(initial or [])
+        return SharedList(self, key, initial)
+
+    def dict(self, key: str, initial=None):
+        """
+        local : 일반 dict / sqlite, replication : key에 저장되는 SharedDict
+        """
+        if not self.tracked:
+            return dict(initial or {})
+        return SharedDict(self, key, initial)
+
+    def setof(self, key: str, initial=None):
+        """
+        local : 일반 set / sqlite, replication : key에 저장되는 SharedSet
+        """
+        if not self.tracked:
+            return set(initial or ())
+        return SharedSet(self, key, initial)
+    #endregion 공유 컨테이너
+
+    def close(self):
+        self.resign_leader()
+        self.backend.close()
+
+
+def frozen(value):
+    """
+    공유 컨테이너에서 꺼낸 값의 읽기 전용 형태 (list -> tuple, dict -> MappingProxyType, set -> frozenset)
+    꺼낸 값을 직접 바꾸면 store에 반영되지 않으므로, 바꾸려고 하면 에러가 나게 한다.
+    """
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, dict):
+        return MappingProxyType(value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class SharedList:
+    """
+    Store의 key 하나에 list 전체를 저장하는 list 대용 객체
+    읽기는 매번 최신값을 읽고, 변경은 Store.update(compare-and-swap)로 원자적으로 반영한다.
+    원소는 읽기 전용으로 꺼내진다. (frozen)
+    """
+
+    def __init__(self, store: Store, key: str, initial=None):
+        self.store = store
+        self.key = key
+        store.setdefault(key, list(initial or []))
+
+    def value(self) -> list:
+        return self.store.get(self.key, [])
+
+    def replace(self, items):
+        self.store.set(self.key, list(items))
+
+    def append(self, item):
+        self.store.update(self.key, lambda items: items + [item], list)
+
+    def add(self, item) -> bool:
+        """
+        item이 없을 때만 추가 (확인과 추가가 한 번의 CAS로 처리됨)
+        """
+        before, _ = self.store.update(self.key, lambda items: items if item in items else items + [item], list)
+        return item not in before
+
+    def remove(self, item):
+        def _remove(items):
+            items = list(items)
+            if item in items:
+                items.remove(item)
+            return items
+
+        before, _ = self.store.update(self.key, _remove, list)
+        if item not in before:
+            raise ValueError(f"{item} not in list")
+
+    def discard(self, item) -> bool:
+        before, _ = self.store.update(self.key, lambda items: [x for x in items if x != item], list)
+        return item in before
+
+    def clear(self):
+        self.replace([])
+
+    def copy(self) -> list:
+        return list(self.value())
+
+    def count(self, item) -> int:
+        return self.value().count(item)
+
+    def index(self, item) -> int:
+        return self.value().index(item)
+
+    def __contains__(self, item):
+        return item in self.value()
+
+    def __iter__(self):
+        return map(frozen, self.value())
+
+    def __len__(self):
+        return len(self.value())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [frozen(item) for item in self.value()[index]]
+        return frozen(self.value()[index])
+
+    def __add__(self, other):
+        return self.value() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self.value()
+
+    def __eq__(self, other):
+        return self.value() == list(other)
+
+    def __repr__(self):
+        return repr(self.value())
+
+    def __reduce__(self):
+        # pickle로 저장할 때는 일반 list로 저장
+        return (list, (self.value(),))
+
+
+class SharedSet:
+    """
+    Store의 key 하나에 set 전체를 저장하는 set 대용 객체
+    읽기는 매번 최신값을 읽고, 변경은 Store.update(compare-and-swap)로 원자적으로 반영한다.
+    """
+
+    def __init__(self, store: Store, key: str, initial=None):
+        self.store = store
+        self.key = key
+        store.setdefault(key, frozenset(initial or ()))
+
+    def value(self) -> frozenset:
+        return self.store.get(self.key, frozenset())
+
+    def replace(self, items):
+        self.store.set(self.key, frozenset(items))
+
+    def add(self, item):
+        self.store.update(self.key, lambda items: items | {item}, frozenset)
+
+    def discard(self, item):
+        self.store.update(self.key, lambda items: items - {item}, frozenset)
+
+    def remove(self, item):
+        before, _ = self.store.update(self.key, lambda items: items - {item}, frozenset)
+        if item not in before:
+            raise KeyError(item)
+
+    def clear(self):
+        self.replace(())
+
+    def __contains__(self, item):
+        return item in self.value()
+
+    def __iter__(self):
+        return iter(self.value())
+
+    def __len__(self):
+        return len(self.value())
+
+    def __eq__(self, other):
+        return self.value() == frozenset(other)
+
+    def __repr__(self):
+        return repr(set(self.value()))
+
+    def __reduce__(self):
+        # pickle로 저장할 때는 일반 set으로 저장
+        return (set, (set(self.value()),))
+
+
+class SharedDict:
+    """
+    Store의 key 하나에 dict 전체를 저장하는 dict 대용 객체
+    읽기는 매번 최신값을 읽고, 변경은 Store.update(compare-and-swap)로 원자적으로 반영한다.
+
+    값은 통째로 바꿔야 한다. d[name] = new_value / d.compute(name, func)
+    꺼낸 값은 읽기 전용(frozen)이라 d[name].append(...) 같은 제자리 변경은 저장되지 않는 대신 에러가 난다.
+    """
+
+    def __init__(self, store: Store, key: str, initial=None):
+        self.store = store
+        self.key = key
+        store.setdefault(key, dict(initial or {}))
+
+    def value(self) -> dict:
+        return self.store.get(self.key, {})
+
+    def replace(self, items):
+        self.store.set(self.key, dict(items))
+
+    def get(self, name, default=None):
+        return frozen(self.value().get(name, default))
+
+    def setdefault(self, name, default=None):
+        _, after = self.store.update(self.key, lambda items: items if name in items else items | {name: default}, dict)
+        return frozen(after[name])
+
+    def pop(self, name, *default):
+        before, _ = self.store.update(self.key, lambda items: {k: v for k, v in items.items() if k != name}, dict)
+        if name in before:
+            return before[name]
+        if default:
+            return default[0]
+        raise KeyError(name)
+
+    def update(self, other=(), **kwargs):
+        new_items = dict(other, **kwargs)
+        self.store.update(self.key, lambda items: items | new_items, dict)
+
+    def compute(self, name, func):
+        """
+        func(현재값 또는 None) 결과로 name 하나를 원자적으로 갱신한다. 결과가 None이면 삭제
+        return 새값
+        """
+        def _compute(items):
+            value = func(items.get(name))
+            if value is None:
+                return {k: v for k, v in items.items() if k != name}
+            return items | {name: value}
+        _, after = self.store.update(self.key, _compute, dict)
+        return frozen(after.get(name))
+
+    def clear(self):
+        self.replace({})
+
+    def copy(self) -> dict:
+        return dict(self.value())
+
+    def keys(self):
+        return self.value().keys()
+
+    def values(self):
+        return [frozen(value) for value in self.value().values()]
+
+    def items(self):
+        return [(name, frozen(value)) for name, value in self.value().items()]
+
+    def __getitem__(self, name):
+        return frozen(self.value()[name])
+
+    def __setitem__(self, name, item):
+        self.store.update(self.key, lambda items: items | {name: item}, dict)
+
+    def __delitem__(self, name):
+        self.pop(name)
+
+    def __contains__(self, name):
+        return name in self.value()
+
+    def __iter__(self):
+        return iter(self.value())
+
+    def __len__(self):
+        return len(self.value())
+
+    def __eq__(self, other):
+        return self.value() == dict(other)
+
+    def __repr__(self):
+        return repr(self.value())
+
+    def __reduce__(self):
+        # pickle로 저장할 때는 일반 dict로 저장
+        return (dict, (self.value(),))
+
+
+_compute_lock = threading.Lock()
+
+
+def compute(container, name, func):
+    """
+    dict 또는 SharedDict의 name 하나를 func(현재값 또는 None) 결과로 원자적으로 갱신한다. 결과가 None이면 삭제
+    """
+    if isinstance(container, SharedDict):
+        return container.compute(name, func)
+    with _compute_lock:
+        value = func(container.get(name))
+        if value is None:
+            container.pop(name, None)
+        else:
+            container[name] = value
+        return value
+
+
+def create_store() -> Store:
+    tracked = settings.REPLICATION_ROLE != "off"
+    if settings.STATE_BACKEND == "sqlite":
+        path = settings.STATE_PATH
+        if not os.path.isabs(path):
+            path = os.path.join(parent_directory, path)
+        return Store(SQLiteBackend(path), tracked)
+    return Store(LocalBackend(), tracked)
+
+
+store = create_store()
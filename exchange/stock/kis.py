@@ -1,16 +1,30 @@
-from datetime import datetime
 import json
+import asyncio
 import httpx
 from exchange.stock.error import TokenExpired
 from exchange.stock.schemas import *
-from exchange.database import db
+from exchange.stock.token import token_manager
+from exchange.stock.template import build_order_templates
+from exchange.stock.quote import quote_cache
 from pydantic import validate_arguments
 import traceback
 import copy
 from exchange.model import MarketOrder
+from exchange.utility import settings
 from devtools import debug
 
 
+TOKEN_EXPIRED_CODES = ("EGW00121", "EGW00123")  # 유효하지 않은 토큰 / 만료된 토큰
+KIS_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+KIS_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = settings.KIS_HTTP2
+except ImportError:
+    HTTP2 = False
+
+
 class KoreaInvestment:
     def __init__(
         self,
@@ -31,14 +45,16 @@ class KoreaInvestment:
         self.is_auth = False
         self.account_number = account_number
         self.base_headers = {}
-        self.session = httpx.Client()
-        self.async_session = httpx.AsyncClient()
-        self.auth()
-
+        self.session = httpx.Client(limits=KIS_LIMITS, timeout=KIS_TIMEOUT)
+        # 주문 경로용 비동기 client (연결 유지, h2 패키지가 있으면 HTTP/2)
+        self.async_session = httpx.AsyncClient(limits=KIS_LIMITS, timeout=KIS_TIMEOUT, http2=HTTP2)
         self.base_body = {}
         self.base_order_body = AccountInfo(
             CANO=account_number, ACNT_PRDT_CD=account_code
         )
+        self.order_templates = {}
+        token_manager.register(f"KIS{kis_number}", key, secret)
+        self.auth()
         self.order_exchange_code = {
             "NASDAQ": ExchangeCode.NASDAQ,
             "NYSE": ExchangeCode.NYSE,
@@ -56,6 +72,9 @@ class KoreaInvestment:
     def close_session(self):
         self.session.close()
 
+    async def aclose_session(self):
+        await self.async_session.aclose()
+
     def get(self, endpoint: str, params: dict = None, headers: dict = None):
         url = f"{self.base_url}{endpoint}"
         # headers |= self.base_headers
@@ -66,6 +85,11 @@ class KoreaInvestment:
     ):
         url = f"{self.base_url}{endpoint}"
         response = self.session.post(url, json=data, headers=headers).json()
+        if response.get("msg_cd") in TOKEN_EXPIRED_CODES and headers is not None:
+            # 메모리 토큰이 거절된 경우 (다른 곳에서 재발급 등) 한 번만 새 토큰으로 다시 보낸다
+            token_manager.invalidate(f"KIS{self.kis_number}", headers["authorization"].split(" ", 1)[-1])
+            headers = headers | {"authorization": f"Bearer {self.auth()}"}
+            response = self.session.post(url, json=data, headers=headers).json()
         if "access_token" in response.keys() or response["rt_cd"] == "0":
             return response
         else:
@@ -74,6 +98,27 @@ class KoreaInvestment:
     def post(self, endpoint: str, data: dict = None, headers: dict = None):
         return self.post_with_error_handling(endpoint, data, headers)
 
+    async def aget(self, endpoint: str, params: dict = None, headers: dict = None):
+        url = f"{self.base_url}{endpoint}"
+        return (await self.async_session.get(url, params=params, headers=headers)).json()
+
+    async def apost(self, endpoint: str, data: dict = None, headers: dict = None):
+        url = f"{self.base_url}{endpoint}"
+        response = (await self.async_session.post(url, json=data, headers=headers)).json()
+        if response.get("msg_cd") in TOKEN_EXPIRED_CODES and headers is not None:
+            token_manager.invalidate(f"KIS{self.kis_number}", headers["authorization"].split(" ", 1)[-1])
+            headers = headers | {"authorization": f"Bearer {await self.aauth()}"}
+            response = (await self.async_session.post(url, json=data, headers=headers)).json()
+        if "access_token" in response.keys() or response["rt_cd"] == "0":
+            return response
+        else:
+            raise Exception(response)
+
+    async def aget_hashkey(self, data) -> str:
+        headers = {"appKey": self.key, "appSecret": self.secret}
+        url = f"{self.base_url}/uapi/hashkey"
+        return (await self.async_session.post(url, json=data, headers=headers)).json()["HASH"]
+
     def get_hashkey(self, data) -> str:
         headers = {"appKey": self.key, "appSecret": self.secret}
         endpoint = "/uapi/hashkey"
@@ -86,124 +131,54 @@ class KoreaInvestment:
     def write_auth(self, auth):
         self.write_json("auth.json", auth)
 
-    def check_auth(self, auth, key, secret, kis_number):
-        if auth is None:
-            return False
-        access_token, access_token_token_expired = auth
-        try:
-            if access_token == "nothing":
-                return False
-            else:
-                if not self.is_auth:
-                    response = self.session.get(
-                        "https://openapi.koreainvestment.com:9443/uapi/domestic-stock/v1/quotations/inquire-ccnl",
-                        headers={
-                            "authorization": f"BEARER {access_token}",
-                            "appkey": key,
-                            "appsecret": secret,
-                            "custtype": "P",
-                            "tr_id": "FHKST01010300",
-                        },
-                        params={
-                            "FID_COND_MRKT_DIV_CODE": "J",
-                            "FID_INPUT_ISCD": "005930",
-                        },
-                    ).json()
-                    if response["msg_cd"] == "EGW00123":
-                        return False
-
-            access_token_token_expired = datetime.strptime(
-                access_token_token_expired, "%Y-%m-%d %H:%M:%S"
+    def auth(self):
+        # 토큰은 token_manager가 메모리에 들고 있다가 만료 전에 백그라운드로 갱신한다 (주문 경로에서 DB/인증 호출 없음)
+        access_token = token_manager.access_token(f"KIS{self.kis_number}")
+        authorization = f"Bearer {access_token}"
+        if self.base_headers.get("authorization") != authorization:
+            self.base_headers = BaseHeaders(
+                authorization=authorization,
+                appkey=self.key,
+                appsecret=self.secret,
+                custtype="P",
+            ).dict()
+            self.order_templates = build_order_templates(
+                self.base_url,
+                self.base_headers,
+                self.base_order_body.CANO,
+                self.base_order_body.ACNT_PRDT_CD,
             )
-            diff = access_token_token_expired - datetime.now()
-            total_seconds = diff.total_seconds()
-            if total_seconds < 60 * 60:
-                return False
-            else:
-                return True
-
-        except Exception as e:
-            print(traceback.format_exc())
-
-    def create_auth(self, key: str, secret: str):
-        data = {"grant_type": "client_credentials", "appkey": key, "appsecret": secret}
-        base_url = BaseUrls.base_url.value
-        endpoint = "/oauth2/tokenP"
-
-        url = f"{base_url}{endpoint}"
+        return access_token
 
-        response = self.session.post(url, json=data).json()
-        if "access_token" in response.keys() or response.get("rt_cd") == "0":
-            return response["access_token"], response["access_token_token_expired"]
-        else:
-            raise Exception(response)
+    async def aauth(self):
+        # 메모리에 유효한 토큰이 있으면 바로 반환, 새로 발급받아야 하면 (계좌당 한 번) 스레드에서 발급
+        token = token_manager.tokens.get(f"KIS{self.kis_number}")
+        if token is not None and token.valid():
+            return self.auth()
+        return await asyncio.to_thread(self.auth)
 
-    def auth(self):
-        auth_id = f"KIS{self.kis_number}"
-        auth = db.get_auth(auth_id)
-        if not self.check_auth(auth, self.key, self.secret, self.kis_number):
-            auth = self.create_auth(self.key, self.secret)
-            db.set_auth(auth_id, auth[0], auth[1])
-        else:
-            self.is_auth = True
-        access_token = auth[0]
-        self.base_headers = BaseHeaders(
-            authorization=f"Bearer {access_token}",
-            appkey=self.key,
-            appsecret=self.secret,
-            custtype="P",
-        ).dict()
-        return auth
-
-    @validate_arguments
-    def create_order(
+    def order_request(
         self,
-        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        exchange: str,
         ticker: str,
-        order_type: Literal["limit", "market"],
-        side: Literal["buy", "sell"],
+        order_type: str,
+        side: str,
         amount: int,
         price: int = 0,
         mintick=0.01,
-    ):
-        endpoint = (
-            Endpoints.korea_order.value
-            if exchange == "KRX"
-            else Endpoints.usa_order.value
-        )
-        body = self.base_order_body.dict()
-        headers = copy.deepcopy(self.base_headers)
-        price = str(price)
-
-        amount = str(int(amount))
-
+        current_price: float | None = None,
+    ) -> tuple[str, dict, dict]:
+        """
+        주문 요청 (endpoint, body, headers). 해외 주문은 current_price(현재가)가 필요하다.
+        미리 만들어 둔 템플릿(exchange.stock.template)에 종목코드, 수량, 가격만 덮어쓴다.
+        """
+        template = self.order_templates[(exchange, side, order_type)]
         if exchange == "KRX":
-            if self.base_url == BaseUrls.base_url:
-                headers |= (
-                    KoreaBuyOrderHeaders(**headers)
-                    if side == "buy"
-                    else KoreaSellOrderHeaders(**headers)
-                )
-            elif self.base_url == BaseUrls.paper_base_url:
-                headers |= (
-                    KoreaPaperBuyOrderHeaders(**headers)
-                    if side == "buy"
-                    else KoreaPaperSellOrderHeaders(**headers)
-                )
-
             if order_type == "market":
-                body |= KoreaMarketOrderBody(**body, PDNO=ticker, ORD_QTY=amount)
-            elif order_type == "limit":
-                body |= KoreaOrderBody(
-                    **body,
-                    PDNO=ticker,
-                    ORD_DVSN=KoreaOrderType.limit,
-                    ORD_QTY=amount,
-                    ORD_UNPR=price,
-                )
-        elif exchange in ("NASDAQ", "NYSE", "AMEX"):
-            exchange_code = self.order_exchange_code.get(exchange)
-            current_price = self.fetch_current_price(exchange, ticker)
+                body = template.body | {"PDNO": ticker, "ORD_QTY": str(int(amount))}
+            else:
+                body = template.body | {"PDNO": ticker, "ORD_QTY": str(int(amount)), "ORD_UNPR": str(price)}
+        else:
             price = (
                 current_price + mintick * 50
                 if side == "buy"
@@ -212,39 +187,56 @@ class KoreaInvestment:
             if price < 1:
                 price = 1.0
             price = float("{:.2f}".format(price))
-            if self.base_url == BaseUrls.base_url:
-                headers |= (
-                    UsaBuyOrderHeaders(**headers)
-                    if side == "buy"
-                    else UsaSellOrderHeaders(**headers)
-                )
-            elif self.base_url == BaseUrls.paper_base_url:
-                headers |= (
-                    UsaPaperBuyOrderHeaders(**headers)
-                    if side == "buy"
-                    else UsaPaperSellOrderHeaders(**headers)
-                )
+            body = template.body | {"PDNO": ticker, "ORD_QTY": str(int(amount)), "OVRS_ORD_UNPR": str(price)}
+        return template.endpoint, body, template.headers
 
-            if order_type == "market":
-                body |= UsaOrderBody(
-                    **body,
-                    PDNO=ticker,
-                    ORD_DVSN=UsaOrderType.limit.value,
-                    ORD_QTY=amount,
-                    OVRS_ORD_UNPR=price,
-                    OVRS_EXCG_CD=exchange_code,
-                )
-            elif order_type == "limit":
-                body |= UsaOrderBody(
-                    **body,
-                    PDNO=ticker,
-                    ORD_DVSN=UsaOrderType.limit.value,
-                    ORD_QTY=amount,
-                    OVRS_ORD_UNPR=price,
-                    OVRS_EXCG_CD=exchange_code,
-                )
+    @validate_arguments
+    def create_order(
+        self,
+        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        ticker: str,
+        order_type: Literal["limit", "market"],
+        side: Literal["buy", "sell"],
+        amount: int,
+        price: int = 0,
+        mintick=0.01,
+    ):
+        current_price = None
+        if exchange in ("NASDAQ", "NYSE", "AMEX"):
+            current_price = quote_cache.get_price(
+                self.query_exchange_code[exchange].value,
+                ticker,
+                lambda: self.fetch_current_price(exchange, ticker),
+            )
+        endpoint, body, headers = self.order_request(exchange, ticker, order_type, side, amount, price, mintick, current_price)
+        if settings.KIS_HASHKEY:
+            headers = headers | {"hashkey": self.get_hashkey(body)}
         return self.post(endpoint, body, headers)
 
+    @validate_arguments
+    async def acreate_order(
+        self,
+        exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
+        ticker: str,
+        order_type: Literal["limit", "market"],
+        side: Literal["buy", "sell"],
+        amount: int,
+        price: int = 0,
+        mintick=0.01,
+    ):
+        await self.aauth()
+        current_price = None
+        if exchange in ("NASDAQ", "NYSE", "AMEX"):
+            current_price = await quote_cache.aget_price(
+                self.query_exchange_code[exchange].value,
+                ticker,
+                lambda: self.afetch_current_price(exchange, ticker),
+            )
+        endpoint, body, headers = self.order_request(exchange, ticker, order_type, side, amount, price, mintick, current_price)
+        if settings.KIS_HASHKEY:
+            headers = headers | {"hashkey": await self.aget_hashkey(body)}
+        return await self.apost(endpoint, body, headers)
+
     def create_market_buy_order(
         self,
         exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"],
@@ -278,9 +270,7 @@ class KoreaInvestment:
     def create_usa_market_buy_order(self, ticker: str, amount: int, price: int):
         return self.create_market_buy_order("usa", ticker, amount, price)
 
-    def fetch_ticker(
-        self, exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"], ticker: str
-    ):
+    def ticker_request(self, exchange: str, ticker: str) -> tuple[str, dict, dict]:
         if exchange == "KRX":
             endpoint = Endpoints.korea_ticker.value
             headers = KoreaTickerHeaders(**self.base_headers).dict()
@@ -290,7 +280,18 @@ class KoreaInvestment:
             endpoint = Endpoints.usa_ticker.value
             headers = UsaTickerHeaders(**self.base_headers).dict()
             query = UsaTickerQuery(EXCD=exchange_code, SYMB=ticker).dict()
-        ticker = self.get(endpoint, query, headers)
+        return endpoint, query, headers
+
+    def fetch_ticker(
+        self, exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"], ticker: str
+    ):
+        ticker = self.get(*self.ticker_request(exchange, ticker))
+        return ticker.get("output")
+
+    async def afetch_ticker(
+        self, exchange: Literal["KRX", "NASDAQ", "NYSE", "AMEX"], ticker: str
+    ):
+        ticker = await self.aget(*self.ticker_request(exchange, ticker))
         return ticker.get("output")
 
     def fetch_current_price(self, exchange, ticker: str):
@@ -304,6 +305,17 @@ class KoreaInvestment:
             print(traceback.format_exc())
             return None
 
+    async def afetch_current_price(self, exchange, ticker: str):
+        try:
+            if exchange == "KRX":
+                return float((await self.afetch_ticker(exchange, ticker))["stck_prpr"])
+            elif exchange in ("NASDAQ", "NYSE", "AMEX"):
+                return float((await self.afetch_ticker(exchange, ticker))["last"])
+
+        except KeyError:
+            print(traceback.format_exc())
+            return None
+
     def open_json(self, path):
         with open(path, "r") as f:
             return json.load(f)
@@ -0,0 +1,104 @@
+"""
+해외주식(NASDAQ, NYSE, AMEX) 현재가 캐시
+
+해외주식 주문은 현재가 ± mintick*50 지정가로 내기 때문에 주문마다 현재가 조회가 필요하다.
+(거래소 코드, 종목)별 현재가를 KIS_QUOTE_TTL초(1초 미만) 동안 메모리에 두고 KIS1~KIS4가 같이 쓴다.
+캐시가 비었거나 오래됐을 때 같은 종목 조회가 동시에 여러 개 들어오면 REST 조회는 한 번만 한다.
+(async 경로는 Future, 스레드 경로는 종목별 lock)
+
+KIS 실시간 시세 WebSocket(HDFSCNT0, 해외주식 실시간지연체결가)을 받고 있으면
+받은 메시지를 feed_realtime()으로 넣어주면 된다. 그러면 주문 경로에서 현재가 조회 없이 바로 가격을 계산한다.
+"""
+import time
+import asyncio
+import threading
+from typing import NamedTuple, Callable, Awaitable
+from exchange.utility import settings
+
+REALTIME_TR_ID = "HDFSCNT0"
+REALTIME_SYMBOL = 0     # RSYM : D + 거래소코드(NAS/NYS/AMS) + 종목 (예: DNASAAPL)
+REALTIME_LAST = 11      # LAST : 현재가
+
+
+class Quote(NamedTuple):
+    price: float
+    ts: float       # time.monotonic()
+    source: str     # "rest" / "ws"
+
+
+class QuoteCache:
+    def __init__(self):
+        self.quotes: dict[tuple[str, str], Quote] = {}
+        self.pending: dict[tuple[str, str], asyncio.Future] = {}
+        self.locks: dict[tuple[str, str], threading.Lock] = {}
+
+    def get(self, exchange_code: str, ticker: str, ttl: float | None = None) -> float | None:
+        ttl = settings.KIS_QUOTE_TTL if ttl is None else ttl
+        quote = self.quotes.get((exchange_code, ticker))
+        if quote is not None and time.monotonic() - quote.ts < ttl:
+            return quote.price
+        return None
+
+    def update(self, exchange_code: str, ticker: str, price: float, source: str = "ws"):
+        self.quotes[(exchange_code, ticker)] = Quote(price, time.monotonic(), source)
+
+    def feed_realtime(self, message: str) -> int:
+        """
+        실시간 시세 메시지를 캐시에 반영하고 반영한 건수를 반환. HDFSCNT0이 아니면 무시한다
+        예) 0|HDFSCNT0|001|DNASAAPL^AAPL^4^...  (암호화 여부|TR ID|건수|데이터)
+        """
+        parts = message.split("|", 3)
+        if len(parts) < 4 or parts[1] != REALTIME_TR_ID:
+            return 0
+        count = int(parts[2])
+        fields = parts[3].split("^")
+        size = len(fields) // count
+        updated = 0
+        for index in range(count):
+            record = fields[index * size:(index + 1) * size]
+            symbol = record[REALTIME_SYMBOL]
+            try:
+                price = float(record[REALTIME_LAST])
+            except (IndexError, ValueError):
+                continue
+            self.update(symbol[1:4], symbol[4:], price, "ws")
+            updated += 1
+        return updated
+
+    #region 조회 (single-flight)
+    async def aget_price(self, exchange_code: str, ticker: str, fetch: Callable[[], Awaitable[float | None]], ttl: float | None = None) -> float | None:
+        price = self.get(exchange_code, ticker, ttl)
+        if price is not None:
+            return price
+        key = (exchange_code, ticker)
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._afetch(key, fetch))
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        # 먼저 조회를 시작한 요청이 취소돼도 같이 기다리던 요청은 결과를 받는다
+        return await asyncio.shield(future)
+
+    async def _afetch(self, key: tuple[str, str], fetch: Callable[[], Awaitable[float | None]]) -> float | None:
+        price = await fetch()
+        if price is not None:
+            self.update(*key, price, "rest")
+        return price
+
+    def get_price(self, exchange_code: str, ticker: str, fetch: Callable[[], float | None], ttl: float | None = None) -> float | None:
+        price = self.get(exchange_code, ticker, ttl)
+        if price is not None:
+            return price
+        key = (exchange_code, ticker)
+        with self.locks.setdefault(key, threading.Lock()):
+            price = self.get(exchange_code, ticker, ttl)
+            if price is not None:
+                return price
+            price = fetch()
+            if price is not None:
+                self.update(exchange_code, ticker, price, "rest")
+            return price
+    #endregion 조회 (single-flight)
+
+
+quote_cache = QuoteCache()
@@ -0,0 +1,392 @@
+"""
+KIS 실시간 체결통보 WebSocket (KIS_WS=true)
+
+계좌(KIS1~KIS4)마다 WebSocket 하나를 열어서 국내(H0STCNI0) / 해외(H0GSCNI0) 체결통보를 구독하고,
+주문번호별 접수/체결 상태를 메모리(OrderBook)에 들고 있는다. 주문 후 체결 확인을 위해
+REST로 주문 조회를 반복할 필요가 없다.
+
+- 접속키 : POST /oauth2/Approval (appkey, secretkey) -> approval_key
+- 구독 응답으로 받은 key / iv로 체결통보(AES-256-CBC, base64)를 복호화한다.
+- PINGPONG 메시지는 그대로 돌려보낸다.
+- 연결이 끊기면 RECONNECT_DELAYS 간격으로 다시 연결하고 다시 구독한다.
+- KIS_WS_QUOTES(예: ["DNASAAPL"])가 있으면 해외주식 실시간 시세(HDFSCNT0)도 구독해서 현재가 캐시에 넣는다.
+
+체결통보의 tr_key는 HTS ID이므로 KIS{n}_HTS_ID 설정이 있는 계좌만 연결한다.
+로컬 테스트 : python tools/kis_ws_standin.py selftest
+"""
+import time
+import asyncio
+import traceback
+from base64 import b64decode
+from collections import deque
+from typing import NamedTuple
+import httpx
+import orjson
+from loguru import logger
+from exchange.stock.quote import quote_cache, REALTIME_TR_ID as QUOTE_TR_ID
+
+WS_URL = "ws://ops.koreainvestment.com:21000"
+PAPER_WS_URL = "ws://ops.koreainvestment.com:31000"
+APPROVAL_TTL = 12 * 60 * 60         # 접속키 유효기간 24시간, 절반이 지나면 새로 받는다
+RECONNECT_DELAYS = (1, 2, 5, 10, 30)
+MAX_FILLS = 1000                    # 계좌별로 보관할 최근 체결 수
+MAX_ORDERS = 1000                   # 계좌별로 보관할 주문 수, 넘으면 끝난 주문부터 오래된 순으로 정리
+ORDER_TTL = 24 * 60 * 60            # 마지막 통보 후 이 시간이 지난 주문은 정리 (통보 없이 만료된 주문 등)
+
+NOTICE_TR_IDS = {
+    # (paper, 국내 여부) -> tr_id
+    (False, True): "H0STCNI0",
+    (True, True): "H0STCNI9",
+    (False, False): "H0GSCNI0",
+    (True, False): "H0GSCNI9",
+}
+
+# 체결통보 필드 위치 ("^" 구분)
+KOREA_FIELDS = {"order_no": 2, "original_order_no": 3, "side": 4, "revise": 5, "ticker": 8, "qty": 9, "price": 10, "time": 11, "refused": 12, "filled": 13, "order_qty": 16}
+USA_FIELDS = {"order_no": 2, "original_order_no": 3, "side": 4, "revise": 5, "ticker": 7, "qty": 8, "price": 9, "time": 10, "refused": 11, "filled": 12, "order_qty": 15}
+
+
+def decrypt(key: str, iv: str, cipher_text: str) -> str:
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    decryptor = Cipher(algorithms.AES(key.encode()), modes.CBC(iv.encode())).decryptor()
+    data = decryptor.update(b64decode(cipher_text)) + decryptor.finalize()
+    unpadder = padding.PKCS7(128).unpadder()
+    return (unpadder.update(data) + unpadder.finalize()).decode()
+
+
+def order_key(order_no: str) -> str:
+    # REST 응답(ODNO)과 체결통보의 주문번호 자릿수가 달라도 같은 주문으로 본다
+    return order_no.lstrip("0") or "0"
+
+
+class Notice(NamedTuple):
+    kis_id: str
+    market: str             # "KRX" / "US"
+    order_no: str
+    original_order_no: str
+    ticker: str
+    side: str               # "buy" / "sell"
+    qty: float              # 체결수량 (접수 통보면 0)
+    price: float            # 체결단가
+    order_qty: float
+    time: str
+    filled: bool            # True : 체결 / False : 주문, 정정, 취소, 거부 접수
+    refused: bool
+    revise: str             # "0" 정상 / "1" 정정 / "2" 취소
+
+    @classmethod
+    def parse(cls, kis_id: str, market: str, record: list[str]) -> "Notice":
+        fields = KOREA_FIELDS if market == "KRX" else USA_FIELDS
+        number = lambda name: float(record[fields[name]] or 0)
+        filled = record[fields["filled"]] == "2"
+        return cls(
+            kis_id,
+            market,
+            record[fields["order_no"]],
+            record[fields["original_order_no"]],
+            record[fields["ticker"]],
+            "sell" if record[fields["side"]] == "01" else "buy",
+            number("qty") if filled else 0.0,
+            number("price") if filled else 0.0,
+            number("order_qty"),
+            record[fields["time"]],
+            filled,
+            record[fields["refused"]] == "1",
+            record[fields["revise"]],
+        )
+
+
+class OrderState:
+    __slots__ = ("order_no", "ticker", "side", "order_qty", "filled_qty", "cost", "status", "updated", "event")
+
+    def __init__(self, order_no: str, ticker: str, side: str, order_qty: float):
+        self.order_no = order_no
+        self.ticker = ticker
+        self.side = side
+        self.order_qty = order_qty
+        self.filled_qty = 0.0
+        self.cost = 0.0
+        self.status = "accepted"    # accepted / partial / filled / canceled / refused
+        self.updated = time.time()
+        self.event = asyncio.Event()
+
+    @property
+    def average(self) -> float | None:
+        return self.cost / self.filled_qty if self.filled_qty else None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("filled", "canceled", "refused")
+
+    def dict(self) -> dict:
+        return {
+            "order_no": self.order_no, "ticker": self.ticker, "side": self.side, "order_qty": self.order_qty,
+            "filled_qty": self.filled_qty, "average": self.average, "status": self.status, "updated": self.updated,
+        }
+
+
+class OrderBook:
+    """
+    계좌 하나의 주문 / 체결 상태. event loop에서만 수정한다
+    """
+
+    def __init__(self, kis_id: str):
+        self.kis_id = kis_id
+        self.orders: dict[str, OrderState] = {}
+        self.fills: deque[Notice] = deque(maxlen=MAX_FILLS)
+        self.waiting: dict[str, int] = {}   # wait() 중인 주문번호 -> 대기 수 (정리 대상에서 제외)
+
+    def order(self, order_no: str) -> OrderState | None:
+        return self.orders.get(order_key(order_no))
+
+    def apply(self, notice: Notice) -> OrderState:
+        key = order_key(notice.order_no)
+        state = self.orders.get(key)
+        if state is None:
+            state = self.orders[key] = OrderState(notice.order_no, notice.ticker, notice.side, notice.order_qty)
+            self.prune()
+        elif not state.ticker:
+            # wait()가 먼저 만든 자리
+            state.ticker, state.side, state.order_qty = notice.ticker, notice.side, notice.order_qty
+        if notice.filled:
+            self.fills.append(notice)
+            state.filled_qty += notice.qty
+            state.cost += notice.qty * notice.price
+            state.status = "filled" if state.order_qty and state.filled_qty >= state.order_qty else "partial"
+        elif notice.refused:
+            state.status = "refused"
+        elif notice.revise == "2":
+            state.status = "canceled"
+            # 취소 주문의 원주문도 취소 처리
+            original = self.orders.get(order_key(notice.original_order_no)) if notice.original_order_no else None
+            if original is not None and not original.done:
+                original.status = "canceled"
+                original.event.set()
+        state.updated = time.time()
+        if state.done:
+            state.event.set()
+        return state
+
+    async def wait(self, order_no: str, timeout: float | None = None) -> OrderState | None:
+        """
+        주문이 끝날 때까지(전량 체결 / 취소 / 거부) 기다린다. timeout이 지나면 그때까지의 상태를 반환
+        """
+        key = order_key(order_no)
+        state = self.orders.get(key)
+        if state is None:
+            # 체결통보가 REST 응답보다 늦게 오는 경우를 위해 자리를 먼저 만든다
+            state = self.orders[key] = OrderState(order_no, "", "", 0.0)
+            self.prune()
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        try:
+            await asyncio.wait_for(state.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.waiting[key] -= 1
+            if not self.waiting[key]:
+                del self.waiting[key]
+                # 통보가 한 번도 오지 않은 자리는 남겨두지 않는다
+                if not state.ticker and self.orders.get(key) is state:
+                    del self.orders[key]
+        return state
+
+    def prune(self):
+        """
+        fills처럼 주문도 개수 / 나이로 정리한다. wait() 중인 주문은 남긴다
+        """
+        now = time.time()
+        for key in [key for key, state in self.orders.items() if now - state.updated > ORDER_TTL and key not in self.waiting]:
+            del self.orders[key]
+        excess = len(self.orders) - MAX_ORDERS
+        if excess > 0:
+            done = sorted((state.updated, key) for key, state in self.orders.items() if state.done and key not in self.waiting)
+            for _, key in done[:excess]:
+                del self.orders[key]
+
+    def status(self) -> dict:
+        return {
+            "orders": [state.dict() for state in self.orders.values()],
+            "fills": [notice._asdict() for notice in list(self.fills)[-50:]],
+        }
+
+
+class KisRealtime:
+    """
+    계좌 하나의 체결통보 WebSocket 연결
+    """
+
+    def __init__(self, kis_id: str, key: str, secret: str, hts_id: str, paper: bool, rest_url: str, ws_url: str, quotes: list[str] | None = None):
+        self.kis_id = kis_id
+        self.key = key
+        self.secret = secret
+        self.hts_id = hts_id
+        self.rest_url = rest_url
+        self.ws_url = ws_url
+        self.quotes = quotes or []
+        self.notice_tr_ids = {NOTICE_TR_IDS[(paper, True)]: "KRX", NOTICE_TR_IDS[(paper, False)]: "US"}
+        self.book = OrderBook(kis_id)
+        self.ciphers: dict[str, tuple[str, str]] = {}   # tr_id -> (key, iv)
+        self.approval_key: str | None = None
+        self.approval_ts = 0.0
+        self.connected = False
+        self.connects = 0
+        self.task = None
+
+    async def get_approval_key(self) -> str:
+        if self.approval_key is None or time.time() - self.approval_ts > APPROVAL_TTL:
+            data = {"grant_type": "client_credentials", "appkey": self.key, "secretkey": self.secret}
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = (await client.post(f"{self.rest_url}/oauth2/Approval", json=data)).json()
+            if "approval_key" not in response:
+                raise Exception(response)
+            self.approval_key = response["approval_key"]
+            self.approval_ts = time.time()
+        return self.approval_key
+
+    def subscribe_message(self, approval_key: str, tr_id: str, tr_key: str) -> str:
+        return orjson.dumps({
+            "header": {"approval_key": approval_key, "custtype": "P", "tr_type": "1", "content-type": "utf-8"},
+            "body": {"input": {"tr_id": tr_id, "tr_key": tr_key}},
+        }).decode()
+
+    #region 메시지 처리
+    async def handle(self, ws, message: str | bytes):
+        if isinstance(message, bytes):
+            message = message.decode()
+        if message[0] in "01":
+            self.handle_data(message)
+            return
+        data = orjson.loads(message)
+        header = data.get("header", {})
+        tr_id = header.get("tr_id")
+        if tr_id == "PINGPONG":
+            await ws.send(message)
+            return
+        body = data.get("body", {})
+        if body.get("rt_cd") not in (None, "0"):
+            logger.error(f"[kis-ws] {self.kis_id} {tr_id} 구독 실패 : {body.get('msg1')}")
+            if body.get("msg_cd") in ("OPSP0011", "OPSP8996"):
+                # 접속키 오류 -> 다음 연결 때 새로 받는다
+                self.approval_key = None
+            return
+        output = body.get("output") or {}
+        if output.get("key") and output.get("iv"):
+            self.ciphers[tr_id] = (output["key"], output["iv"])
+
+    def handle_data(self, message: str):
+        encrypted, tr_id, count, data = message.split("|", 3)
+        if tr_id == QUOTE_TR_ID:
+            quote_cache.feed_realtime(message)
+            return
+        market = self.notice_tr_ids.get(tr_id)
+        if market is None:
+            return
+        if encrypted == "1":
+            cipher = self.ciphers.get(tr_id)
+            if cipher is None:
+                logger.error(f"[kis-ws] {self.kis_id} {tr_id} 복호화 키 없음")
+                return
+            data = decrypt(*cipher, data)
+        fields = data.split("^")
+        count = int(count)
+        size = len(fields) // count
+        for index in range(count):
+            notice = Notice.parse(self.kis_id, market, fields[index * size:(index + 1) * size])
+            state = self.book.apply(notice)
+            if notice.filled:
+                logger.info(f"[kis-ws] {self.kis_id} 체결 {notice.ticker} {notice.side} {notice.qty}@{notice.price} ({state.filled_qty}/{state.order_qty})")
+    #endregion 메시지 처리
+
+    async def connect_once(self):
+        import websockets
+
+        approval_key = await self.get_approval_key()
+        async with websockets.connect(self.ws_url, ping_interval=None) as ws:
+            for tr_id in self.notice_tr_ids:
+                await ws.send(self.subscribe_message(approval_key, tr_id, self.hts_id))
+            for tr_key in self.quotes:
+                await ws.send(self.subscribe_message(approval_key, QUOTE_TR_ID, tr_key))
+            self.connected = True
+            self.connects += 1
+            logger.info(f"[kis-ws] {self.kis_id} 연결 (체결통보 {list(self.notice_tr_ids)}, 시세 {len(self.quotes)}종목)")
+            try:
+                async for message in ws:
+                    try:
+                        await self.handle(ws, message)
+                    except Exception:
+                        logger.error(f"[kis-ws] {self.kis_id} 메시지 처리 실패\n{traceback.format_exc()}")
+            finally:
+                self.connected = False
+
+    async def run(self):
+        failures = 0
+        while True:
+            started = time.monotonic()
+            try:
+                await self.connect_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[kis-ws] {self.kis_id} 연결 오류 : {e!r}")
+            # 오래 연결돼 있다가 끊긴 경우는 바로 다시 연결한다
+            failures = 0 if time.monotonic() - started > RECONNECT_DELAYS[-1] else failures + 1
+            await asyncio.sleep(RECONNECT_DELAYS[min(failures, len(RECONNECT_DELAYS) - 1)] if failures else 0.1)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+class KisRealtimeManager:
+    def __init__(self):
+        self.clients: dict[str, KisRealtime] = {}
+
+    def book(self, kis_number: int | str) -> OrderBook | None:
+        client = self.clients.get(f"KIS{kis_number}" if isinstance(kis_number, int) else kis_number)
+        return client.book if client is not None else None
+
+    async def start(self):
+        from exchange.utility import settings
+        from exchange.stock.schemas import BaseUrls
+
+        if not settings.KIS_WS:
+            return
+        settings_dict = settings.dict()
+        for number in (1, 2, 3, 4):
+            kis_id = f"KIS{number}"
+            key, secret, hts_id = (settings_dict.get(f"{kis_id}_{field}") for field in ("KEY", "SECRET", "HTS_ID"))
+            if not (key and secret and hts_id):
+                continue
+            paper = number == 4   # KoreaInvestment와 같이 KIS4는 모의투자
+            client = KisRealtime(
+                kis_id, key, secret, hts_id, paper,
+                BaseUrls.paper_base_url.value if paper else BaseUrls.base_url.value,
+                PAPER_WS_URL if paper else WS_URL,
+                settings.KIS_WS_QUOTES,
+            )
+            client.start()
+            self.clients[kis_id] = client
+
+    async def stop(self):
+        await asyncio.gather(*[client.stop() for client in self.clients.values()])
+        self.clients.clear()
+
+    def status(self) -> dict:
+        return {
+            kis_id: {"connected": client.connected, "connects": client.connects} | client.book.status()
+            for kis_id, client in self.clients.items()
+        }
+
+
+kis_realtime = KisRealtimeManager()
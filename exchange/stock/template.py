@@ -0,0 +1,80 @@
+"""
+KIS 주문 요청 템플릿
+
+계좌(KoreaInvestment 객체)마다 (거래소, side, order_type) 조합별로 endpoint / headers / body를
+미리 만들어 둔다. 주문할 때는 body 템플릿에 종목코드, 수량, 가격만 얕게 덮어쓰고
+headers는 만들어 둔 것을 그대로 보낸다. (deepcopy, pydantic 모델 생성 없음)
+
+실전/모의(paper) 구분은 계좌의 base_url로 정해지고, 토큰이 바뀌면 템플릿을 다시 만든다.
+기존 pydantic 모델(KoreaBuyOrderHeaders, UsaOrderBody 등)과 결과가 같은지는
+tools/bench_kis_order.py verify 로 모든 조합을 비교한다.
+"""
+from types import MappingProxyType
+from typing import NamedTuple, Mapping
+from exchange.stock.schemas import (
+    BaseUrls,
+    Endpoints,
+    TransactionId,
+    ExchangeCode,
+    KoreaOrderType,
+    UsaOrderType,
+)
+
+MARKETS = ("KRX", "NASDAQ", "NYSE", "AMEX")
+SIDES = ("buy", "sell")
+ORDER_TYPES = ("market", "limit")
+
+TRANSACTION_IDS = {
+    # (paper, KRX 여부, side)
+    (False, True, "buy"): TransactionId.korea_buy.value,
+    (False, True, "sell"): TransactionId.korea_sell.value,
+    (True, True, "buy"): TransactionId.korea_paper_buy.value,
+    (True, True, "sell"): TransactionId.korea_paper_sell.value,
+    (False, False, "buy"): TransactionId.usa_buy.value,
+    (False, False, "sell"): TransactionId.usa_sell.value,
+    (True, False, "buy"): TransactionId.usa_paper_buy.value,
+    (True, False, "sell"): TransactionId.usa_paper_sell.value,
+}
+
+ORDER_EXCHANGE_CODES = {
+    "NASDAQ": ExchangeCode.NASDAQ.value,
+    "NYSE": ExchangeCode.NYSE.value,
+    "AMEX": ExchangeCode.AMEX.value,
+}
+
+
+class OrderTemplate(NamedTuple):
+    endpoint: str
+    headers: Mapping[str, str]  # 읽기 전용 (그대로 요청에 사용)
+    body: dict                  # 종목코드/수량/가격 자리는 빈 문자열. 덮어쓴 새 dict를 만든다
+
+
+def build_order_templates(base_url: str, base_headers: dict, account_number: str, account_code: str) -> dict[tuple[str, str, str], OrderTemplate]:
+    """
+    (거래소, side, order_type) -> OrderTemplate
+    """
+    paper = base_url == BaseUrls.paper_base_url.value
+    templates = {}
+    for market in MARKETS:
+        is_korea = market == "KRX"
+        for side in SIDES:
+            headers = MappingProxyType(base_headers | {"tr_id": TRANSACTION_IDS[(paper, is_korea, side)]})
+            for order_type in ORDER_TYPES:
+                body = {"CANO": account_number, "ACNT_PRDT_CD": account_code, "PDNO": "", "ORD_QTY": ""}
+                if is_korea:
+                    endpoint = Endpoints.korea_order.value
+                    if order_type == "market":
+                        body |= {"ORD_DVSN": KoreaOrderType.market.value, "ORD_UNPR": "0"}
+                    else:
+                        body |= {"ORD_DVSN": KoreaOrderType.limit.value, "ORD_UNPR": ""}
+                else:
+                    # 해외주식은 시장가도 현재가 기준 지정가로 주문한다
+                    endpoint = Endpoints.usa_order.value
+                    body |= {
+                        "ORD_DVSN": UsaOrderType.limit.value,
+                        "OVRS_ORD_UNPR": "",
+                        "OVRS_EXCG_CD": ORDER_EXCHANGE_CODES[market],
+                        "ORD_SVR_DVSN_CD": "0",
+                    }
+                templates[(market, side, order_type)] = OrderTemplate(endpoint, headers, body)
+    return templates
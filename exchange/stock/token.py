@@ -0,0 +1,153 @@
+"""
+KIS 접근 토큰 관리 (KIS1~KIS4)
+
+- 토큰과 만료 시각(숫자)을 메모리에 들고 있고, 주문 경로에서는 메모리만 확인한다.
+  (DB 조회, 만료 문자열 파싱, 토큰 확인용 시세 조회 없음)
+- 서버 시작 시 store.db의 auth 테이블을 한 번 읽어서 메모리에 올린다.
+- 백그라운드 task가 만료 REFRESH_AHEAD초 전에 새 토큰을 발급받는다.
+- 계좌마다 lock이 있어서 동시에 여러 주문이 들어와도 /oauth2/tokenP는 한 번만 호출된다.
+- 새 토큰은 event loop에서 DB에 저장한다. (store.db 연결은 만든 스레드에서만 쓸 수 있음)
+"""
+import time
+import asyncio
+import threading
+import traceback
+from datetime import datetime
+from typing import NamedTuple
+import httpx
+from loguru import logger
+from exchange.stock.schemas import BaseUrls
+
+REFRESH_AHEAD = 60 * 60     # 만료 1시간 전에 갱신 (기존 check_auth 기준과 같음)
+CHECK_INTERVAL = 60         # 갱신 필요 여부 확인 주기(초)
+EXPIRED_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class KisToken(NamedTuple):
+    access_token: str
+    expires: float          # epoch 초
+    expired_text: str       # KIS 응답 원문 (DB 저장용)
+
+    def valid(self, ahead: float = 0.0) -> bool:
+        return time.time() < self.expires - ahead
+
+
+class KisAccount(NamedTuple):
+    kis_id: str
+    key: str
+    secret: str
+
+
+def parse_expired(text: str) -> float:
+    return datetime.strptime(text, EXPIRED_FORMAT).timestamp()
+
+
+class KisTokenManager:
+    def __init__(self):
+        self.tokens: dict[str, KisToken] = {}
+        self.accounts: dict[str, KisAccount] = {}
+        self.locks: dict[str, threading.Lock] = {}
+        self.unsaved: dict[str, KisToken] = {}
+        self.session = httpx.Client(timeout=10.0)
+        self.loaded = False
+        self.task = None
+
+    def register(self, kis_id: str, key: str, secret: str):
+        self.accounts[kis_id] = KisAccount(kis_id, key, secret)
+        self.locks.setdefault(kis_id, threading.Lock())
+
+    #region 주문 경로
+    def access_token(self, kis_id: str) -> str:
+        """
+        유효한 토큰을 반환. 메모리에 없거나 만료됐을 때만 (계좌당 한 번) 새로 발급받는다.
+        """
+        token = self.tokens.get(kis_id)
+        if token is not None and token.valid():
+            return token.access_token
+        with self.locks[kis_id]:
+            token = self.tokens.get(kis_id)
+            if token is not None and token.valid():
+                return token.access_token
+            if not self.loaded:
+                # 서버 시작 전(스크립트 등)에 호출된 경우에만 DB에서 직접 읽는다
+                self.load()
+                token = self.tokens.get(kis_id)
+                if token is not None and token.valid(REFRESH_AHEAD):
+                    return token.access_token
+            return self.issue(self.accounts[kis_id]).access_token
+
+    def invalidate(self, kis_id: str, access_token: str):
+        # KIS가 토큰 만료(EGW00123 등)로 거절한 경우. 이미 다른 토큰으로 바뀌었으면 그대로 둔다
+        token = self.tokens.get(kis_id)
+        if token is not None and token.access_token == access_token:
+            self.tokens.pop(kis_id, None)
+    #endregion 주문 경로
+
+    def issue(self, account: KisAccount) -> KisToken:
+        data = {"grant_type": "client_credentials", "appkey": account.key, "appsecret": account.secret}
+        response = self.session.post(f"{BaseUrls.base_url.value}/oauth2/tokenP", json=data).json()
+        if "access_token" not in response:
+            raise Exception(response)
+        token = KisToken(response["access_token"], parse_expired(response["access_token_token_expired"]), response["access_token_token_expired"])
+        self.tokens[account.kis_id] = token
+        self.unsaved[account.kis_id] = token
+        logger.info(f"[kis] {account.kis_id} 토큰 발급 (만료 {token.expired_text})")
+        return token
+
+    def refresh(self, kis_id: str):
+        with self.locks[kis_id]:
+            token = self.tokens.get(kis_id)
+            if token is None or not token.valid(REFRESH_AHEAD):
+                self.issue(self.accounts[kis_id])
+
+    #region DB
+    def load(self):
+        from exchange.database import db
+
+        self.loaded = True
+        for kis_id in ("KIS1", "KIS2", "KIS3", "KIS4"):
+            auth = db.get_auth(kis_id)
+            if auth is None or auth[0] == "nothing":
+                continue
+            try:
+                self.tokens.setdefault(kis_id, KisToken(auth[0], parse_expired(auth[1]), auth[1]))
+            except ValueError:
+                continue
+
+    def save(self):
+        from exchange.database import db
+
+        unsaved, self.unsaved = self.unsaved, {}
+        for kis_id, token in unsaved.items():
+            db.set_auth(kis_id, token.access_token, token.expired_text)
+    #endregion DB
+
+    async def start(self):
+        self.load()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            for kis_id in list(self.accounts):
+                token = self.tokens.get(kis_id)
+                if token is None or not token.valid(REFRESH_AHEAD):
+                    try:
+                        await asyncio.to_thread(self.refresh, kis_id)
+                    except Exception:
+                        logger.error(f"[kis] {kis_id} 토큰 갱신 실패\n{traceback.format_exc()}")
+            if self.unsaved:
+                self.save()
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.unsaved:
+            self.save()
+
+
+token_manager = KisTokenManager()
@@ -0,0 +1,182 @@
+"""
+Hatiko 계열 전략 엔진
+
+- order_name은 불변 dict(SIGNALS)에서 한 번만 Signal(kind, side, level)로 해석한다. (리스트 순회 없음)
+- 전략(plugin)마다 kind -> handler 표를 가지고 있어서 dispatch는 dict 조회 한 번이다.
+- 재시도는 handler 전체가 아니라 step(거래소 호출) 단위로 한다.
+  N번째 step이 실패해도 이미 끝난 1..N-1 step(주문 포함)은 다시 실행하지 않는다.
+- handler가 실패하면 on_error(또는 로그) 후 {"result": "error", "error": 메시지}를 돌려준다. (시그널 없음 "ignore"와 구분)
+
+사용 예)
+    engine = StrategyEngine()
+    hatiko = engine.plugin("hatiko", HATIKO_SIGNALS, retry=RetryPolicy(tries=5))
+
+    @hatiko.handler("near")
+    async def near(ctx: StrategyContext):
+        bot = await ctx.step(get_bot, ctx.order_info.exchange)
+        ...
+
+    await engine.dispatch("hatiko", order_info, state=hatikoInfo)
+"""
+import asyncio
+from types import MappingProxyType
+from typing import NamedTuple, Callable
+from loguru import logger
+
+UNKNOWN = "unknown"  # 표에 없는 order_name
+LEVELS = (1, 2, 3, 4)
+SIDES = (("Long", "L"), ("Short", "S"))
+
+
+class Signal(NamedTuple):
+    name: str           # 원래 order_name
+    kind: str           # near / entry / next / next_close / close / ignore / kill / kctrend_entry / kctrend_close
+    side: str | None    # "Long" / "Short" (HatikoInfo 변수 이름에 그대로 쓰인다. 예: nearLong1_dic)
+    level: int | None   # 1~4
+
+
+def _hatiko_signals() -> MappingProxyType:
+    table = {}
+    for side, short in SIDES:
+        for level in LEVELS:
+            table[f"near{side}{level}"] = Signal(f"near{side}{level}", "near", side, level)
+            table[f"{side}{level}"] = Signal(f"{side}{level}", "entry", side, level)
+            table[f"NextCandle_{short}{level}"] = Signal(f"NextCandle_{short}{level}", "next", side, level)
+            table[f"TakeProfit_near{short}{level}"] = Signal(f"TakeProfit_near{short}{level}", "close", side, level)
+            table[f"TakeProfit_{short}{level}"] = Signal(f"TakeProfit_{short}{level}", "close", side, level)
+        table[f"NextCandle_{short}F"] = Signal(f"NextCandle_{short}F", "next_close", side, None)
+        table[f"close {side}s on open"] = Signal(f"close {side}s on open", "close", side, None)
+        table[f"close_{side}s"] = Signal(f"close_{side}s", "close", side, None)
+        table[f"{side}_Flag"] = Signal(f"{side}_Flag", "ignore", side, None)
+        table[f"{side}_Flag_Cancel"] = Signal(f"{side}_Flag_Cancel", "ignore", side, None)
+    table["Kill_Confirm"] = Signal("Kill_Confirm", "kill", None, None)
+    return MappingProxyType(table)
+
+
+def _kctrend_signals() -> MappingProxyType:
+    # 켈트너 + Hatiko(Upbit) 전략은 Long만 사용하고, TakeProfit 이름에 '_'가 없다.
+    table = {
+        "kctrend Long": Signal("kctrend Long", "kctrend_entry", "Long", None),
+        "kctrend Long Close": Signal("kctrend Long Close", "kctrend_close", "Long", None),
+        "close Longs on open": Signal("close Longs on open", "close", "Long", None),
+        "TakeProfitL1": Signal("TakeProfitL1", "close", "Long", 1),
+    }
+    for level in LEVELS:
+        table[f"Long{level}"] = Signal(f"Long{level}", "entry", "Long", level)
+    for level in LEVELS[1:]:
+        table[f"TakeProfitL{level}"] = Signal(f"TakeProfitL{level}", "ignore", "Long", level)
+    return MappingProxyType(table)
+
+
+HATIKO_SIGNALS = _hatiko_signals()
+KCTREND_SIGNALS = _kctrend_signals()
+
+
+def parse_signal(order_name: str, signals: MappingProxyType = HATIKO_SIGNALS) -> Signal:
+    signal = signals.get(order_name)
+    return signal if signal is not None else Signal(order_name, UNKNOWN, None, None)
+
+
+class RetryPolicy(NamedTuple):
+    tries: int = 1
+    delay: float = 0.0
+    retry_on: tuple = (Exception,)
+
+    async def call(self, func, *args, **kwargs):
+        for attempt in range(1, self.tries + 1):
+            try:
+                result = func(*args, **kwargs)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                return result
+            except self.retry_on as e:
+                if attempt >= self.tries:
+                    raise
+                logger.error(f"[strategy] {getattr(func, '__name__', func)} 재시도 {attempt}/{self.tries} : {e}")
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+
+
+ONCE = RetryPolicy()
+
+
+class Handler(NamedTuple):
+    func: Callable
+    retry: RetryPolicy
+
+
+class StrategyContext:
+    """
+    handler 한 번 실행에 필요한 값 묶음. step()으로 감싼 호출만 재시도된다.
+    """
+    __slots__ = ("plugin", "signal", "order_info", "state", "background_tasks", "retry")
+
+    def __init__(self, plugin: "Strategy", signal: Signal, order_info, state, background_tasks, retry: RetryPolicy):
+        self.plugin = plugin
+        self.signal = signal
+        self.order_info = order_info
+        self.state = state
+        self.background_tasks = background_tasks
+        self.retry = retry
+
+    @property
+    def options(self) -> MappingProxyType:
+        return self.plugin.options
+
+    async def step(self, func, *args, retry: RetryPolicy | None = None, **kwargs):
+        return await (retry or self.retry).call(func, *args, **kwargs)
+
+
+class Strategy:
+    """
+    전략 하나(plugin). signal 표, kind별 handler, 에러 처리, 전략별 옵션을 가진다.
+    """
+    def __init__(self, name: str, signals: MappingProxyType, retry: RetryPolicy = ONCE, **options):
+        self.name = name
+        self.signals = signals
+        self.retry = retry
+        self.options = MappingProxyType(options)
+        self.handlers: dict[str, Handler] = {}
+        self.on_error = None
+
+    def handler(self, *kinds: str, retry: RetryPolicy | None = None):
+        def decorator(func):
+            for kind in kinds:
+                self.handlers[kind] = Handler(func, retry or self.retry)
+            return func
+        return decorator
+
+    def error_handler(self, func):
+        self.on_error = func
+        return func
+
+    def parse(self, order_name: str) -> Signal:
+        return parse_signal(order_name, self.signals)
+
+    async def dispatch(self, order_info, state=None, background_tasks=None):
+        signal = self.parse(order_info.order_name)
+        handler = self.handlers.get(signal.kind) or self.handlers.get(UNKNOWN)
+        if handler is None:
+            return {"result": "ignore"}
+        ctx = StrategyContext(self, signal, order_info, state, background_tasks, handler.retry)
+        try:
+            result = await handler.func(ctx)
+        except Exception as e:
+            if self.on_error is None:
+                logger.exception(f"[{self.name}] {signal.name} 처리 실패")
+            else:
+                self.on_error(ctx, e)
+            return {"result": "error", "error": str(e)}
+        return result if result is not None else {"result": "success"}
+
+
+class StrategyEngine:
+    def __init__(self):
+        self.plugins: dict[str, Strategy] = {}
+
+    def plugin(self, name: str, signals: MappingProxyType, retry: RetryPolicy = ONCE, **options) -> Strategy:
+        self.plugins[name] = Strategy(name, signals, retry, **options)
+        return self.plugins[name]
+
+    async def dispatch(self, name: str, order_info, state=None, background_tasks=None):
+        return await self.plugins[name].dispatch(order_info, state, background_tasks)
@@ -0,0 +1,80 @@
+"""
+두 거래소 동시 주문 (/hedge, /arbitrage)
+
+두 leg를 같은 수량으로 동시에 주문하고(각각 스레드에서 실행), 한쪽만 실패하면
+성공한 쪽을 반대 주문으로 되돌린다(unwind). 둘 다 실패하면 되돌릴 것이 없다.
+leg 시차(skew)는 두 주문 응답 시각의 차이(ms)로, 헷지되지 않은 채로 있었던 시간이다.
+
+기록(PocketBase 등)은 주문이 끝난 뒤 호출하는 쪽에서 백그라운드로 남긴다.
+"""
+import time
+import asyncio
+from typing import NamedTuple, Callable
+from loguru import logger
+
+
+class Leg(NamedTuple):
+    name: str                           # 예: "BINANCE short"
+    execute: Callable[[], dict]         # 주문 (동기 함수, 스레드에서 실행)
+    unwind: Callable[[dict], dict] | None = None  # 반대 주문. execute 결과를 받는다
+
+
+class LegResult(NamedTuple):
+    name: str
+    result: dict | None
+    error: Exception | None
+    started: float
+    finished: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class TwoLegResult(NamedTuple):
+    first: LegResult
+    second: LegResult
+    unwound: LegResult | None = None    # 한쪽 실패로 되돌린 leg의 반대 주문 결과
+
+    @property
+    def ok(self) -> bool:
+        return self.first.ok and self.second.ok
+
+    @property
+    def skew_ms(self) -> float:
+        return round(abs(self.first.finished - self.second.finished) * 1000, 1)
+
+    @property
+    def error(self) -> Exception | None:
+        return self.first.error or self.second.error
+
+
+async def run_leg(leg: Leg) -> LegResult:
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(leg.execute)
+    except Exception as e:
+        return LegResult(leg.name, None, e, started, time.perf_counter())
+    return LegResult(leg.name, result, None, started, time.perf_counter())
+
+
+async def execute_two_legs(first: Leg, second: Leg, concurrent: bool = True) -> TwoLegResult:
+    """
+    두 leg를 동시에 주문. concurrent=False면 (같은 거래소 객체를 쓰는 경우 등) 순서대로 주문
+    """
+    if concurrent:
+        first_result, second_result = await asyncio.gather(run_leg(first), run_leg(second))
+    else:
+        first_result = await run_leg(first)
+        second_result = await run_leg(second)
+
+    unwound = None
+    for done, leg, failed in ((first_result, first, second_result), (second_result, second, first_result)):
+        if done.ok and not failed.ok and leg.unwind is not None:
+            logger.error(f"[two-leg] {failed.name} 실패 -> {done.name} 되돌림 : {failed.error}")
+            unwound = await run_leg(Leg(f"{leg.name} unwind", lambda leg=leg, done=done: leg.unwind(done.result)))
+            if not unwound.ok:
+                logger.error(f"[two-leg] {done.name} 되돌림 실패 : {unwound.error}")
+    result = TwoLegResult(first_result, second_result, unwound)
+    logger.info(f"[two-leg] {first.name} / {second.name} : ok={result.ok}, skew={result.skew_ms}ms")
+    return result
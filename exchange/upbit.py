@@ -1,18 +1,21 @@
-from exchange.pexchange import ccxt, ccxt_async
+import ccxt
+from exchange.clients import MarketClients
 from exchange.database import db
 from exchange.model import MarketOrder
+from exchange.market_cache import cached_price
 import exchange.error as error
 
 
-class Upbit:
+class Upbit(MarketClients):
     def __init__(self, key, secret):
-        self.client = ccxt.upbit(
+        self.setup_clients(
+            ccxt.upbit,
             {
                 "apiKey": key,
                 "secret": secret,
-            }
+            },
+            ("spot",),
         )
-        self.client.load_markets()
         self.order_info: MarketOrder = None
 
     def init_info(self, order_info: MarketOrder):
@@ -23,7 +26,7 @@ class Upbit:
         if order_info.amount is not None:
             order_info.amount = float(self.client.amount_to_precision(order_info.unified_symbol, order_info.amount))
 
-        self.client.options["defaultType"] = "spot"
+        self.select_client("spot")
 
     # async def aclose(self):
     #     await self.spot_async.close()
@@ -31,6 +34,9 @@ class Upbit:
         return self.client.fetch_ticker(symbol)
 
     def get_price(self, symbol: str):
+        price = cached_price(self.client.id, symbol)
+        if price is not None:
+            return price
         return self.get_ticker(symbol)["last"]
 
     def get_balance(self, base: str) -> float:
@@ -66,7 +72,7 @@ class Upbit:
         params = {}
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 order_info.unified_symbol,
                 order_info.type.lower(),
                 order_info.side,
@@ -111,7 +117,7 @@ class Upbit:
         params = {}
         try:
             return retry(
-                self.client.create_order,
+                self.create_order,
                 order_info.unified_symbol,
                 "limit",
                 order_info.side,
@@ -127,4 +133,14 @@ class Upbit:
         
     # fetch_order (거래소에 따라 params 다름)
     def fetch_order(self, order_id: str, symbol: str):
-        return self.client.fetch_order(order_id, symbol)
\ No newline at end of file
+        return self.client.fetch_order(order_id, symbol)
+
+    # NextCandle 재주문 : 취소 후 재주문 (정정 엔드포인트 미사용)
+    def reprice_order(self, order_id: str, symbol: str, new_price: float):
+        from exchange.pexchange import reprice_order
+
+        return reprice_order(self, order_id, symbol, new_price, create=self.reorder)
+
+    def reorder(self, amount: float, price: float):
+        order_info = self.order_info.copy(update={"amount": amount, "price": price})
+        return self.limit_order(order_info)
\ No newline at end of file
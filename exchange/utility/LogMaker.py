@@ -2,7 +2,6 @@ import sys
 from exchange.model import MarketOrder, COST_BASED_ORDER_EXCHANGES, STOCK_EXCHANGES
 from exchange.utility import settings
 from datetime import datetime, timedelta
-from dhooks import Webhook, Embed
 from loguru import logger
 from devtools import debug, pformat
 from typing import Literal
@@ -22,11 +21,34 @@ logger.add(
     format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level}</level> | <level>{message}</level>",
 )
 
-try:
-    url = settings.DISCORD_WEBHOOK_URL.replace("discordapp", "discord")
-    hook = Webhook(url)
-except Exception as e:
-    print("웹훅 URL이 유효하지 않습니다: ", settings.DISCORD_WEBHOOK_URL)
+hook = None
+_hook_checked = False
+
+
+def Embed(*args, **kwargs):
+    """
+    dhooks(aiohttp) import가 무거워서 처음 Embed를 만들 때 import 한다.
+    """
+    from dhooks import Embed as _Embed
+
+    return _Embed(*args, **kwargs)
+
+
+def get_hook():
+    """
+    디스코드 웹훅은 처음 메세지를 보낼 때 생성한다. (import 시점에 연결 X)
+    """
+    global hook, _hook_checked
+    if not _hook_checked:
+        _hook_checked = True
+        try:
+            from dhooks import Webhook
+
+            url = settings.DISCORD_WEBHOOK_URL.replace("discordapp", "discord")
+            hook = Webhook(url)
+        except Exception as e:
+            print("웹훅 URL이 유효하지 않습니다: ", settings.DISCORD_WEBHOOK_URL)
+    return hook
 
 
 def get_error(e):
@@ -57,7 +79,8 @@ def logger_test():
     logger.info(date)
 
 
-def log_message(message="None", embed: Embed = None):
+def log_message(message="None", embed=None):
+    hook = get_hook()
     if hook:
         if embed:
             hook.send(embed=embed)
@@ -180,7 +203,7 @@ def log_order_message(exchange_name, order_result: dict, order_info: MarketOrder
         log_message(content, embed)
 
 
-def log_hedge_message(exchange, base, quote, exchange_amount, upbit_amount, hedge):
+def log_hedge_message(exchange, base, quote, exchange_amount, upbit_amount, hedge, skew_ms=None):
     date = parse_time(datetime.utcnow().timestamp())
     hedge_type = "헷지" if hedge == "ON" else "헷지 종료"
     content = f"{hedge_type}: {base} ==> {exchange}:{exchange_amount} UPBIT:{upbit_amount}"
@@ -194,6 +217,9 @@ def log_hedge_message(exchange, base, quote, exchange_amount, upbit_amount, hedg
         value=f"{exchange}:{exchange_amount} UPBIT:{upbit_amount}",
         inline=False,
     )
+    if skew_ms is not None:
+        content += f" (leg 시차 {skew_ms}ms)"
+        embed.add_field(name="leg 시차", value=f"{skew_ms}ms", inline=False)
     log_message(content, embed)
 
 
@@ -357,7 +383,7 @@ def log_custom_message(order_info: MarketOrder, msg_type: MESSAGE_TYPE_LITERAL):
 
     log_message(embed=embed)
 
-def log_arbi_message(exchange_long, exchange_short, base, quote, long_amount, short_amount, hedge):
+def log_arbi_message(exchange_long, exchange_short, base, quote, long_amount, short_amount, hedge, skew_ms=None):
     date = parse_time(datetime.utcnow().timestamp())
     hedge_type = "Arbitrage 진입" if hedge == "ON" else "Arbitrage 종료"
     content = f"{hedge_type}: {base} ==> {exchange_long}:{long_amount} {exchange_short}:{short_amount}"
@@ -371,4 +397,7 @@ def log_arbi_message(exchange_long, exchange_short, base, quote, long_amount, sh
         value=f"{exchange_long}:{long_amount} {exchange_short}:{short_amount}",
         inline=False,
     )
+    if skew_ms is not None:
+        content += f" (leg 시차 {skew_ms}ms)"
+        embed.add_field(name="leg 시차", value=f"{skew_ms}ms", inline=False)
     log_message(content, embed)
\ No newline at end of file
@@ -0,0 +1,43 @@
+import subprocess
+import sys
+import os
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def profile_imports(module: str = "main", limit: int = 30) -> dict:
+    """
+    새 파이썬 프로세스에서 `python -X importtime -c "import <module>"` 를 실행해
+    import 시간이 오래 걸린 모듈 상위 limit개를 반환 (단위 : ms)
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        modules.append(
+            {
+                "module": parts[2].rstrip(),
+                "self_ms": int(parts[0]) / 1000,
+                "cumulative_ms": int(parts[1]) / 1000,
+            }
+        )
+
+    total = next((m["cumulative_ms"] for m in modules if m["module"].strip() == module), None)
+    modules.sort(key=lambda m: m["cumulative_ms"], reverse=True)
+    return {
+        "module": module,
+        "total_ms": total,
+        "returncode": proc.returncode,
+        "top": [m | {"module": m["module"].strip()} for m in modules[:limit]],
+    }
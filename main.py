@@ -1,3 +1,7 @@
+import time
+
+BOOT_STARTED = time.perf_counter()  # run.py를 거치지 않고 실행될 때의 부팅 시작 시각
+
 from fastapi.exception_handlers import (
     request_validation_exception_handler,
 )
@@ -5,9 +9,7 @@ from pprint import pprint
 from fastapi import FastAPI, Request, status, BackgroundTasks
 from fastapi.responses import ORJSONResponse, RedirectResponse
 from fastapi.exceptions import RequestValidationError
-import httpx
-from exchange.stock.kis import KoreaInvestment
-from exchange.model import MarketOrder, PriceRequest, HedgeData, OrderRequest, ArbiData, HatikoInfo, HatikoOrder, IndividualOrder
+from exchange.model import MarketOrder, PriceRequest, HedgeData, OrderRequest, ArbiData, HatikoInfo, HatikoOrder, IndividualOrder, KctrendInfo, ReplicationPromote
 from exchange.utility import (
     settings,
     log_order_message,
@@ -24,10 +26,20 @@ from exchange.utility import (
 )
 import traceback
 from exchange import get_exchange, log_message, db, settings, get_bot, pocket
+from exchange.shard import ShardMiddleware, ShardManager, shard_names, current_shard
+from exchange.pexchange import configured_exchanges, payload
+from exchange import market_cache, replication, slicing, depth
+from exchange.strategy import StrategyEngine, StrategyContext, RetryPolicy, ONCE, HATIKO_SIGNALS, KCTREND_SIGNALS, UNKNOWN
+from exchange.order_state import OrderState
+from exchange.slicing import SliceMode, SliceJob, plan_slices
+from exchange.twoleg import Leg, TwoLegResult, execute_two_legs
+from exchange.ledger import Ledger
+from exchange.stock.token import token_manager as kis_tokens
+from exchange.stock.realtime import kis_realtime
+from exchange import fanout, connection, ack
 import ipaddress
 import os
 import sys
-from devtools import debug
 
 VERSION = "POA : 0.1.6, Hatiko : 241219 (bitget, okx bug fix)"
 app = FastAPI(default_response_class=ORJSONResponse)
@@ -50,18 +62,104 @@ def get_error(e):
     return error_msg
 
 
+def is_owner(shard_name: str) -> bool:
+    """
+    shard_name 담당 서비스를 이 프로세스에서 실행하는지 (shard 모드가 아니거나 그 shard가 없으면 메인 프로세스)
+    """
+    if settings.SHARD_MODE == "exchange" and shard_name in shard_names():
+        return current_shard() == shard_name
+    return current_shard() is None
+
+
+async def start_singletons():
+    """
+    프로세스 전체에서 하나만 있어야 하는 서비스
+    shard 모드 : 메인 프로세스 또는 담당 shard / 멀티 워커(run.py --workers N) : leader 워커
+    """
+    if current_shard() is None:
+        # hot-standby 복제 (standby는 primary의 변경을 받아서 Flag까지 반영). REPLICATION_ADDRESS를 여는 것은 하나뿐
+        await replication.start(store, on_apply=sync_flags)
+        # 업그레이드 후 첫 실행이면 PocketBase 포지션을 장부로 가져온다
+        await ledger.import_once()
+    if is_owner("KIS"):
+        # KIS 토큰 만료 전 백그라운드 갱신
+        await kis_tokens.start()
+        # KIS 실시간 체결통보 (KIS_WS). 계좌마다 WebSocket 하나
+        await kis_realtime.start()
+
+
 @app.on_event("startup")
 async def startup():
     log_message(f"POABOT 실행 완료! - 버전:{VERSION}")
     # by PTW
     load_hi_objects_on_startup()
+    store.setdefault("flags", {name: globals()[name] for name in FLAG_NAMES})
+    sync_flags()
+    if current_shard() is None:
+        # 헷지 / 차익거래 포지션 장부 (store.db, 워커끼리 공유). /hedge, /arbitrage는 shard로 넘기지 않는다
+        await ledger.start()
+    if is_owner("KIS"):
+        # KIS 토큰은 워커마다 메모리에 올린다 (갱신은 leader만)
+        kis_tokens.load()
+    if current_shard() is not None:
+        await start_singletons()
+        if store.shared:
+            app.state.leader_task = asyncio.create_task(store.elect_leader())
+    elif store.try_become_leader():
+        await start_singletons()
+    else:
+        # leader 워커가 죽으면 잠금이 풀리고, 이어받은 워커가 시작한다. (종료 시 저장 같은 단일 작업도 leader만)
+        app.state.leader_task = asyncio.create_task(store.elect_leader(on_elected=start_singletons))
+    # 봉 마감 전 거래소 연결 keep-warm (KEEP_WARM_TIMEFRAME)
+    # 연결 pool은 프로세스마다 따로이고, 이 프로세스에서 주문에 쓴 client만 깨우므로 프로세스마다 실행한다
+    app.state.keep_warm_task = connection.start_keep_warm(lambda: list(payload.values()) + list(fanout.accounts.values()))
+    # 부팅 시작 ~ 요청을 받을 수 있는 시점까지 걸린 시간
+    # run.py 단일 프로세스 : app.state.boot_started / 멀티 워커 : BOOT_STARTED_AT 환경변수 / 직접 실행 : main import 시각
+    if hasattr(app.state, "boot_started"):
+        app.state.time_to_listen = time.perf_counter() - app.state.boot_started
+    elif os.environ.get("BOOT_STARTED_AT"):
+        app.state.time_to_listen = time.time() - float(os.environ["BOOT_STARTED_AT"])
+    else:
+        app.state.time_to_listen = time.perf_counter() - BOOT_STARTED
+    if not hasattr(app.state, "port"):
+        app.state.port = settings.PORT
+    if settings.MARKET_CACHE:
+        # 세그먼트를 처음 만든 프로세스가 writer (shard 프로세스는 reader로만 연결)
+        cache = market_cache.attach(create=current_shard() is None)
+        if cache is not None and cache.writer:
+            exchanges = [name for name in configured_exchanges() if name in market_cache.MARKET_TYPES] or ["BINANCE"]
+            app.state.market_cache_task = asyncio.create_task(
+                market_cache.run_writer(cache, exchanges, settings.MARKET_CACHE_INTERVAL)
+            )
+    if settings.SHARD_MODE == "exchange" and current_shard() is None:
+        # 메인 프로세스는 요청 전달만 하고, 거래소별 shard 프로세스가 실제 주문을 처리한다.
+        app.state.shards = ShardManager(shard_names())
+        await app.state.shards.start()
+    preload = settings.STARTUP_MODE == "eager" or replication.role == "standby"
+    if preload and not (settings.SHARD_MODE == "exchange" and current_shard() is None):
+        # 키가 설정된 거래소를 미리 로드 (서버는 먼저 요청을 받기 시작한다)
+        # shard 모드의 메인 프로세스는 요청 전달만 하므로 각 shard 프로세스가 자기 거래소만 로드한다
+        from exchange.pexchange import preload_exchanges
+
+        app.state.preload_task = asyncio.create_task(asyncio.to_thread(preload_exchanges, current_shard()))
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    if getattr(app.state, "shards", None) is not None:
+        await app.state.shards.stop()
+    market_cache.detach()
+    await replication.stop()
+    await ledger.stop()
+    if getattr(app.state, "keep_warm_task", None) is not None:
+        app.state.keep_warm_task.cancel()
+    await kis_realtime.stop()
+    await kis_tokens.stop()
+    await pocket.close()
     db.close()
     # by PTW
     save_hi_objects_on_shutdown()
+    store.close()
 
 
 whitelist = [
@@ -83,6 +181,10 @@ whitelist = whitelist + settings.WHITELIST
 #     return response
 
 
+# SHARD_MODE=exchange : 거래소별 shard 프로세스로 요청 전달 (whitelist 검사 이후에 실행되도록 먼저 등록)
+app.add_middleware(ShardMiddleware)
+
+
 @app.middleware("http")
 async def whitelist_middleware(request: Request, call_next):
     try:
@@ -119,6 +221,8 @@ async def validation_exception_handler(request, exc):
 
 @app.get("/ip")
 async def get_ip():
+    import httpx
+
     data = httpx.get("https://ipv4.jsonip.com").json()["ip"]
     log_message(data)
 
@@ -130,10 +234,8 @@ async def welcome():
 
 @app.post("/price")
 async def price(price_req: PriceRequest, background_tasks: BackgroundTasks):
-    exchange = get_exchange(price_req.exchange)
-    price = exchange.dict()[price_req.exchange].fetch_price(
-        price_req.base, price_req.quote
-    )
+    bot = get_exchange(price_req.exchange)
+    price = bot.get_price(f"{price_req.base}/{price_req.quote}")
     return price
 
 
@@ -153,21 +255,24 @@ async def order(order_info: MarketOrder, background_tasks: BackgroundTasks):
     order_result = None
     try:
         exchange_name = order_info.exchange
+        if order_info.group:
+            # 그룹의 모든 계좌에 동시에 주문하고 계좌별 결과를 반환
+            fan_out_result = await fanout.fan_out(order_info.group, order_info)
+            for account in fan_out_result.results:
+                if account.ok:
+                    background_tasks.add_task(log, exchange_name, account.result, account.order_info)
+                else:
+                    background_tasks.add_task(log_error, account.error, account.order_info)
+            return fan_out_result.dict()
+
         bot = get_bot(exchange_name, order_info.kis_number)
         bot.init_info(order_info)
 
         if bot.order_info.is_crypto:
-            if bot.order_info.is_entry:
-                order_result = bot.market_entry(bot.order_info)
-            elif bot.order_info.is_close:
-                order_result = bot.market_close(bot.order_info)
-            elif bot.order_info.is_buy:
-                order_result = bot.market_buy(bot.order_info)
-            elif bot.order_info.is_sell:
-                order_result = bot.market_sell(bot.order_info)
+            order_result = fanout.market_order(bot, bot.order_info)
             background_tasks.add_task(log, exchange_name, order_result, order_info)
         elif bot.order_info.is_stock:
-            order_result = bot.create_order(
+            order_result = await bot.acreate_order(
                 bot.order_info.exchange,
                 bot.order_info.base,
                 order_info.type.lower(),
@@ -193,28 +298,21 @@ async def order(order_info: MarketOrder, background_tasks: BackgroundTasks):
         pass
 
 
-def get_hedge_records(base):
-    records = pocket.get_full_list("kimp", query_params={"filter": f'base = "{base}"'})
-    binance_amount = 0.0
-    binance_records_id = []
-    upbit_amount = 0.0
-    upbit_records_id = []
-    for record in records:
-        if record.exchange == "BINANCE":
-            binance_amount += record.amount
-            binance_records_id.append(record.id)
-        elif record.exchange == "UPBIT":
-            upbit_amount += record.amount
-            upbit_records_id.append(record.id)
+# 헷지 / 차익거래 포지션 장부 (PocketBase 전체 조회 대신 메모리 합계 + store.db)
+ledger = Ledger(db)
+
 
-    return {
-        "BINANCE": {"amount": binance_amount, "records_id": binance_records_id},
-        "UPBIT": {"amount": upbit_amount, "records_id": upbit_records_id},
-    }
+def log_two_leg_error(result: TwoLegResult, name: str):
+    error = "".join(traceback.format_exception(result.error))
+    if result.unwound is not None:
+        error += f"\n{result.unwound.name} : {'성공' if result.unwound.ok else result.unwound.error}"
+    log_error_message(error, name)
 
 
 @app.post("/hedge")
 async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
+    # 체결 수량을 장부에 기록하므로 ACK 주문을 쓰지 않는다
+    ack.disable()
     exchange_name = hedge_data.exchange.upper()
     bot = get_bot(exchange_name)
     upbit = get_bot("UPBIT")
@@ -239,68 +337,54 @@ async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
         try:
             if amount is None:
                 raise Exception("헷지할 수량을 요청하세요")
-            binance_order_result = bot.market_entry(foreign_order_info)
-            binance_order_amount = binance_order_result["amount"]
-            pocket.create(
-                "kimp",
-                {
-                    "exchange": "BINANCE",
-                    "base": base,
-                    "quote": quote,
-                    "amount": binance_order_amount,
-                },
+            korea_order_info = OrderRequest(
+                exchange="UPBIT",
+                base=base,
+                quote="KRW",
+                side="buy",
+                type="market",
+                amount=amount,
             )
-            if leverage is None:
-                leverage = 1
-            try:
-                korea_order_info = OrderRequest(
-                    exchange="UPBIT",
-                    base=base,
-                    quote="KRW",
-                    side="buy",
-                    type="market",
-                    amount=binance_order_amount,
-                )
-                upbit.init_info(korea_order_info)
-                upbit_order_result = upbit.market_buy(korea_order_info)
-            except Exception as e:
-                hedge_records = get_hedge_records(base)
-                binance_records_id = hedge_records["BINANCE"]["records_id"]
-                binance_amount = hedge_records["BINANCE"]["amount"]
-                binance_order_result = bot.market_close(
-                    OrderRequest(
-                        exchange=exchange_name,
-                        base=base,
-                        quote=quote,
-                        side="close/buy",
-                        amount=binance_amount,
-                    )
-                )
-                for binance_record_id in binance_records_id:
-                    pocket.delete("kimp", binance_record_id)
-                log_message(
-                    "[헷지 실패] 업비트에서 에러가 발생하여 바이낸스 포지션을 종료합니다"
-                )
-            else:
-                upbit_order_info = upbit.get_order(upbit_order_result["id"])
-                upbit_order_amount = upbit_order_info["filled"]
-                pocket.create(
-                    "kimp",
-                    {
-                        "exchange": "UPBIT",
-                        "base": base,
-                        "quote": "KRW",
-                        "amount": upbit_order_amount,
-                    },
-                )
-                log_hedge_message(
-                    exchange_name,
-                    base,
-                    quote,
-                    binance_order_amount,
-                    upbit_order_amount,
-                    hedge,
-                )
+            upbit.init_info(korea_order_info)
+            # 두 거래소에 같은 수량을 동시에 주문 (수량 정밀도가 더 거친 쪽에 맞춤)
+            matched_amount = min(
+                float(bot.client.amount_to_precision(foreign_order_info.unified_symbol, amount)),
+                float(upbit.client.amount_to_precision(korea_order_info.unified_symbol, amount)),
+            )
+            foreign_order_info.amount = matched_amount
+            korea_order_info.amount = matched_amount
+
+            result = await execute_two_legs(
+                Leg(
+                    f"{exchange_name} short",
+                    lambda: bot.market_entry(foreign_order_info),
+                    unwind=lambda order: bot.market_close(
+                        OrderRequest(exchange=exchange_name, base=base, quote=quote, side="close/buy", amount=order["amount"])
+                    ),
+                ),
+                Leg(
+                    "UPBIT buy",
+                    lambda: upbit.market_buy(korea_order_info),
+                    unwind=lambda order: upbit.market_sell(
+                        OrderRequest(exchange="UPBIT", base=base, quote="KRW", side="sell", amount=upbit.get_order_amount(order["id"]))
+                    ),
+                ),
+                concurrent=bot is not upbit,
+            )
+            if not result.ok:
+                log_message("[헷지 실패] 한쪽 주문에서 에러가 발생하여 체결된 포지션을 종료합니다")
+                background_tasks.add_task(log_two_leg_error, result, "헷지")
+                return {"result": "error"}
+
+            # 체결 수량 (응답에 체결 정보가 없는 거래소는 주문 수량)
+            foreign_amount = result.first.result.get("filled") or result.first.result["amount"]
+            ledger.add("kimp", base, "BINANCE", foreign_amount, quote=quote)
+            async def record_and_log():
+                # 업비트 시장가 매수는 비용 주문이라 체결 수량을 조회해서 기록
+                upbit_order_amount = await asyncio.to_thread(upbit.get_order_amount, result.second.result["id"])
+                ledger.add("kimp", base, "UPBIT", upbit_order_amount, quote="KRW")
+                log_hedge_message(exchange_name, base, quote, foreign_amount, upbit_order_amount, hedge, result.skew_ms)
+            background_tasks.add_task(record_and_log)
 
         except Exception as e:
             # log_message(f"{e}")
@@ -313,47 +397,37 @@ async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
 
     elif hedge == "OFF":
         try:
-            records = pocket.get_full_list(
-                "kimp", query_params={"filter": f'base = "{base}"'}
-            )
-            binance_amount = 0.0
-            binance_records_id = []
-            upbit_amount = 0.0
-            upbit_records_id = []
-            for record in records:
-                if record.exchange == "BINANCE":
-                    binance_amount += record.amount
-                    binance_records_id.append(record.id)
-                elif record.exchange == "UPBIT":
-                    upbit_amount += record.amount
-                    upbit_records_id.append(record.id)
+            binance_amount = ledger.amount("kimp", base, "BINANCE")
+            upbit_amount = ledger.amount("kimp", base, "UPBIT")
 
             if binance_amount > 0 and upbit_amount > 0:
-                # 바이낸스
-                order_info = OrderRequest(
-                    exchange="BINANCE",
-                    base=base,
-                    quote=quote,
-                    side="close/buy",
-                    amount=binance_amount,
+                # 바이낸스 / 업비트 동시 종료
+                result = await execute_two_legs(
+                    Leg(
+                        f"{exchange_name} close",
+                        lambda: bot.market_close(
+                            OrderRequest(exchange="BINANCE", base=base, quote=quote, side="close/buy", amount=binance_amount)
+                        ),
+                    ),
+                    Leg(
+                        "UPBIT sell",
+                        lambda: upbit.market_sell(
+                            OrderRequest(exchange="UPBIT", base=base, quote="KRW", side="sell", amount=upbit_amount)
+                        ),
+                    ),
+                    concurrent=bot is not upbit,
                 )
-                binance_order_result = bot.market_close(order_info)
-                for binance_record_id in binance_records_id:
-                    pocket.delete("kimp", binance_record_id)
-                # 업비트
-                order_info = OrderRequest(
-                    exchange="UPBIT",
-                    base=base,
-                    quote="KRW",
-                    side="sell",
-                    amount=upbit_amount,
-                )
-                upbit_order_result = upbit.market_sell(order_info)
-                for upbit_record_id in upbit_records_id:
-                    pocket.delete("kimp", upbit_record_id)
-
-                log_hedge_message(
-                    exchange_name, base, quote, binance_amount, upbit_amount, hedge
+                # 종료된 쪽만 장부에서 정리
+                if result.first.ok:
+                    ledger.close("kimp", base, "BINANCE")
+                if result.second.ok:
+                    ledger.close("kimp", base, "UPBIT")
+                if not result.ok:
+                    background_tasks.add_task(log_two_leg_error, result, "헷지종료")
+                    return {"result": "error"}
+
+                background_tasks.add_task(
+                    log_hedge_message, exchange_name, base, quote, binance_amount, upbit_amount, hedge, result.skew_ms
                 )
             elif binance_amount == 0 and upbit_amount == 0:
                 log_message(f"{exchange_name}, UPBIT에 종료할 수량이 없습니다")
@@ -378,6 +452,57 @@ async def hedge(hedge_data: HedgeData, background_tasks: BackgroundTasks):
 ##############################################################################
 import asyncio
 import pickle
+from exchange.state import store
+
+#region 공유 상태 (multi-worker)
+# STATE_BACKEND=sqlite 이면 Flag와 전략 상태를 store에 저장해서 모든 워커가 공유한다.
+FLAG_NAMES = ("USE_DISCORD", "LOG", "KILL_CONFIRM", "KILL_MINUTE")
+flags_version = 0
+
+def set_flag(name, value):
+    globals()[name] = value
+    store.update("flags", lambda flags: flags | {name: value}, dict)
+
+def sync_flags():
+    """
+    다른 워커가 바꾼 Flag를 전역변수에 반영 (version이 바뀐 경우에만)
+    """
+    global flags_version
+    flags, version = store.get_versioned("flags")
+    if version != flags_version:
+        globals().update(flags or {})
+        flags_version = version
+
+@ app.middleware("http")
+async def sync_state_middleware(request: Request, call_next):
+    if store.shared:
+        sync_flags()
+    if replication.role == "standby" and request.method == "POST" and request.url.path in replication.STANDBY_BLOCKED:
+        # standby는 승격 전까지 주문하지 않는다 (primary와 중복 주문 방지)
+        return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content="standby 상태입니다")
+    return await call_next(request)
+
+# 복제 상태 (primary : 연결된 standby와 lag / standby : 수신한 seq)
+@ app.get("/replication")
+async def replication_status():
+    return replication.status()
+
+# Caddy 등 reverse proxy의 health check 용 (standby는 503)
+@ app.get("/replication/health")
+async def replication_health():
+    if replication.role == "standby":
+        return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=replication.status())
+    return replication.status()
+
+# standby -> primary 승격 (listen=true 이면 다른 인스턴스가 standby로 붙을 수 있게 복제 서버를 연다)
+# 상태를 바꾸므로 POST + password (웹훅과 같은 검증)
+@ app.post("/replication/promote")
+async def replication_promote(promote: ReplicationPromote):
+    res = await replication.promote(store, promote.listen)
+    sync_flags()
+    return res
+
+#endregion 공유 상태 (multi-worker)
 
 #region Flags
 USE_DISCORD = False # Discord 사용 여부
@@ -386,16 +511,14 @@ LOG = False # LOG 찍어보기 Flag
 # Discord 변경
 @ app.get("/change_discord")
 async def change_discord():
-    global USE_DISCORD
-    USE_DISCORD = not USE_DISCORD
+    set_flag("USE_DISCORD", not USE_DISCORD)
     return f"USE_DISCORD : {USE_DISCORD}"
 
 
 # LOG Flag 변경
 @ app.get("/change_log")
 async def change_log():
-    global LOG
-    LOG = not LOG
+    set_flag("LOG", not LOG)
     return f"LOG : {LOG}"
 
 #endregion Flags
@@ -460,7 +583,7 @@ async def reload_markets():
     for exchange_name in exchange_set:
         try:
             bot = get_bot(exchange_name)
-            bot.client.load_markets(reload=True)
+            bot.reload_markets()
         except:
             log_message(f"Reload Markets Failed - {exchange_name}")
         else:
@@ -469,6 +592,44 @@ async def reload_markets():
     log_message(f"Reload Markets Complete!!! - {sucess_list}")
     return "Reload Markets Complete!!!"
 
+@ app.get("/import_time")
+async def import_time(limit: int = 30):
+    """
+    main 모듈 import에 걸리는 시간(-X importtime)을 별도 프로세스에서 측정
+    """
+    from exchange.utility.importtime import profile_imports
+    from exchange.pexchange import payload
+
+    res = await asyncio.to_thread(profile_imports, "main", limit)
+    res["time_to_listen"] = getattr(app.state, "time_to_listen", None)
+    res["startup_mode"] = settings.STARTUP_MODE
+    res["loaded_exchanges"] = list(payload)
+    return res
+
+@ app.get("/shards")
+async def shard_health():
+    """
+    SHARD_MODE=exchange 인 경우 shard 프로세스별 상태 (alive, heartbeat, inflight, restarts ...)
+    """
+    manager = getattr(app.state, "shards", None)
+    if manager is None:
+        return {"shard_mode": settings.SHARD_MODE, "shard": current_shard()}
+    return manager.health()
+
+@ app.get("/market_cache")
+async def market_cache_stats(exchange: str = None, symbol: str = None):
+    """
+    MARKET_CACHE=true 인 경우 공유 시세 캐시 상태 (exchange, symbol을 주면 해당 종목 값도 반환)
+    """
+    cache = market_cache.cache
+    if cache is None:
+        return {"market_cache": settings.MARKET_CACHE, "attached": False}
+    res = cache.stats()
+    if exchange and symbol:
+        quote = cache.get(exchange, symbol)
+        res["symbol"] = quote._asdict() if quote else None
+    return res
+
 #endregion utils
 
 
@@ -539,15 +700,13 @@ KILL_MINUTE = 10 # 시간차 시장가 청산 기능에서 대기 시간(분)
 # KILL_CONFIRM 변경
 @ app.get("/change_kill_confirm")
 async def change_kill_confirm():
-    global KILL_CONFIRM
-    KILL_CONFIRM = not KILL_CONFIRM
+    set_flag("KILL_CONFIRM", not KILL_CONFIRM)
     return f"KILL_CONFIRM : {KILL_CONFIRM}"
 
 # KILL_MINUTE 변경
 @ app.get("/set_kill_minute/{minute}")
 async def set_kill_minute(minute: int):
-    global KILL_MINUTE
-    KILL_MINUTE = minute
+    set_flag("KILL_MINUTE", minute)
     return f"KILL_MINUTE : {KILL_MINUTE}"
 
 #endregion Hatiko용 Flag, 전역변수
@@ -578,38 +737,55 @@ hatikoInfoObjects = {
 # HI 객체 저장 디렉토리 경로
 HI_DIRECTORY = "./data/"
 
-# HI 객체 저장 파일 경로
-HI_FILE_PATH = os.path.join(HI_DIRECTORY, "hatikoinfo_objects.pickle")
+# HI 객체 저장 파일 이름 (shard 프로세스는 shard별 파일을 따로 쓴다)
+HI_FILE_NAME = "hatikoinfo_objects"
+KC_FILE_NAME = "kctrendinfo"   # 켈트너 + Hatiko in Upbit 전략 상태
+
+def hi_file_path(name: str, shard: str | None = None) -> str:
+    return os.path.join(HI_DIRECTORY, f"{name}.{shard}.pickle" if shard else f"{name}.pickle")
 
 # HI 객체를 파일에 저장하는 함수
-def save_hi_objects(hi_objects):
+def save_hi_objects(hi_objects, name: str = HI_FILE_NAME):
     os.makedirs(HI_DIRECTORY, exist_ok=True)  # 디렉토리 생성 (이미 존재하면 무시)
-    with open(HI_FILE_PATH, 'wb') as file:
+    with open(hi_file_path(name, current_shard()), 'wb') as file:
         pickle.dump(hi_objects, file)
 
 # HI 객체를 파일에서 로드하는 함수
-def load_hi_objects():
-    try:
-        with open(HI_FILE_PATH, 'rb') as file:
-            return pickle.load(file)
-    except FileNotFoundError:
-        return None
+def load_hi_objects(name: str = HI_FILE_NAME):
+    for path in dict.fromkeys((hi_file_path(name, current_shard()), hi_file_path(name))):
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            continue
+    return None
 
 # FastAPI 서버 시작 시 HI 객체를 파일에서 로드하는 함수
 def load_hi_objects_on_startup():
-    global hatikoInfoObjects
+    global hatikoInfoObjects, kctrendInfo
     loaded_hi_objects = load_hi_objects()
     if loaded_hi_objects:
         # 파일에서 HI 객체를 로드한 경우, 이를 HI 객체로 대체
         hatikoInfoObjects = loaded_hi_objects
+    loaded_kctrend_info = load_hi_objects(KC_FILE_NAME)
+    if loaded_kctrend_info:
+        kctrendInfo = loaded_kctrend_info
+    # sqlite store인 경우 store에 연결 (store에 값이 있으면 store 값이 우선)
+    for key, hatikoInfo in hatikoInfoObjects.items():
+        hatikoInfo.bind(store, key)
+    kctrendInfo.bind(store, "upbit_spot")
 
 # FastAPI 서버 종료 시 HI 객체를 파일에 저장하는 함수
 def save_hi_objects_on_shutdown():
+    # 여러 워커가 같은 파일에 쓰지 않도록 leader만 저장
+    if not store.is_leader:
+        return
     # 서버 종료 시 HI 객체를 저장
     hi_objects = {}
     for key, value in hatikoInfoObjects.items():
         hi_objects[key] = value
     save_hi_objects(hi_objects)
+    save_hi_objects(kctrendInfo, KC_FILE_NAME)
 
 #endregion HatikoInfo 객체 Save/Load 관련 함수
 
@@ -626,6 +802,21 @@ async def get_hatikoinfo(exchange: str, market_type: str):
     else:
         return {"error": "해당 거래소 또는 상품 유형의 정보를 찾을 수 없습니다."}
 
+# 분할 청산 진행 상황 (slice별 주문 id, 체결 수량)
+@app.get("/slicing")
+async def get_slicing():
+    return slicing.status()
+
+# 거래소별 연결 재사용률 / 새 연결 시간
+@app.get("/connections")
+async def get_connections():
+    return connection.status()
+
+# KIS 실시간 체결통보로 받은 계좌별 주문 / 체결 상태
+@app.get("/kis/realtime")
+async def get_kis_realtime():
+    return kis_realtime.status()
+
 # HatikoInfo 리셋
 @app.get("/reset_hatikoinfo/{exchange}/{productType}")
 async def reset_hatikoinfo(exchange: str, productType: str):
@@ -703,6 +894,7 @@ def getMinMaxQty(bot, order_info: MarketOrder) -> tuple[float]:
     """
     주문 시 최대, 최소 수량을 구하는 방법이 거래소마다 다름.
     max_amount : 지정가 주문 최대 코인개수 -> 100,000 달러를 기준으로 할까? -> 거래소에서 주는 값과 비교하여 높은 값으로 선정
+                 DEPTH_SIZING이면 거래소 한도를 적용한 뒤, 호가창에서 DEPTH_SLIPPAGE 이내로 체결 가능한 수량으로 한 번 더 줄인다
     min_amount : 지정가 주문 최소 코인개수 -> 10 달러를 기준으로 한다! -> 거래소에서 주는 값과 비교하여 높은 값으로 선정
     return (최대수량, 최소수량)
     """
@@ -743,9 +935,38 @@ def getMinMaxQty(bot, order_info: MarketOrder) -> tuple[float]:
         if order_info.is_futures:
             max_amount = market["limits"]["amount"]["max"] # 계약 단위
             min_amount = market["limits"]["amount"]["min"] # 계약 단위
-    
+
+    if settings.DEPTH_SIZING:
+        # 호가창 상한은 거래소 한도 다음에 건다 (거래소 한도가 덮어쓰지 않도록). min_amount 아래로는 내리지 않는다
+        # 선물 호가창 수량은 ccxt가 거래소 원래 단위(계약 수) 그대로 주므로 max_amount / 주문 수량과 단위가 같다
+        depth_amount = depth.max_slice(bot.client, order_info.unified_symbol, order_info.side)
+        if depth_amount is not None:
+            max_amount = max(min(max_amount, depth_amount), min_amount) if max_amount else max(depth_amount, min_amount)
+
     return max_amount, min_amount
             
+def planSlices(bot, order_info: MarketOrder, total_amount: float, max_amount: float, min_amount: float, mode: SliceMode | str = SliceMode.IMMEDIATE):
+    """
+    total_amount를 거래소 최대/최소 주문수량과 수량 정밀도에 맞춰 slice로 나눈다. (exchange.slicing.plan_slices)
+    mode가 twap / iceberg면 Settings의 SLICE_* 값으로 간격과 slice 크기를 정한다.
+    """
+    symbol = order_info.unified_symbol
+    plan = plan_slices(
+        total_amount,
+        min_amount,
+        max_amount,
+        precision=lambda amount: float(bot.client.amount_to_precision(symbol, amount)) if amount > 0 else 0.0,
+        mode=mode,
+        duration=settings.SLICE_TWAP_SECONDS,
+        count=settings.SLICE_TWAP_COUNT,
+        visible=settings.SLICE_ICEBERG_CASH / order_info.price if order_info.price else None,
+    )
+    log_message(f"slices : {plan.amounts}, dropped : {plan.dropped}") if LOG else None
+    return plan
+
+def sliceKey(order_info: MarketOrder) -> str:
+    return f"{order_info.exchange}:{order_info.unified_symbol}"
+
 def removeItemFromMultipleDicts(item, *dicts):
     for dic in dicts:
         if item in dic:
@@ -767,6 +988,10 @@ def removeItemFromMultipleLists(item, *lists) -> bool:
 
 #region Hatiko Main Function
 
+# order_name -> Signal 해석, kind별 handler 실행. 재시도는 거래소 호출(step) 단위로 최대 5회
+strategy_engine = StrategyEngine()
+hatiko_strategy = strategy_engine.plugin("hatiko", HATIKO_SIGNALS, retry=RetryPolicy(tries=5))
+
 # 실매매용 웹훅URL
 @ app.post("/hatiko")
 @ app.post("/")
@@ -789,16 +1014,16 @@ async def hatiko(hatikoOrder: HatikoOrder, background_tasks: BackgroundTasks):
 
         order_info_list = []
         # Divide HatikoOrder to each order_info
+        # 모든 레벨이 같은 불변 원본을 공유하고, price/order_name만 레벨별로 override 한다.
+        base_order = IndividualOrder.freeze(hatikoOrder)
         for price_key, order_name_map in hatikoOrder.order_name_map.items():
             price_value = getattr(hatikoOrder, price_key)
             if price_value is not None:
-                order_info = IndividualOrder(hatikoOrder)
-                order_info.price = price_value
-                order_info.order_name = order_name_map.get(hatikoOrder.mode)
-                log_message(f"order_info : {order_info.order_name}, {order_info.price}") if LOG else None
-                if order_info.order_name is not None:
+                order_name = order_name_map.get(hatikoOrder.mode)
+                log_message(f"order_info : {order_name}, {price_value}") if LOG else None
+                if order_name is not None:
                     log_message("order_info_list.append(order_info)") if LOG else None
-                    order_info_list.append(order_info)
+                    order_info_list.append(IndividualOrder(base_order, price=price_value, order_name=order_name))
         for order_info in order_info_list:
             await hatikoBase(order_info, hatikoInfo, background_tasks)
         return "[HatikoOrder Version] Hatiko Complete!!!"
@@ -831,489 +1056,347 @@ async def hatikoBase(order_info: MarketOrder, hatikoInfo: HatikoInfo, background
     
     5. Kill_Confirm 시그널 수신 (시간차 시장가 청산 기능)
     1분 대기 -> 모든 미체결 청산주문 확인 -> 미체결 주문 있으면 취소 -> remaining amount 만큼 청산
-    
+
+    시그널별 처리는 아래 hatiko_strategy handler에 있다. (order_name -> Signal 해석은 exchange.strategy.HATIKO_SIGNALS)
     """
-    
-    # 초기화 단계
-    order_result = None
-    nMaxTry = 5                # 주문 재시도 횟수
-    nGoal = 0   
-    nComplete = 0
-    isSettingFinish = False     # 매매전 ccxt 세팅 flag 
+    return await hatiko_strategy.dispatch(order_info, hatikoInfo, background_tasks)
+
+
+@hatiko_strategy.handler("near")
+async def hatiko_near(ctx: StrategyContext):
+    # near 시그널 처리
+    # 예시) nearLong1 시그널 수신
+    # nearLong1_dic 최대개수 확인 -> 미달 시, IDLE -> NEAR_PENDING 전이 -> 지정가 매수주문 -> 오더id 기록
+    order_info, hatikoInfo, signal = ctx.order_info, ctx.state, ctx.signal
     orderID_list = []           # 오더id 리스트
-    isCancelSuccess = False     # 미체결주문 취소성공 여부
-    isMissNextCandle = False    # NextCandle_LF/SF 시그널을 놓친 경우
-    isReEntry = False           # 재진입 필요여부
-    isOrderSuccess = False      # 주문 성공 여부
-    amountCanceled = 0.0        # 주문 취소한 코인개수(NextCandle 및 Kill_Confirm에서 사용)
-    sideCanceled = ""           # 취소한 주문의 방향("buy" or "sell")
-    isSendSignalDiscord = False # 트뷰 시그널이 도착했다는 알람 전송 여부
 
-    for nTry in range(nMaxTry):
-        if nGoal != 0 and nComplete == nGoal:   # 이미 매매를 성공하면 더이상의 Try를 생략함.
+    # 0. 먼저 발생하는 시그널 무시
+    near_ignore_list = hatikoInfo.nearIgnoreListOf(signal)
+    if (order_info.side == "buy" and len(near_ignore_list) < hatikoInfo.nIgnoreLong) or \
+        (order_info.side == "sell" and len(near_ignore_list) < hatikoInfo.nIgnoreShort):
+        if order_info.base not in near_ignore_list:
+            near_ignore_list.append(order_info.base)
+        log_custom_message(order_info, "IGNORE") if USE_DISCORD else None
+        return {"result" : "ignore"}
+
+    # 1. 종목 최대개수 확인 후 레벨 선점 (이미 진행 중인 레벨이면 전이가 거절됨)
+    near_dic = hatikoInfo.nearDicOf(signal)
+    if order_info.side == "buy" and len(near_dic) >= hatikoInfo.nMaxLong:
+        return {"result" : "ignore"}
+    if order_info.side == "sell" and len(near_dic) >= hatikoInfo.nMaxShort:
+        return {"result" : "ignore"}
+    if hatikoInfo.transition(order_info.base, signal, OrderState.NEAR_PENDING, expect=(OrderState.IDLE,)) is None:
+        return {"result" : "ignore"}
+
+    try:
+        # 2. 거래소 객체 생성
+        bot = await ctx.step(get_bot, order_info.exchange, order_info.kis_number)
+        bot.init_info(order_info)
+        log_message(f"order_info.is_contract : {order_info.is_contract}") if LOG else None
+
+        # 3. 지정가 Entry 주문
+        if bot.order_info.is_entry or (bot.order_info.is_spot and bot.order_info.is_buy):
+            symbol = order_info.unified_symbol
+
+            # 진입수량 설정
+            entryRate = hatikoInfo.calcEntryRate(hatikoInfo.nMaxLong, safetyMarginPercent=1) if order_info.is_spot else 0 # entryCash / FreeCash  # 현물에서 사용
+            log_message(f"entryRate : {entryRate}") if LOG else None
+            total_amount = await ctx.step(bot.get_amount_hatiko, symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort, entryRate, hatikoInfo.liquidationMDD)
+            log_message(f"total_amount : {total_amount}") if LOG else None
+            max_amount, min_amount = await ctx.step(getMinMaxQty, bot, order_info)
+            log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
+            # near 주문은 NextCandle 재주문을 위해 오더id가 모두 필요하므로 항상 한 번에 주문
+            entry_amount_list = planSlices(bot, order_info, total_amount, max_amount, min_amount).amounts
+
+            # 진입 가격은 order_info로 넘겨받음
+            entry_price = order_info.price
+            log_message(f"nGoal : {len(entry_amount_list)}") if LOG else None
+
+            # 매매 주문 (주문마다 따로 재시도하므로 이미 나간 주문은 다시 내지 않는다)
+            for i, entry_amount in enumerate(entry_amount_list):
+                log_message(f"entry_amount {i} : {entry_amount}") if LOG else None
+                order_result = await ctx.step(bot.limit_order, order_info, entry_amount, entry_price)
+                log_message(f"orderID : {order_result['id']}") if LOG else None
+                orderID_list.append(order_result["id"])
+                # 디스코드 로그생성
+                updateOrderInfo(order_info, amount=entry_amount)
+                if order_info.is_spot:
+                    order_info.leverage = None
+                log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD else None
+    except Exception:
+        # 주문이 하나도 안 나갔으면 선점 해제, 일부라도 나갔으면 나간 주문만 기록
+        hatikoInfo.transition(order_info.base, signal, OrderState.NEAR_PENDING if orderID_list else OrderState.IDLE, order_ids=orderID_list)
+        raise
+
+    # 4. 매매가 전부 종료되면 오더id 기록 (near딕셔너리도 같이 갱신됨)
+    hatikoInfo.transition(order_info.base, signal, OrderState.NEAR_PENDING, order_ids=orderID_list, expect=(OrderState.NEAR_PENDING,))
+    log_message(f"len(orderID_list) : {len(orderID_list)}") if LOG else None
+
+
+@hatiko_strategy.handler("entry")
+async def hatiko_entry(ctx: StrategyContext):
+    # Long or Short 시그널 처리
+    # 예시) Long1 시그널 수신
+    # 해당 레벨이 NEAR_PENDING이면 ENTRY_FILLED로 전이 (Long1 리스트에 추가)
+    if ctx.state.transition(ctx.order_info.base, ctx.signal, OrderState.ENTRY_FILLED, expect=(OrderState.NEAR_PENDING,)) is not None:
+        # [Debug] 트뷰 시그널이 도착했다는 알람 발생
+        log_custom_message(ctx.order_info, "ENTRY_SIGNAL")
+
+
+@hatiko_strategy.handler("next")
+async def hatiko_next(ctx: StrategyContext):
+    # NextCandle 시그널 처리
+    # 예시) NextCandle_L1 시그널 수신
+    # 해당 레벨이 NEAR_PENDING이면 미체결주문을 새 가격으로 정정(또는 취소 & 재주문) -> 새 오더id 기록
+    order_info, hatikoInfo, signal = ctx.order_info, ctx.state, ctx.signal
+    orderID_list = []           # 새 오더id 리스트
+    isCancelSuccess = False     # 미체결주문이 하나라도 취소 상태인지 (모두 체결됐으면 False)
+
+    # 0. 트뷰에서는 청산 시그널로 오기 때문에 진입으로 order_info 수정 후 디스코드 알람 전송
+    if order_info.is_futures and order_info.is_close:
+        order_info.is_entry = True
+        order_info.is_close = None
+        order_info.is_buy = None if order_info.is_buy else True
+        order_info.is_sell = None if order_info.is_sell else True
+        if order_info.side == "buy":
+            order_info.side = "sell"
+        elif order_info.side == "sell":
+            order_info.side = "buy"
+
+    if order_info.is_spot:
+        order_info.is_buy = True
+        order_info.is_sell = None
+        order_info.side = "buy"
+
+    log_message(f"orderinfo after tuning -> is_buy : {order_info.is_buy}, is_sell : {order_info.is_sell}, side = {order_info.side}") if LOG else None
+
+    # 1. 봉마감 후 재주문이 필요없으면 무시 (NEAR_PENDING이 아님)
+    current = hatikoInfo.stateOf(order_info.base, signal)
+    if current.state != OrderState.NEAR_PENDING:
+        return {"result" : "ignore"}
+
+    # 2. 미체결 주문 가격 정정 (또는 취소 & 재주문)
+    bot = await ctx.step(get_bot, order_info.exchange, order_info.kis_number)
+    bot.init_info(order_info)
+    symbol = order_info.unified_symbol
+
+    log_message(f"len(orderID_list_old): {len(current.order_ids)}") if LOG else None
+    for orderID in current.order_ids:
+        log_message(f"orderID : {orderID}") if LOG else None
+        # 그 사이 청산 시그널로 상태가 바뀐 경우 재주문하지 않는다
+        if hatikoInfo.stateOf(order_info.base, signal).state != OrderState.NEAR_PENDING:
             break
+        # 정정(amend) 지원 거래소는 주문 조회 + 정정, 나머지는 취소 후 재주문 (새 오더id와 남은 수량을 한 번에 받음)
+        # 취소 후 재주문은 반복하면 안 된다 (취소 성공 + 재주문 실패 후 재시도하면 "canceled"로 보고 주문 없이 끝남) -> 한 번만
+        repriced = await ctx.step(bot.reprice_order, orderID, symbol, order_info.price, retry=ONCE)
+        log_message(f"repriced : {repriced}") if LOG else None
+        if repriced["status"] == "closed":
+            continue
+        isCancelSuccess = True
+        if repriced["id"] is not None:
+            orderID_list.append(repriced["id"])
+            updateOrderInfo(order_info, amount=repriced["remaining"], side=repriced["side"])
+            log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD else None
+
+    # 3. 오더id 업데이트 (그 사이 청산됐으면 전이가 거절되어 아무것도 바뀌지 않음)
+    if isCancelSuccess:
+        hatikoInfo.transition(order_info.base, signal, OrderState.NEAR_PENDING, order_ids=orderID_list, expect=(OrderState.NEAR_PENDING,))
+    else:
+        # 트뷰로부터 특정 시그널 손실로 인해 이미 체결된 주문인 경우
+        hatikoInfo.transition(order_info.base, signal, OrderState.ENTRY_FILLED, expect=(OrderState.NEAR_PENDING,))
+        log_custom_message(order_info, "ORDER_CLOSED")
+        return {"result" : "ignore"}
 
-        try:
-            if order_info.order_name in HatikoInfo.nearSignal_list:
-                # near 시그널 처리
-                # 예시) nearLong1 시그널 수신
-                # nearLong1_dic 최대개수 확인 -> 미달 시, 지정가 매수주문 -> 성공 시, nearLong1_dic에 추가
-
-                # 0. 먼저 발생하는 시그널 무시
-                near_ignore_list = hatikoInfo.matchNearIgnoreList(order_info.order_name)
-                if (order_info.side == "buy" and len(near_ignore_list) < hatikoInfo.nIgnoreLong) or \
-                    (order_info.side == "sell" and len(near_ignore_list) < hatikoInfo.nIgnoreShort):
-                    if order_info.base not in near_ignore_list:
-                        near_ignore_list.append(order_info.base)
-                    log_custom_message(order_info, "IGNORE") if USE_DISCORD else None
-                    # background_tasks.add_task(log_custom_message, order_info, "IGNORE") if USE_DISCORD else None
-                    return {"result" : "ignore"}
-
-                # 1. 종목 최대개수 확인
-                near_dic = hatikoInfo.matchNearDic(order_info.order_name)
-                if order_info.side == "buy" and (len(near_dic) >= hatikoInfo.nMaxLong or order_info.base in near_dic):
-                    return {"result" : "ignore"}
-                if order_info.side == "sell" and (len(near_dic) >= hatikoInfo.nMaxShort or order_info.base in near_dic):
-                    return {"result" : "ignore"}
-                
-                # 2. 거래소 객체 생성
-                exchange_name = order_info.exchange
-                bot = get_bot(exchange_name, order_info.kis_number)
-                bot.init_info(order_info)
-                log_message(f"order_info.is_contract : {order_info.is_contract}") if LOG else None
-
-                # 3. 지정가 Entry 주문
-                if bot.order_info.is_entry or (bot.order_info.is_spot and bot.order_info.is_buy):
-                    ###################################
-                    # Entry 매매 코드
-                    ###################################
-
-                    if not isSettingFinish:   # 초기 세팅
-                        symbol = order_info.unified_symbol
-
-                        # 진입수량 설정
-                        entryRate = hatikoInfo.calcEntryRate(hatikoInfo.nMaxLong, safetyMarginPercent=1) if order_info.is_spot else 0 # entryCash / FreeCash  # 현물에서 사용
-                        log_message(f"entryRate : {entryRate}") if LOG else None
-                        total_amount = bot.get_amount_hatiko(symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort, entryRate, hatikoInfo.liquidationMDD)
-                        log_message(f"total_amount : {total_amount}") if LOG else None
-                        max_amount, min_amount = getMinMaxQty(bot, order_info)
-                        log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
-
-                        # Set nGoal and entry_amount_list
-                        if total_amount % max_amount < min_amount:
-                            nGoal = total_amount // max_amount
-                            entry_amount_list = [max_amount] * int(nGoal)
-                        else:
-                            nGoal = total_amount // max_amount + 1
-                            entry_amount_list = [max_amount] * int(nGoal - 1)
-                            remain_amount = float(bot.client.amount_to_precision(symbol, total_amount % max_amount))
-                            log_message(f"remain_amount : {remain_amount}") if LOG else None
-                            entry_amount_list.append(remain_amount)
-                        
-                        # 진입 가격은 order_info로 넘겨받음
-                        entry_price = order_info.price  
-                        isSettingFinish = True
-                    
-                    # 매매 주문
-                    log_message(f"nGoal : {nGoal}") if LOG else None
-                    for i in range(int(nGoal - nComplete)):
-                        entry_amount = entry_amount_list[nComplete]
-                        # order_result = bot.client.create_order(symbol, "limit", side, abs(entry_amount), entry_price)
-                        log_message(f"entry_amount {i} : {entry_amount}") if LOG else None
-                        order_result = bot.limit_order(order_info, entry_amount, entry_price)   # 실패 시 재시도는 bot.limit_order 안에서 처리
-                        log_message(f"orderID : {order_result['id']}") if LOG else None
-                        orderID_list.append(order_result["id"])
-                        nComplete += 1
-                        # 디스코드 로그생성
-                        updateOrderInfo(order_info, amount=entry_amount)
-                        if order_info.is_spot:
-                            order_info.leverage = None
-                        log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD else None
-                        # background_tasks.add_task(log, exchange_name, order_result, order_info) if USE_DISCORD else None                    
-                # 4. 매매가 전부 종료되면 near딕셔너리 업데이트
-                near_dic[order_info.base] = orderID_list
-                log_message(f"len(orderID_list) : {len(orderID_list)}") if LOG else None
-
-            elif order_info.order_name in HatikoInfo.entrySignal_list:
-                # Long or Short 시그널 처리
-                # 예시) Long1 시그널 수신
-                # 해당 종목이 nearLong1_dic에 존재하는지 확인 -> 존재 시, Long1 리스트에 추가
-                
-                near_dic = hatikoInfo.matchNearDic(order_info.order_name)
-                entry_list = hatikoInfo.matchEntryList(order_info.order_name)
-                if order_info.base in near_dic and order_info.base not in entry_list:
-                    entry_list.append(order_info.base)
-                    # [Debug] 트뷰 시그널이 도착했다는 알람 발생
-                    if not isSendSignalDiscord:
-                        log_custom_message(order_info, "ENTRY_SIGNAL")
-                        # background_tasks.add_task(log_custom_message, order_info, "ENTRY_SIGNAL")
-                        isSendSignalDiscord = True
-
-            elif order_info.order_name in HatikoInfo.nextSignal_list:
-                # NextCandle 시그널 처리
-                # 예시) NextCandle_L1 시그널 수신
-                # 해당 종목이 nearLong1_dic에 존재하는지 확인 -> 존재 시, Long1_list에 없으면 미체결주문 체크 -> 미체결주문 취소 & 신규 Long1 주문
-                
-                # 0. 트뷰에서는 청산 시그널로 오기 때문에 진입으로 order_info 수정 후 디스코드 알람 전송
-                if order_info.is_futures and order_info.is_close:
-                    order_info.is_entry = True
-                    order_info.is_close = None
-                    order_info.is_buy = None if order_info.is_buy else True
-                    order_info.is_sell = None if order_info.is_sell else True
-                    if order_info.side == "buy":
-                        order_info.side = "sell"
-                    elif order_info.side == "sell":
-                        order_info.side = "buy"
 
-                if order_info.is_spot:
-                    order_info.is_buy = True
-                    order_info.is_sell = None
-                    order_info.side = "buy"
-
-                log_message(f"orderinfo after tuning -> is_buy : {order_info.is_buy}, is_sell : {order_info.is_sell}, side = {order_info.side}") if LOG else None
-
-                # 1. 봉마감 후 재주문이 필요없으면 무시
-                near_dic = hatikoInfo.matchNearDic(order_info.order_name)
-                entry_list = hatikoInfo.matchEntryList(order_info.order_name)
-                if order_info.base not in near_dic or order_info.base in entry_list: 
-                    return {"result" : "ignore"}
-
-                # 2. 미체결 주문 취소 & 재주문
-                exchange_name = order_info.exchange
-                bot = get_bot(exchange_name, order_info.kis_number)
-                bot.init_info(order_info)
-                symbol = order_info.unified_symbol
-
-                orderID_list_old = near_dic[order_info.base]
-                log_message(f"len(orderID_list_old): {len(orderID_list_old)}") if LOG else None
-                for orderID in orderID_list_old:
-                    log_message(f"orderID : {orderID}") if LOG else None
-                    # 미체결 주문 취소
-                    for i in range(5):
-                        if amountCanceled > 0:
-                            break
-                        order = bot.fetch_order(orderID, symbol)
-                        log_message(f"order['status'] : {order['status']}") if LOG else None
-                        if order["status"] == "canceled":
-                            isCancelSuccess = True
-                            amountCanceled = order["remaining"]
-                            sideCanceled = order["side"]
-                        elif order["status"] == "open":
-                            isReEntry = True
-                            resultCancel = bot.client.cancel_order(orderID, symbol)
-                            log_message(f"resultCancel['status'] : {resultCancel['status']}") if LOG else None
-                            if exchange_name == "BINANCE":
-                                orderAfterCancel = resultCancel
-                            elif exchange_name == "BYBIT" and order_info.is_futures:
-                                orderAfterCancel = order
-                                orderAfterCancel["status"] = "canceled" # bybit futures에서는 취소 후 바로 fetch_order를 하면 status가 canceled로 나오지 않음
-                            else:
-                                orderAfterCancel = bot.fetch_order(orderID, symbol)
-                            log_message(f"orderAfterCancel['status'] : {orderAfterCancel['status']}") if LOG else None
-                            if orderAfterCancel["status"] == "canceled":
-                                isCancelSuccess = True
-                                amountCanceled = orderAfterCancel["remaining"]
-                                sideCanceled = orderAfterCancel["side"]
-                                # [Debug] 미체결 주문 취소 후 알람 발생
-                                log_custom_message(order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                                # background_tasks.add_task(log_custom_message, order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                        elif order["status"] == "closed":
-                            break
-
-
-                    if isReEntry and amountCanceled > 0 and order_info.base in near_dic: # asyncio.sleep(0.1) 때문에 NextCandle 로직 중에 비동기로 이미 Close 주문을 행사한 경우 재주문 방지
-                        # 재주문 
-                        log_message(f"symbol : {symbol}, sideCanceled : {sideCanceled}, amountCanceled : {amountCanceled}, price : {order_info.price}") if LOG else None
-                        # order_result = bot.client.create_order(symbol, "limit", sideCanceled, amountCanceled, order_info.price)
-                        order_result = bot.limit_order(order_info, amountCanceled, order_info.price)
-                        isReEntry = False
-                        orderID_list.append(order_result["id"])
-
-                        updateOrderInfo(order_info, amount=amountCanceled, side=sideCanceled)
-                        log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD else None
-                        # background_tasks.add_task(log, exchange_name, order_result, order_info) if USE_DISCORD else None
-                        amountCanceled = 0.0
-                        sideCanceled = ""
-
-                # 3. near_dic 오더id 업데이트
-                if isCancelSuccess:
-                    # NextCandle 로직 중에 비동기로 이미 Close 주문을 행사한 경우 재주문 방지
-                    if order_info.base in near_dic:
-                        near_dic[order_info.base] = orderID_list
-                else:
-                    # 트뷰로부터 특정 시그널 손실로 인해 이미 체결된 주문인 경우
-                    entry_list.append(order_info.base)
-                    log_custom_message(order_info, "ORDER_CLOSED")
-                    # background_tasks.add_task(log_custom_message, order_info, "ORDER_CLOSED")
-                    return {"result" : "ignore"}
-
-            elif order_info.order_name in HatikoInfo.nextCloseSignal_list:
-                # NextCandle Close 시그널 처리
-                # 예시) NextCandle_LF 시그널 수신
-                # 해당 종목이 Entry_list에 존재하는지 확인 -> 미체결 청산주문 체크 -> 미체결 주문 취소 후 모든 보유수량으로 청산주문 -> orderId_list에 추가
-                
-                # 1. Entry_list에 존재하는지 확인
-                if order_info.order_name == "NextCandle_LF" and order_info.base not in (hatikoInfo.Long1_list + hatikoInfo.Long2_list + hatikoInfo.Long3_list + hatikoInfo.Long4_list):
-                    return {"result" : "ignore"}
-                if order_info.order_name == "NextCandle_SF" and order_info.base not in (hatikoInfo.Short1_list + hatikoInfo.Short2_list + hatikoInfo.Short3_list + hatikoInfo.Short4_list):
-                    return {"result" : "ignore"}
-
-                # 2. 미체결 청산주문 취소
-                exchange_name = order_info.exchange
-                bot = get_bot(exchange_name, order_info.kis_number)
-                bot.init_info(order_info)
-                symbol = order_info.unified_symbol
-                open_orders = bot.client.fetch_open_orders(symbol)
-                for open_order in open_orders:
-                    if (open_order["side"] == "sell" and order_info.order_name == "NextCandle_LF") or (open_order["side"] == "buy" and order_info.order_name == "NextCandle_SF"):
-                        bot.client.cancel_order(open_order["id"], symbol)
-                        isCancelSuccess = True
-
-                # 미체결 주문 취소 후 알람 발생
-                if not isSendSignalDiscord and isCancelSuccess:
-                    log_custom_message(order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                    # background_tasks.add_task(log_custom_message, order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                    isSendSignalDiscord = True
-
-                # 3. 모든 보유수량으로 청산주문
-                if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell):
-                    #############################
-                    ## Close 매매코드
-                    #############################
-                    if not isSettingFinish:
-                        # 초기 세팅
-                        # total amount를 max_amount로 쪼개기
-                        total_amount = bot.get_amount_hatiko(symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort)
-                        log_message(f"total_amount : {total_amount}") if LOG else None
-                        max_amount, min_amount = getMinMaxQty(bot, order_info)
-                        log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
-
-                        # Set nGoal and entry_amount_list
-                        if total_amount % max_amount < min_amount:
-                            nGoal = total_amount // max_amount
-                            close_amount_list = [max_amount] * int(nGoal)
-                        else:
-                            nGoal = total_amount // max_amount + 1
-                            close_amount_list = [max_amount] * int(nGoal - 1)
-                            remain_amount = float(bot.client.amount_to_precision(symbol, total_amount % max_amount))
-                            log_message(f"remain_amount : {remain_amount}") if LOG else None
-                            close_amount_list.append(remain_amount)
-                        log_message(f"len(close_amount_list) : {len(close_amount_list)}") if LOG else None
-                        
-                        # 트뷰에 나오는 청산 가격에 그대로 청산
-                        close_price = order_info.price  
-                        isSettingFinish = True
-
-                    # (2) 청산 주문
-                    for i in range(int(nGoal-nComplete)):
-                        close_amount = close_amount_list[nComplete]
-                        if close_amount < min_amount:
-                            nComplete += 1
-                        else:
-                            # order_result = bot.future.create_order(symbol, "limit", side, close_amount, close_price, params={"reduceOnly": True})
-                            log_message(f"close_amount : {close_amount}") if LOG else None
-                            order_result = bot.limit_order(order_info, close_amount, close_price)
-                            orderID_list.append(order_result["id"])
-                            nComplete += 1
-                            updateOrderInfo(order_info, amount=close_amount)
-                            log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD else None
-                            # background_tasks.add_task(log, exchange_name, order_result, order_info) if USE_DISCORD else None
-
-                    # 4. 매매가 전부 종료되면 closePrice_dic 업데이트
-                    hatikoInfo.closePrice_dic[order_info.base] = close_price
-
-            elif order_info.order_name in HatikoInfo.closeSignal_list:
-                # 청산 시그널 처리
-                # 예시) 청산 시그널 수신
-                # 해당 종목이 nearLong1_list에 존재하는지 확인 -> 존재 시, 청산 주문 & 미체결 주문 취소 -> 성공 시, 존재하는 모든 리스트에서 제거
-                
-                # 0. near_ignore_list 초기화
-                if removeItemFromMultipleLists(order_info.base,
-                                               hatikoInfo.nearLong1_ignore_list, hatikoInfo.nearLong2_ignore_list, hatikoInfo.nearLong3_ignore_list, hatikoInfo.nearLong4_ignore_list,
-                                               hatikoInfo.nearShort1_ignore_list, hatikoInfo.nearShort2_ignore_list, hatikoInfo.nearShort3_ignore_list, hatikoInfo.nearShort4_ignore_list):
-                    log_custom_message(order_info, "IGNORE_CANCEL") if USE_DISCORD else None
-                    # background_tasks.add_task(log_custom_message, order_info, "IGNORE_CANCEL") if USE_DISCORD else None
-
-                # 1. 안 산 주문에 대한 종료 무시
-                if order_info.base not in (list(hatikoInfo.nearLong1_dic) + list(hatikoInfo.nearLong2_dic) + list(hatikoInfo.nearLong3_dic) + list(hatikoInfo.nearLong4_dic) + \
-                                            list(hatikoInfo.nearShort1_dic) + list(hatikoInfo.nearShort2_dic) + list(hatikoInfo.nearShort3_dic) + list(hatikoInfo.nearShort4_dic)):
-                    return {"result" : "ignore"}
-
-                # 2. 미체결 주문 취소
-                exchange_name = order_info.exchange
-                bot = get_bot(exchange_name, order_info.kis_number)
-                bot.init_info(order_info)
-                symbol = order_info.unified_symbol
-                open_orders = bot.client.fetch_open_orders(symbol)
-                for open_order in open_orders:
-                    # 미리 청산한 주문인 경우
-                    if (open_order["side"] == "sell" and order_info.is_sell) or (open_order["side"] == "buy" and order_info.is_buy):
-                        # NextCandle_LF가 씹힌 경우 미체결 주문 취소
-                        # 선물인 경우, free_balance 조회가 불가능해서 무조건 취소
-                        if (order_info.price != hatikoInfo.closePrice_dic.get(order_info.base) or order_info.is_futures):
-                            bot.client.cancel_order(open_order["id"], symbol)
-                            isMissNextCandle = True
-                            isCancelSuccess = True
-                    else: # 기존 매수주문 취소
-                        bot.client.cancel_order(open_order["id"], symbol)
-                        isCancelSuccess = True
-
-                # 미체결 주문 취소 후 알람 발생
-                if not isSendSignalDiscord and isCancelSuccess:
-                    # background_tasks.add_task(log_custom_message, order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                    log_custom_message(order_info, "CANCEL_ORDER") if USE_DISCORD else None
-                    isSendSignalDiscord = True
-
-                # 3. 청산 주문
-                if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell):
-                    #############################
-                    ## Close 매매코드
-                    #############################
-                    if not isSettingFinish:
-                        # 초기 세팅
-                        # total amount를 max_amount로 쪼개기
-                        total_amount = bot.get_amount_hatiko(symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort)
-                        log_message(f"total_amount : {total_amount}") if LOG else None
-                        max_amount, min_amount = getMinMaxQty(bot, order_info)
-                        log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
-
-                        # Set nGoal and entry_amount_list
-                        if total_amount % max_amount < min_amount:
-                            nGoal = total_amount // max_amount
-                            close_amount_list = [max_amount] * int(nGoal)
-                        else:
-                            nGoal = total_amount // max_amount + 1
-                            close_amount_list = [max_amount] * int(nGoal - 1)
-                            remain_amount = float(bot.client.amount_to_precision(symbol, total_amount % max_amount))
-                            log_message(f"remain_amount : {remain_amount}") if LOG else None
-                            close_amount_list.append(remain_amount)
-                        log_message(f"len(close_amount_list) : {len(close_amount_list)}") if LOG else None
-                        
-                        # 트뷰에 나오는 청산 가격에 그대로 청산
-                        close_price = order_info.price  
-                        isSettingFinish = True
-
-                    # (2) 청산 주문
-                    for i in range(int(nGoal-nComplete)):
-                        close_amount = close_amount_list[nComplete]
-                        if close_amount < min_amount:
-                            nComplete += 1
-                        else:
-                            # order_result = bot.future.create_order(symbol, "limit", side, close_amount, close_price, params={"reduceOnly": True})
-                            log_message(f"close_amount : {close_amount}") if LOG else None
-                            order_result = bot.limit_order(order_info, close_amount, close_price)
-                            isOrderSuccess = True
-                            nComplete += 1
-                            updateOrderInfo(order_info, amount=close_amount)
-                            log_custom_message(order_info, "ORDER_COMPLETE")
-                            # background_tasks.add_task(log, exchange_name, order_result, order_info)
-
-                # 미체결 주문 취소한 것도 없고, 새로 청산주문할 것도 없는 경우 알람 발생
-                if not isMissNextCandle and not isOrderSuccess and hatikoInfo.closePrice_dic.get(order_info.base) is not None:
-                    # background_tasks.add_task(log_custom_message, order_info, "CLOSE_SIGNAL")
-                    log_custom_message(order_info, "CLOSE_SIGNAL")
-
-                # 4. 매매가 전부 종료된 후 매매종목 리스트 업데이트
-                removeItemFromMultipleDicts(order_info.base,
-                                            hatikoInfo.nearLong1_dic, hatikoInfo.nearLong2_dic, hatikoInfo.nearLong3_dic, hatikoInfo.nearLong4_dic,
-                                            hatikoInfo.nearShort1_dic, hatikoInfo.nearShort2_dic, hatikoInfo.nearShort3_dic, hatikoInfo.nearShort4_dic,
-                                            hatikoInfo.closePrice_dic)
-                removeItemFromMultipleLists(order_info.base,
-                                            hatikoInfo.Long1_list, hatikoInfo.Long2_list, hatikoInfo.Long3_list, hatikoInfo.Long4_list,
-                                            hatikoInfo.Short1_list, hatikoInfo.Short2_list, hatikoInfo.Short3_list, hatikoInfo.Short4_list)
-
-                # 5. 시간차 청산주문 단계로 이동
-                if KILL_CONFIRM:
-                    # KILL_MINUTE 분 대기
-                    await asyncio.sleep(60 * KILL_MINUTE) 
-                    # 재귀 호출
-                    updateOrderInfo(order_info, order_name="Kill_Confirm")
-                    await hatikoBase(order_info, hatikoInfo, background_tasks)
-
-            elif order_info.order_name in HatikoInfo.ignoreSignal_list:
-                return {"result" : "ignore"}
-
-            elif order_info.order_name == "Kill_Confirm":
-                # 1. 미체결 주문 취소
-                exchange_name = order_info.exchange
-                bot = get_bot(exchange_name, order_info.kis_number)
-                bot.init_info(order_info)
-                symbol = order_info.unified_symbol
-                open_orders = bot.client.fetch_open_orders(symbol)
-                for open_order in open_orders :
-                    # 청산 주문이 남아있는 경우
-                    if (open_order["side"] == "sell" and order_info.is_sell) or (open_order["side"] == "buy" and order_info.is_buy) :
-                        bot.client.cancel_order(open_order["id"], symbol)
-                        amountCanceled += open_order["remaining"]
-                        isCancelSuccess = True
-                            
-                # 2. 청산 주문
-                if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell) :
-                    #############################
-                    ## Close 매매코드
-                    #############################
-                    if not isSettingFinish :
-                        # 초기 세팅
-                        # total amount를 max_amount로 쪼개기
-                        total_amount = amountCanceled
-                        log_message(f"total_amount : {total_amount}") if LOG else None
-                        max_amount, min_amount = getMinMaxQty(bot, order_info)
-                        log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
-
-                        # Set nGoal and entry_amount_list
-                        if total_amount% max_amount < min_amount:
-                            nGoal = total_amount // max_amount
-                            close_amount_list = [max_amount] * int(nGoal)
-                        else:
-                            nGoal = total_amount // max_amount + 1
-                            close_amount_list = [max_amount] * int(nGoal - 1)
-                            remain_amount = float(bot.client.amount_to_precision(symbol, total_amount % max_amount))
-                            log_message(f"remain_amount : {remain_amount}") if LOG else None
-                            close_amount_list.append(remain_amount)
-                            log_message(f"len(close_amount_list) : {len(close_amount_list)}") if LOG else None
-
-                    # 청산가는 현재가 * 0.99
-                    close_price = bot.get_price(symbol) * 0.99
-                    isSettingFinish = True
-
-                    # 청산 주문
-                    for i in range(int(nGoal - nComplete)) :
-                        close_amount = close_amount_list[nComplete]
-                        if close_amount < min_amount :
-                            nComplete += 1
-                        else :
-                            # order_result = bot.future.create_order(symbol, "limit", side, close_amount, close_price, params = { "reduceOnly": True })
-                            log_message(f"close_amount : {close_amount}") if LOG else None
-                            updateOrderInfo(order_info, amount=close_amount)
-                            # order_result = bot.market_order(order_info)
-                            order_result = bot.limit_order(order_info, close_amount, close_price)
-                            isOrderSuccess = True
-                            nComplete += 1
-                            log_custom_message(order_info, "ORDER_COMPLETE")
-                            # background_tasks.add_task(log, exchange_name, order_result, order_info)
-
-            else:
-                log_custom_message(order_info, "ORDER_NAME_INCORRECT")
-                # background_tasks.add_task(log_custom_message, order_info, "ORDER_NAME_INCORRECT")
-                return {"result" : "ignore"}
-
-        except TypeError as e:
-            error_msg = get_error(e)
-            log_message(f"[{order_info.base}] : {order_info.order_name} 에러 발생")
-            log_order_error_message("\n".join(error_msg), order_info)
-            # background_tasks.add_task(log_order_error_message, "\n".join(error_msg), order_info)
+async def hatikoClose(ctx: StrategyContext, bot, symbol: str, total_amount: float, close_price: float, always_log: bool = False) -> bool:
+    """
+    total_amount를 slice로 나눠서 close_price에 지정가 청산. 주문을 하나라도 냈으면 True
+    SLICE_MODE가 twap / iceberg면 첫 slice만 여기서 주문하고 나머지는 백그라운드로 주문한다.
+    always_log : USE_DISCORD와 상관없이 주문 완료 알람 전송 (청산 시그널, Kill_Confirm)
+    """
+    order_info = ctx.order_info
+    log_message(f"total_amount : {total_amount}") if LOG else None
+    max_amount, min_amount = await ctx.step(getMinMaxQty, bot, order_info)
+    log_message(f"max_amount : {max_amount}, min_amount : {min_amount}") if LOG else None
+    plan = planSlices(bot, order_info, total_amount, max_amount, min_amount, mode=settings.SLICE_MODE)
+    log_message(f"len(close_amount_list) : {len(plan.amounts)}") if LOG else None
+
+    def on_fill(job: SliceJob, fill, event: str):
+        log_message(f"[{job.key}] slice {fill.index + 1}/{len(job.fills)} {event} : amount {fill.amount}, filled {fill.filled}, status {fill.status}") if LOG else None
+        if event == "placed":
+            updateOrderInfo(order_info, amount=fill.amount)
+            log_custom_message(order_info, "ORDER_COMPLETE") if USE_DISCORD or always_log else None
+
+    job = SliceJob(
+        sliceKey(order_info),
+        plan,
+        place=lambda amount: ctx.step(bot.limit_order, order_info, amount, close_price),
+        fetch=lambda order_id: ctx.step(bot.fetch_order, order_id, symbol),
+        on_fill=on_fill,
+    )
+    return await job.start()
+
+
+@hatiko_strategy.handler("next_close")
+async def hatiko_next_close(ctx: StrategyContext):
+    # NextCandle Close 시그널 처리
+    # 예시) NextCandle_LF 시그널 수신
+    # Long 레벨 중 ENTRY_FILLED가 있는지 확인 -> 미체결 청산주문 취소 후 모든 보유수량으로 청산주문
+    order_info, hatikoInfo, signal = ctx.order_info, ctx.state, ctx.signal
+
+    # 1. 진입 완료된 레벨이 있는지 확인
+    if not hatikoInfo.levelsIn(order_info.base, (OrderState.ENTRY_FILLED,), signal.side):
+        return {"result" : "ignore"}
+
+    # 2. 미체결 청산주문 취소 (Long 포지션의 청산주문은 sell, Short는 buy)
+    bot = await ctx.step(get_bot, order_info.exchange, order_info.kis_number)
+    bot.init_info(order_info)
+    symbol = order_info.unified_symbol
+    close_side = "sell" if signal.side == "Long" else "buy"
+    slicing.cancel_jobs(sliceKey(order_info))  # 아직 남은 분할 청산 일정 중단
+    open_orders = await ctx.step(bot.client.fetch_open_orders, symbol)
+    canceled_orders = [open_order for open_order in open_orders if open_order["side"] == close_side]
+    for open_order in canceled_orders:
+        await ctx.step(bot.client.cancel_order, open_order["id"], symbol)
+
+    # 미체결 주문 취소 후 알람 발생
+    if canceled_orders:
+        log_custom_message(order_info, "CANCEL_ORDER") if USE_DISCORD else None
+
+    # 3. 모든 보유수량으로 청산주문
+    if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell):
+        total_amount = await ctx.step(bot.get_amount_hatiko, symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort)
+        # 트뷰에 나오는 청산 가격에 그대로 청산
+        close_price = order_info.price
+        await hatikoClose(ctx, bot, symbol, total_amount, close_price)
+
+        # 4. 매매가 전부 종료되면 closePrice_dic 업데이트
+        hatikoInfo.closePrice_dic[order_info.base] = close_price
+
+
+@hatiko_strategy.handler("close")
+async def hatiko_close(ctx: StrategyContext):
+    # 청산 시그널 처리
+    # 예시) 청산 시그널 수신
+    # 진행 중인 레벨을 CLOSING으로 선점 -> 미체결 주문 취소 & 청산 주문 -> 성공 시 IDLE (모든 리스트에서 제거)
+    order_info, hatikoInfo = ctx.order_info, ctx.state
+    isMissNextCandle = False    # NextCandle_LF/SF 시그널을 놓친 경우
+    isOrderSuccess = False      # 주문 성공 여부
 
-        except Exception as e:
-            error_msg = get_error(e)
-            log_message(f"[{order_info.base}] : {order_info.order_name} 에러 발생")
-            log_order_error_message("\n".join(error_msg), order_info)
-            # background_tasks.add_task(log_error, "\n".join(error_msg), order_info)
+    # 0. near_ignore_list 초기화
+    if removeItemFromMultipleLists(order_info.base, *hatikoInfo.nearIgnoreLists()):
+        log_custom_message(order_info, "IGNORE_CANCEL") if USE_DISCORD else None
 
-        else:
-            return {"result": "success"}
+    # 1. 진행 중인 레벨 선점. 안 산 주문(모두 IDLE)이나 이미 청산 중인 경우는 무시
+    claimed = {}
+    for signal in hatikoInfo.levelsIn(order_info.base, (OrderState.NEAR_PENDING, OrderState.ENTRY_FILLED)):
+        previous = hatikoInfo.stateOf(order_info.base, signal)
+        if hatikoInfo.transition(order_info.base, signal, OrderState.CLOSING, expect=(previous.state,)) is not None:
+            claimed[signal] = previous
+    if not claimed:
+        return {"result" : "ignore"}
 
-        finally:
-            pass
+    try:
+        # 2. 미체결 주문 취소
+        bot = await ctx.step(get_bot, order_info.exchange, order_info.kis_number)
+        bot.init_info(order_info)
+        symbol = order_info.unified_symbol
+        slicing.cancel_jobs(sliceKey(order_info))  # 아직 남은 분할 청산 일정 중단
+        open_orders = await ctx.step(bot.client.fetch_open_orders, symbol)
+        canceled_orders = []
+        for open_order in open_orders:
+            # 미리 청산한 주문인 경우
+            if (open_order["side"] == "sell" and order_info.is_sell) or (open_order["side"] == "buy" and order_info.is_buy):
+                # NextCandle_LF가 씹힌 경우 미체결 주문 취소
+                # 선물인 경우, free_balance 조회가 불가능해서 무조건 취소
+                if (order_info.price != hatikoInfo.closePrice_dic.get(order_info.base) or order_info.is_futures):
+                    isMissNextCandle = True
+                    canceled_orders.append(open_order)
+            else: # 기존 매수주문 취소
+                canceled_orders.append(open_order)
+        for open_order in canceled_orders:
+            await ctx.step(bot.client.cancel_order, open_order["id"], symbol)
+
+        # 미체결 주문 취소 후 알람 발생
+        if canceled_orders:
+            log_custom_message(order_info, "CANCEL_ORDER") if USE_DISCORD else None
+
+        # 3. 청산 주문
+        if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell):
+            total_amount = await ctx.step(bot.get_amount_hatiko, symbol, hatikoInfo.nMaxLong, hatikoInfo.nMaxShort)
+            # 트뷰에 나오는 청산 가격에 그대로 청산
+            isOrderSuccess = await hatikoClose(ctx, bot, symbol, total_amount, order_info.price, always_log=True)
+    except Exception:
+        # 청산 실패 시 선점한 레벨을 원래 상태로 되돌려서 다음 청산 시그널을 받을 수 있게 한다
+        for signal, previous in claimed.items():
+            hatikoInfo.transition(order_info.base, signal, previous.state, order_ids=previous.order_ids, expect=(OrderState.CLOSING,))
+        raise
+
+    # 미체결 주문 취소한 것도 없고, 새로 청산주문할 것도 없는 경우 알람 발생
+    if not isMissNextCandle and not isOrderSuccess and hatikoInfo.closePrice_dic.get(order_info.base) is not None:
+        log_custom_message(order_info, "CLOSE_SIGNAL")
+
+    # 4. 매매가 전부 종료된 후 상태 초기화 (near딕셔너리 / entry리스트에서도 제거됨)
+    for signal in claimed:
+        hatikoInfo.transition(order_info.base, signal, OrderState.IDLE, expect=(OrderState.CLOSING,))
+    removeItemFromMultipleDicts(order_info.base, hatikoInfo.closePrice_dic)
+
+    # 5. 시간차 청산주문 단계로 이동
+    if KILL_CONFIRM and hatikoInfo.transition(order_info.base, None, OrderState.KILL_PENDING, expect=(OrderState.IDLE,)) is not None:
+        # KILL_MINUTE 분 대기
+        await asyncio.sleep(60 * KILL_MINUTE) 
+        # 재귀 호출
+        updateOrderInfo(order_info, order_name="Kill_Confirm")
+        await hatikoBase(order_info, hatikoInfo, ctx.background_tasks)
+
+
+@hatiko_strategy.handler("kill")
+async def hatiko_kill(ctx: StrategyContext):
+    order_info = ctx.order_info
+    # 0. KILL_PENDING인 종목만 처리 (중복 Kill_Confirm 무시)
+    if ctx.state.transition(order_info.base, None, OrderState.IDLE, expect=(OrderState.KILL_PENDING,)) is None:
+        return {"result" : "ignore"}
+
+    # 1. 미체결 주문 취소
+    bot = await ctx.step(get_bot, order_info.exchange, order_info.kis_number)
+    bot.init_info(order_info)
+    symbol = order_info.unified_symbol
+    slicing.cancel_jobs(sliceKey(order_info))  # 아직 남은 분할 청산 일정 중단
+    open_orders = await ctx.step(bot.client.fetch_open_orders, symbol)
+    # 청산 주문이 남아있는 경우
+    canceled_orders = [open_order for open_order in open_orders
+                       if (open_order["side"] == "sell" and order_info.is_sell) or (open_order["side"] == "buy" and order_info.is_buy)]
+    for open_order in canceled_orders:
+        await ctx.step(bot.client.cancel_order, open_order["id"], symbol)
+
+    # 2. 청산 주문 (청산가는 현재가 * 0.99, DEPTH_SIZING이면 호가창에서 전량 체결되는 가격 (최대 DEPTH_KILL_SLIPPAGE))
+    if order_info.is_close or (bot.order_info.is_spot and bot.order_info.is_sell) :
+        amountCanceled = sum(open_order["remaining"] for open_order in canceled_orders)
+        close_price = None
+        if settings.DEPTH_SIZING:
+            close_price = await ctx.step(depth.kill_price, bot.client, symbol, order_info.side, amountCanceled)
+        if close_price is None:
+            close_price = await ctx.step(bot.get_price, symbol) * 0.99
+        await hatikoClose(ctx, bot, symbol, amountCanceled, close_price, always_log=True)
+
+
+@hatiko_strategy.handler("ignore")
+async def hatiko_ignore(ctx: StrategyContext):
+    return {"result" : "ignore"}
+
+
+@hatiko_strategy.handler(UNKNOWN)
+async def hatiko_unknown(ctx: StrategyContext):
+    log_custom_message(ctx.order_info, "ORDER_NAME_INCORRECT")
+    return {"result" : "ignore"}
+
+
+@hatiko_strategy.error_handler
+def hatiko_error(ctx: StrategyContext, e: Exception):
+    # step 재시도를 모두 실패한 경우
+    error_msg = get_error(e)
+    log_message(f"[{ctx.order_info.base}] : {ctx.order_info.order_name} 에러 발생")
+    log_order_error_message("\n".join(error_msg), ctx.order_info)
 
 
 #endregion Hatiko Main Function
@@ -1325,79 +1408,38 @@ async def hatikoBase(order_info: MarketOrder, hatikoInfo: HatikoInfo, background
 
 #region ############################### 켈트너 + Hatiko in Upbit #################################
 
-kctrend_long_list = []   # 켈트너 추세 전략 Long 진입 중인 종목들 list
-
-hatiko_long1_list = []    # Hatiko 전략 Long1 진입 중인 종목들 list
-hatiko_long2_list = []    # Hatiko 전략 Long2 진입 중인 종목들 list
-hatiko_long3_list = []    # Hatiko 전략 Long3 진입 중인 종목들 list
-hatiko_long4_list = []    # Hatiko 전략 Long4 진입 중인 종목들 list
+kctrendInfo = KctrendInfo()   # 켈트너 / Hatiko 진입 중인 종목 집합 (HatikoInfo와 같이 파일에 저장)
 
 @ app.get("/reset_kctrendandhatiko")
 async def resetkctrendandhatiko():
-    global kctrend_long_list, hatiko_long1_list, hatiko_long2_list, hatiko_long3_list, hatiko_long4_list
-
-    # kctrend + hatiko 관련 전역변수 초기화
-    kctrend_long_list = []
-
-    hatiko_long1_list = []
-    hatiko_long2_list = []
-    hatiko_long3_list = []
-    hatiko_long4_list = []
-    
-    return "Intialize kctrend & hatiko Variables Completed!!!"
+    # kctrend + hatiko 관련 상태 초기화 (sqlite store인 경우 모든 워커에 반영)
+    return kctrendInfo.resetKctrendInfo()
 
 @ app.get("/kctrendandhatiko_info")
 async def kctrendandhatikoinfo():
-    res = {
-        "kctrend_long_list" : str(kctrend_long_list),
-        "hatiko_long1_list" : str(hatiko_long1_list),
-        "hatiko_long2_list" : str(hatiko_long2_list),
-        "hatiko_long3_list" : str(hatiko_long3_list),
-        "hatiko_long4_list" : str(hatiko_long4_list),
-    }
-    return res
+    return kctrendInfo.getKctrendInfo()
 
-def match_hatiko_long_list(order_name: str):
+def get_amount_kctrend_hatiko(order_info: MarketOrder, bot, kind: str):
     """
-    [켈트너 + Hatiko 결합 전략 전용 함수]
-    order_name에 따라 해당하는 hatiko_long_list를 반환
+    kind : kctrend_entry / entry(Hatiko 진입) / 그 외(청산)
+    잔고는 fetch_free_balance 한 번으로 quote(현금)와 base(코인)를 같이 읽는다.
     """
-    global hatiko_long1_list, hatiko_long2_list, hatiko_long3_list, hatiko_long4_list
-
-    if order_name in ["nearLong1", "Long1", "NextCandle_L1"]:
-        return hatiko_long1_list
-    if order_name in ["nearLong2", "Long2", "NextCandle_L2"]:
-        return hatiko_long2_list
-    if order_name in ["nearLong3", "Long3", "NextCandle_L3"]:
-        return hatiko_long3_list
-    if order_name in ["nearLong4", "Long4", "NextCandle_L4"]:
-        return hatiko_long4_list
-
-def get_amount_kctrend_hatiko(order_info: MarketOrder, bot):
-    global kctrend_long_list, hatiko_long1_list, hatiko_long2_list, hatiko_long3_list, hatiko_long4_list
-
-    kctrend_buy_signal_list = ["kctrend Long"]
-    hatiko_buy_signal_list = ["Long1", "Long2", "Long3", "Long4"]
-
     # upbit 계좌 상태 읽어오기
-    try :
-        free_cash = bot.get_balance(order_info.quote)
-    except:
-        free_cash = 0.0
-
     try:
-        free_coin = bot.get_balance(order_info.base)
-    except:
-        free_coin = 0.0
+        free_balance = bot.client.fetch_free_balance()
+    except Exception:
+        free_balance = {}
+    free_cash = free_balance.get(order_info.quote) or 0.0
+    free_coin = free_balance.get(order_info.base) or 0.0
 
     # 진입 오더의 경우
     if order_info.is_spot and order_info.is_buy:
         # hatiko 진입 갯수 확인
-        hatiko_count_all = len(hatiko_long1_list + hatiko_long2_list + hatiko_long3_list + hatiko_long4_list)
-        hatiko_count_mine = (hatiko_long1_list + hatiko_long2_list + hatiko_long3_list + hatiko_long4_list).count(order_info.base)
+        hatiko_count_all = kctrendInfo.hatikoCount()
+        hatiko_count_mine = kctrendInfo.hatikoCountOf(order_info.base)
         
         # 켈트너 진입 갯수 확인
-        kctrend_count_all = len(kctrend_long_list)
+        kctrend_count_all = len(kctrendInfo.kctrend_long_set)
 
         # total cash 계산
         used_hatiko_portion_all = hatiko_count_all / 8.0
@@ -1410,17 +1452,19 @@ def get_amount_kctrend_hatiko(order_info: MarketOrder, bot):
 
         # ---------- 시그널 종류에 따른 차이 ----------
         # case 1) 켈트너 진입 오더
-        if order_info.order_name in kctrend_buy_signal_list:
+        if kind == "kctrend_entry":
             # kctrend에 사용할 cash 계산
             cash_for_kctrend = total_cash / 2
             used_cash_in_hatiko_already = total_cash * hatiko_count_mine / 8
             entry_cash = cash_for_kctrend - used_cash_in_hatiko_already
             
         # case 2) Hatiko 진입 오더
-        if order_info.order_name in hatiko_buy_signal_list:
+        elif kind == "entry":
             # hatiko 신규 포지션에 사용할 cash 계산
             cash_for_hatiko = total_cash / 8
             entry_cash = cash_for_hatiko
+        else:
+            return 0
         # ---------------------------------------------
 
         # entry_cash 보정
@@ -1435,10 +1479,137 @@ def get_amount_kctrend_hatiko(order_info: MarketOrder, bot):
         
     # 청산 오더의 경우
     if order_info.is_spot and order_info.is_sell:
-        if free_coin is None:
-            return 0
         return free_coin
 
+# 켈트너 + Hatiko 전략도 Hatiko와 같은 엔진의 plugin. 두 웹훅은 주문 방식과 켈트너 포지션 확인 여부만 다르다.
+kctrend_strategy = strategy_engine.plugin("kctrend", KCTREND_SIGNALS, order_type="market", check_position=True)
+kctrend_limit_strategy = strategy_engine.plugin("kctrend_limit", KCTREND_SIGNALS, order_type="limit", check_position=False)
+
+def kctrend_bot(order_info: MarketOrder):
+    # upbit 객체 생성
+    bot = get_bot(order_info.exchange, order_info.kis_number)
+    bot.init_info(order_info)
+    return bot
+
+def kctrend_order(ctx: StrategyContext, bot):
+    """
+    수량 계산 후 plugin 옵션(order_type)에 따라 시장가 또는 지정가 주문. 주문할 수량이 없으면 None
+    """
+    order_info = ctx.order_info
+    order_info.amount = get_amount_kctrend_hatiko(order_info, bot, ctx.signal.kind)
+    if order_info.amount > 0:
+        if ctx.options["order_type"] == "market":
+            return bot.market_order(order_info)
+        return bot.limit_order(order_info)
+
+def kctrend_report(ctx: StrategyContext, order_result):
+    # 디스코드 알람 발생
+    if order_result is not None:
+        ctx.background_tasks.add_task(log, ctx.order_info.exchange, order_result, ctx.order_info)
+    else:
+        ctx.background_tasks.add_task(log_custom_message, ctx.order_info, "RECV_BUT_NO_ORDER")
+
+@kctrend_limit_strategy.handler("kctrend_entry")
+@kctrend_strategy.handler("kctrend_entry")
+async def kctrend_entry(ctx: StrategyContext):
+    # 켈트너 전략 진입 시그널
+    order_info = ctx.order_info
+    ## (1) 켈트너 전략 기진입 여부 확인 (지정가 버전은 미체결 재주문을 위해 확인하지 않음)
+    if ctx.options["check_position"] and order_info.base in kctrendInfo.kctrend_long_set:
+        return {"result" : "ignore"}
+
+    ## (2) 켈트너 전략 진입 (Hatiko 전략의 포지션을 켈트너 전략으로 편입)
+    bot = kctrend_bot(order_info)
+    order_result = kctrend_order(ctx, bot)
+
+    ## (3) 켈트너 목록 추가
+    kctrendInfo.kctrend_long_set.add(order_info.base)
+
+    ## (4) Hatiko 목록 초기화
+    kctrendInfo.removeHatiko(order_info.base)
+    kctrend_report(ctx, order_result)
+
+@kctrend_limit_strategy.handler("kctrend_close")
+@kctrend_strategy.handler("kctrend_close")
+async def kctrend_close(ctx: StrategyContext):
+    # 켈트너 전략 청산 시그널
+    order_info = ctx.order_info
+    ## (1) 켈트너 전략 포지션 확인
+    if ctx.options["check_position"] and order_info.base not in kctrendInfo.kctrend_long_set:
+        return {"result" : "ignore"}
+
+    ## (2) 켈트너 전략 청산
+    bot = kctrend_bot(order_info)
+    order_result = kctrend_order(ctx, bot)
+
+    ## (3) 켈트너 목록 초기화
+    kctrendInfo.kctrend_long_set.discard(order_info.base)
+    kctrend_report(ctx, order_result)
+
+@kctrend_limit_strategy.handler("entry")
+@kctrend_strategy.handler("entry")
+async def kctrend_hatiko_entry(ctx: StrategyContext):
+    # Hatiko 전략 진입 시그널
+    order_info = ctx.order_info
+    ## (1) 켈트너 포지션 있으면 무시
+    if order_info.base in kctrendInfo.kctrend_long_set:
+        return {"result" : "ignore"}
+
+    ## (2) Hatiko 기진입 여부 확인
+    hatiko_long_set = kctrendInfo.hatikoSetOf(ctx.signal.level)
+    if order_info.base in hatiko_long_set:
+        return {"result" : "ignore"}
+
+    ## (3) Hatiko 전략 진입
+    bot = kctrend_bot(order_info)
+    order_result = kctrend_order(ctx, bot)
+
+    ## (4) Hatiko 목록 추가
+    hatiko_long_set.add(order_info.base)
+    kctrend_report(ctx, order_result)
+
+@kctrend_limit_strategy.handler("close")
+@kctrend_strategy.handler("close")
+async def kctrend_hatiko_close(ctx: StrategyContext):
+    # Hatiko 전략 청산 시그널
+    order_info = ctx.order_info
+    ## (1) 켈트너 포지션 있으면 무시
+    if order_info.base in kctrendInfo.kctrend_long_set:
+        return {"result" : "ignore"}
+
+    ## (2) Hatiko 포지션 확인
+    if not kctrendInfo.inHatiko(order_info.base):
+        return {"result" : "ignore"}
+
+    ## (3) Hatiko 전략 청산
+    bot = kctrend_bot(order_info)
+    order_result = kctrend_order(ctx, bot)
+
+    ## (4) Hatiko 목록 초기화
+    kctrendInfo.removeHatiko(order_info.base)
+    kctrend_report(ctx, order_result)
+
+@kctrend_limit_strategy.handler("ignore")
+@kctrend_strategy.handler("ignore")
+async def kctrend_ignore(ctx: StrategyContext):
+    return {"result" : "ignore"}
+
+@kctrend_limit_strategy.handler(UNKNOWN)
+@kctrend_strategy.handler(UNKNOWN)
+async def kctrend_unknown(ctx: StrategyContext):
+    # 예상 외의 시그널
+    ctx.background_tasks.add_task(log_custom_message, ctx.order_info, "ORDER_NAME_INCORRECT")
+    return {"result" : "ignore"}
+
+@kctrend_limit_strategy.error_handler
+@kctrend_strategy.error_handler
+def kctrend_error(ctx: StrategyContext, e: Exception):
+    error_msg = get_error(e)
+    if isinstance(e, TypeError):
+        ctx.background_tasks.add_task(log_order_error_message, "\n".join(error_msg), ctx.order_info)
+    else:
+        ctx.background_tasks.add_task(log_error, "\n".join(error_msg), ctx.order_info)
+
 @ app.post("/kctrendandhatiko")
 @ app.post("/")
 async def kctrendandhatiko(order_info: MarketOrder, background_tasks: BackgroundTasks):
@@ -1451,304 +1622,25 @@ async def kctrendandhatiko(order_info: MarketOrder, background_tasks: Background
            켈트너 진입 중일 때 hatiko 시그널은 무시, hatiko 진입 중일 때 켈트너 시그널이 뜨면 hatiko는 거기서 중단하고 켈트너로 편입
     베팅비율 : 총 Balance를 기준으로 각 종목은 50% 씩 할당된다. hatiko 시그널의 경우 50% 안에서 1/4 하여 포지션을 베팅한다.
     """
-
-    global kctrend_long_list, hatiko_long1_list, hatiko_long2_list, hatiko_long3_list, hatiko_long4_list
-
-    # order_name 리스트
-    kctrend_buy_signal_list = ["kctrend Long"]
-    kctrend_sell_signal_list = ["kctrend Long Close"]
-    hatiko_buy_signal_list = ["Long1", "Long2", "Long3", "Long4"]
-    hatiko_sell_signal_list = ["close Longs on open", "TakeProfitL1"]
-    hatiko_ignore_signal_list = ["TakeProfitL2", "TakeProfitL3", "TakeProfitL4"]
-
-    # order_result 변수 선언
-    order_result = None
-
-    try :
-        # 1. upbit 객체 생성
-        exchange_name = order_info.exchange
-        bot = get_bot(exchange_name, order_info.kis_number)
-        bot.init_info(order_info)
-
-        # 2. order_name 확인
-        order_name = order_info.order_name
-
-        # 2-1. 켈트너 전략 진입 시그널
-        if order_name in kctrend_buy_signal_list:
-            ## (1) 켈트너 전략 기진입 여부 확인
-            if order_info.base in kctrend_long_list:
-                return {"result" : "ignore"}
-            
-            ## (2) 켈트너 전략 진입 (Hatiko 전략의 포지션을 켈트너 전략으로 편입)
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.market_order(order_info)
-
-            ## (3) 켈트너 목록 추가
-            if order_info.base not in kctrend_long_list:
-                kctrend_long_list.append(order_info.base)
-
-            ## (4) Hatiko 목록 초기화       
-            if order_info.base in hatiko_long1_list:
-                hatiko_long1_list.remove(order_info.base)
-            if order_info.base in hatiko_long2_list:
-                hatiko_long2_list.remove(order_info.base)
-            if order_info.base in hatiko_long3_list:
-                hatiko_long3_list.remove(order_info.base)
-            if order_info.base in hatiko_long4_list:
-                hatiko_long4_list.remove(order_info.base)
-        
-        # 2-2. 켈트너 전략 청산 시그널
-        elif order_name in kctrend_sell_signal_list:
-            ## (1) 켈트너 전략 포지션 확인
-            if order_info.base not in kctrend_long_list:
-                return {"result" : "ignore"}
-            
-            ## (2) 켈트너 전략 청산
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.market_order(order_info)
-
-            ## (3) 켈트너 목록 초기화
-            if order_info.base in kctrend_long_list:
-                kctrend_long_list.remove(order_info.base)
-            
-        # 2-3. Hatiko 전략 진입 시그널
-        elif order_name in hatiko_buy_signal_list:
-            ## (1) 켈트너 포지션 있으면 무시
-            if order_info.base in kctrend_long_list:
-                return {"result" : "ignore"}
-            
-            ## (2) Hatiko 기진입 여부 확인
-            hatiko_long_list = match_hatiko_long_list(order_info.order_name)
-            if order_info.base in hatiko_long_list:
-                return {"result" : "ignore"}
-
-            ## (3) Hatiko 전략 진입
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.market_order(order_info)
-
-            ## (4) Hatiko 목록 추가
-            hatiko_long_list.append(order_info.base)
-        
-        # 2-4. Hatiko 전략 청산 시그널
-        elif order_name in hatiko_sell_signal_list:
-            ## (1) 켈트너 포지션 있으면 무시
-            if order_info.base in kctrend_long_list:
-                return {"result" : "ignore"}
-
-            ## (2) Hatiko 포지션 확인
-            if order_info.base not in (hatiko_long1_list + hatiko_long2_list + hatiko_long3_list + hatiko_long4_list):
-                return {"result" : "ignore"}
-            
-            ## (3) Hatiko 전략 청산
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.market_order(order_info)
-
-            ## (4) Hatiko 목록 초기화
-            if order_info.base in hatiko_long1_list:
-                hatiko_long1_list.remove(order_info.base)
-            if order_info.base in hatiko_long2_list:
-                hatiko_long2_list.remove(order_info.base)
-            if order_info.base in hatiko_long3_list:
-                hatiko_long3_list.remove(order_info.base)
-            if order_info.base in hatiko_long4_list:
-                hatiko_long4_list.remove(order_info.base)
-        
-        # 2-5. 무시하는 시그널
-        elif order_name in hatiko_ignore_signal_list:
-            return {"result" : "ignore"}
-        # 2-6. 예상 외의 시그널
-        else:
-            background_tasks.add_task(log_custom_message, order_info, "ORDER_NAME_INCORRECT")
-            return {"result" : "ignore"}
-
-        # 3. 디스코드 알람 발생
-        if order_result is not None:
-            background_tasks.add_task(log, exchange_name, order_result, order_info)
-        else:
-            background_tasks.add_task(log_custom_message, order_info, "RECV_BUT_NO_ORDER")
-            
-    except TypeError as e:
-        error_msg = get_error(e)
-        background_tasks.add_task(log_order_error_message, "\n".join(error_msg), order_info)
-
-    except Exception as e:
-        error_msg = get_error(e)
-        background_tasks.add_task(log_error, "\n".join(error_msg), order_info)
-
-    else:
-        return {"result": "success"}
-
-    finally:
-        pass
+    return await kctrend_strategy.dispatch(order_info, background_tasks=background_tasks)
 
 @ app.post("/kctrendandhatiko_limit")
 @ app.post("/")
 async def kctrendandhatikolimit(order_info: MarketOrder, background_tasks: BackgroundTasks):
     """
     [지정가 버전 - client.market_order만 client.limit_order로 변경]
-    켈트너 추세전략과 hatiko를 섞어서 쓰는 전략
-    
-    거래소 : Upbit
-    종목 : 2개 (BTC, ETH)
-    로직 : 켈트너가 hatiko 보다 우선권을 가진다.
-           켈트너 진입 중일 때 hatiko 시그널은 무시, hatiko 진입 중일 때 켈트너 시그널이 뜨면 hatiko는 거기서 중단하고 켈트너로 편입
-    베팅비율 : 총 Balance를 기준으로 각 종목은 50% 씩 할당된다. hatiko 시그널의 경우 50% 안에서 1/4 하여 포지션을 베팅한다.
+    켈트너 추세전략과 hatiko를 섞어서 쓰는 전략 (kctrend_limit plugin)
     """
-
-    global kctrend_long_list, hatiko_long1_list, hatiko_long2_list, hatiko_long3_list, hatiko_long4_list
-
-    # order_name 리스트
-    kctrend_buy_signal_list = ["kctrend Long"]
-    kctrend_sell_signal_list = ["kctrend Long Close"]
-    hatiko_buy_signal_list = ["Long1", "Long2", "Long3", "Long4"]
-    hatiko_sell_signal_list = ["close Longs on open", "TakeProfitL1"]
-    hatiko_ignore_signal_list = ["TakeProfitL2", "TakeProfitL3", "TakeProfitL4"]
-
-    # order_result 변수 선언
-    order_result = None
-
-    try :
-        # 1. upbit 객체 생성
-        exchange_name = order_info.exchange
-        bot = get_bot(exchange_name, order_info.kis_number)
-        bot.init_info(order_info)
-
-        # 2. order_name 확인
-        order_name = order_info.order_name
-
-        # 2-1. 켈트너 전략 진입 시그널
-        if order_name in kctrend_buy_signal_list:
-            ## (1) 켈트너 전략 진입 (Hatiko 전략의 포지션을 켈트너 전략으로 편입)
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.limit_order(order_info)
-
-            ## (2) 켈트너 목록 추가
-            if order_info.base not in kctrend_long_list:
-                kctrend_long_list.append(order_info.base)
-
-            ## (3) Hatiko 목록 초기화       
-            if order_info.base in hatiko_long1_list:
-                hatiko_long1_list.remove(order_info.base)
-            if order_info.base in hatiko_long2_list:
-                hatiko_long2_list.remove(order_info.base)
-            if order_info.base in hatiko_long3_list:
-                hatiko_long3_list.remove(order_info.base)
-            if order_info.base in hatiko_long4_list:
-                hatiko_long4_list.remove(order_info.base)
-        
-        # 2-2. 켈트너 전략 청산 시그널
-        elif order_name in kctrend_sell_signal_list:
-            ## (1) 켈트너 전략 청산
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.limit_order(order_info)
-
-            ## (2) 켈트너 목록 초기화
-            if order_info.base in kctrend_long_list:
-                kctrend_long_list.remove(order_info.base)
-            
-        # 2-3. Hatiko 전략 진입 시그널
-        elif order_name in hatiko_buy_signal_list:
-            ## (1) 켈트너 포지션 있으면 무시
-            if order_info.base in kctrend_long_list:
-                return {"result" : "ignore"}
-            
-            ## (2) Hatiko 기진입 여부 확인
-            hatiko_long_list = match_hatiko_long_list(order_info.order_name)
-            if order_info.base in hatiko_long_list:
-                return {"result" : "ignore"}
-
-            ## (3) Hatiko 전략 진입
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.limit_order(order_info)
-
-            ## (4) Hatiko 목록 추가
-            hatiko_long_list.append(order_info.base)
-        
-        # 2-4. Hatiko 전략 청산 시그널
-        elif order_name in hatiko_sell_signal_list:
-            ## (1) 켈트너 포지션 있으면 무시
-            if order_info.base in kctrend_long_list:
-                return {"result" : "ignore"}
-
-            ## (2) Hatiko 포지션 확인
-            if order_info.base not in (hatiko_long1_list + hatiko_long2_list + hatiko_long3_list + hatiko_long4_list):
-                return {"result" : "ignore"}
-            
-            ## (3) Hatiko 전략 청산
-            order_info.amount = get_amount_kctrend_hatiko(order_info, bot)
-            if order_info.amount > 0:
-                order_result = bot.limit_order(order_info)
-
-            ## (4) Hatiko 목록 초기화
-            if order_info.base in hatiko_long1_list:
-                hatiko_long1_list.remove(order_info.base)
-            if order_info.base in hatiko_long2_list:
-                hatiko_long2_list.remove(order_info.base)
-            if order_info.base in hatiko_long3_list:
-                hatiko_long3_list.remove(order_info.base)
-            if order_info.base in hatiko_long4_list:
-                hatiko_long4_list.remove(order_info.base)
-        
-        # 2-5. 무시하는 시그널
-        elif order_name in hatiko_ignore_signal_list:
-            return {"result" : "ignore"}
-        # 2-6. 예상 외의 시그널
-        else:
-            background_tasks.add_task(log_custom_message, order_info, "ORDER_NAME_INCORRECT")
-            return {"result" : "ignore"}
-
-        # 3. 디스코드 알람 발생
-        if order_result is not None:
-            background_tasks.add_task(log, exchange_name, order_result, order_info)
-        else:
-            background_tasks.add_task(log_custom_message, order_info, "RECV_BUT_NO_ORDER")
-            
-    except TypeError as e:
-        error_msg = get_error(e)
-        background_tasks.add_task(log_order_error_message, "\n".join(error_msg), order_info)
-
-    except Exception as e:
-        error_msg = get_error(e)
-        background_tasks.add_task(log_error, "\n".join(error_msg), order_info)
-
-    else:
-        return {"result": "success"}
-
-    finally:
-        pass
+    return await kctrend_limit_strategy.dispatch(order_info, background_tasks=background_tasks)
 #endregion ############################### 켈트너 + Hatiko in Upbit #################################
 
 
 #region ############################### [Hedge 변형] 선물 간 차익거래 #################################
 
-def get_arbi_records(base: str, exchange_name_long: str, exchange_name_short: str):
-    records = pocket.get_full_list("arbitrage", query_params={"filter": f'base = "{base}"'})
-    short_amount = 0.0
-    short_records_id = []
-    long_amount = 0.0
-    long_records_id = []
-    for record in records:
-        if record.exchange == exchange_name_short:
-            short_amount += record.amount
-            short_records_id.append(record.id)
-        elif record.exchange == exchange_name_long:
-            long_amount += record.amount
-            long_records_id.append(record.id)
-
-    return {
-        exchange_name_short: {"amount": short_amount, "records_id": short_records_id},
-        exchange_name_long: {"amount": long_amount, "records_id": long_records_id},
-    }
-
 @app.post("/arbitrage")
 async def arbitrage(arbi_data: ArbiData, background_tasks: BackgroundTasks):
+    # 체결 수량을 장부에 기록하므로 ACK 주문을 쓰지 않는다
+    ack.disable()
     exchange_name_long = arbi_data.exchange_long.upper()
     exchange_name_short = arbi_data.exchange_short.upper()
     bot_long = get_bot(exchange_name_long) #upbit = get_bot("UPBIT")
@@ -1775,41 +1667,53 @@ async def arbitrage(arbi_data: ArbiData, background_tasks: BackgroundTasks):
         try:
             if amount is None:
                 raise Exception("헷지할 수량을 요청하세요")
-            short_order_result = bot_short.market_entry(short_order_info)
-            short_order_amount = short_order_result["amount"]
-            
-            pocket.create("arbitrage", {"exchange": exchange_name_short, "base": base, "quote": quote, "amount": short_order_amount})
-            if leverage is None:
-                leverage = 1
-            try:
-                long_order_info = OrderRequest(
-                    exchange=exchange_name_long,
-                    base=base,
-                    quote=quote,
-                    side="entry/buy",
-                    type="market",
-                    amount=short_order_amount,
-                )
-                bot_long.init_info(long_order_info)
-                long_order_result = bot_long.market_entry(long_order_info)
-            except Exception as e:
-                hedge_records = get_arbi_records(base, exchange_name_long, exchange_name_short)
-                short_records_id = hedge_records[exchange_name_short]["records_id"]
-                short_amount = hedge_records[exchange_name_short]["amount"]
-                short_order_result = bot_short.market_close(
-                    OrderRequest(
-                        exchange=exchange_name_short, base=base, quote=quote, side="close/buy", amount=short_amount
-                    )
-                )
-                for short_record_id in short_records_id:
-                    pocket.delete("arbitrage", short_record_id)
-                log_message("[헷지 실패] Long에서 에러가 발생하여 이에 상응하는 Short 포지션을 종료합니다")
-            else:
-                # upbit_order_info = bot_long.get_order(long_order_result["id"])
-                # upbit_order_amount = upbit_order_info["filled"]
-                long_order_amount = long_order_result["amount"]
-                pocket.create("arbitrage", {"exchange": exchange_name_long, "base": base, "quote": quote, "amount": long_order_amount})
-                log_arbi_message(exchange_name_long, exchange_name_short, base, quote, long_order_amount, short_order_amount, hedge)
+            long_order_info = OrderRequest(
+                exchange=exchange_name_long,
+                base=base,
+                quote=quote,
+                side="entry/buy",
+                type="market",
+                amount=amount,
+            )
+            bot_long.init_info(long_order_info)
+            # 두 거래소에 같은 수량을 동시에 주문 (수량 정밀도가 더 거친 쪽에 맞춤)
+            matched_amount = min(
+                float(bot_short.client.amount_to_precision(short_order_info.unified_symbol, amount)),
+                float(bot_long.client.amount_to_precision(long_order_info.unified_symbol, amount)),
+            )
+            short_order_info.amount = matched_amount
+            long_order_info.amount = matched_amount
+
+            result = await execute_two_legs(
+                Leg(
+                    f"{exchange_name_short} short",
+                    lambda: bot_short.market_entry(short_order_info),
+                    unwind=lambda order: bot_short.market_close(
+                        OrderRequest(exchange=exchange_name_short, base=base, quote=quote, side="close/buy", amount=order["amount"])
+                    ),
+                ),
+                Leg(
+                    f"{exchange_name_long} long",
+                    lambda: bot_long.market_entry(long_order_info),
+                    unwind=lambda order: bot_long.market_close(
+                        OrderRequest(exchange=exchange_name_long, base=base, quote=quote, side="close/sell", amount=order["amount"])
+                    ),
+                ),
+                concurrent=bot_long is not bot_short,
+            )
+            if not result.ok:
+                log_message("[헷지 실패] 한쪽 주문에서 에러가 발생하여 체결된 포지션을 종료합니다")
+                background_tasks.add_task(log_two_leg_error, result, "Arbitrage")
+                return {"result": "error"}
+
+            # 체결 수량 (응답에 체결 정보가 없는 거래소는 주문 수량)
+            short_order_amount = result.first.result.get("filled") or result.first.result["amount"]
+            long_order_amount = result.second.result.get("filled") or result.second.result["amount"]
+            ledger.add("arbitrage", base, exchange_name_short, short_order_amount, quote=quote)
+            ledger.add("arbitrage", base, exchange_name_long, long_order_amount, quote=quote)
+            background_tasks.add_task(
+                log_arbi_message, exchange_name_long, exchange_name_short, base, quote, long_order_amount, short_order_amount, hedge, result.skew_ms
+            )
 
         except Exception as e:
             # log_message(f"{e}")
@@ -1820,32 +1724,38 @@ async def arbitrage(arbi_data: ArbiData, background_tasks: BackgroundTasks):
 
     elif hedge == "OFF":
         try:
-            records = pocket.get_full_list("arbitrage", query_params={"filter": f'base = "{base}"'})
-            short_amount = 0.0
-            short_records_id = []
-            long_amount = 0.0
-            long_records_id = []
-            for record in records:
-                if record.exchange == exchange_name_short:
-                    short_amount += record.amount
-                    short_records_id.append(record.id)
-                elif record.exchange == exchange_name_long:
-                    long_amount += record.amount
-                    long_records_id.append(record.id)
+            short_amount = ledger.amount("arbitrage", base, exchange_name_short)
+            long_amount = ledger.amount("arbitrage", base, exchange_name_long)
 
             if short_amount > 0 and long_amount > 0:
-                # 숏 종료
-                order_info = OrderRequest(exchange=exchange_name_short, base=base, quote=quote, side="close/buy", amount=short_amount)
-                short_order_result = bot_short.market_close(order_info)
-                for short_record_id in short_records_id:
-                    pocket.delete("arbitrage", short_record_id)
-                # 롱 종료
-                order_info = OrderRequest(exchange=exchange_name_long, base=base, quote=quote, side="close/sell", amount=long_amount)
-                long_order_result = bot_long.market_close(order_info)
-                for long_record_id in long_records_id:
-                    pocket.delete("arbitrage", long_record_id)
-
-                log_arbi_message(exchange_name_long, exchange_name_short, base, quote, long_amount, short_amount, hedge)
+                # 숏 / 롱 동시 종료
+                result = await execute_two_legs(
+                    Leg(
+                        f"{exchange_name_short} close",
+                        lambda: bot_short.market_close(
+                            OrderRequest(exchange=exchange_name_short, base=base, quote=quote, side="close/buy", amount=short_amount)
+                        ),
+                    ),
+                    Leg(
+                        f"{exchange_name_long} close",
+                        lambda: bot_long.market_close(
+                            OrderRequest(exchange=exchange_name_long, base=base, quote=quote, side="close/sell", amount=long_amount)
+                        ),
+                    ),
+                    concurrent=bot_long is not bot_short,
+                )
+                # 종료된 쪽만 장부에서 정리
+                if result.first.ok:
+                    ledger.close("arbitrage", base, exchange_name_short)
+                if result.second.ok:
+                    ledger.close("arbitrage", base, exchange_name_long)
+                if not result.ok:
+                    background_tasks.add_task(log_two_leg_error, result, "Arbitrage 종료")
+                    return {"result": "error"}
+
+                background_tasks.add_task(
+                    log_arbi_message, exchange_name_long, exchange_name_short, base, quote, long_amount, short_amount, hedge, result.skew_ms
+                )
             elif short_amount == 0 and long_amount == 0:
                 log_message(f"{exchange_name_short}, {exchange_name_long}에 종료할 수량이 없습니다")
             elif short_amount == 0:
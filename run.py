@@ -1,11 +1,38 @@
+import time
+
+boot_started = time.perf_counter()  # 무거운 import 전에 부팅 시작 시각 기록
+boot_started_at = time.time()       # 워커 프로세스에 넘기는 부팅 시작 시각 (프로세스가 달라도 비교 가능한 시계)
+
+import os
 import uvicorn
 import fire
 from exchange.utility import settings
-from main import app
 
 
-def start_server(host="0.0.0.0", port=8000 if settings.PORT is None else settings.PORT):
+def start_server(host="0.0.0.0", port=8000 if settings.PORT is None else settings.PORT, workers: int = 1):
+    if workers > 1 and settings.SHARD_MODE == "exchange":
+        # shard 모드에서는 메인 프로세스가 하나여야 shard 프로세스도 거래소별로 하나씩만 뜬다.
+        print("SHARD_MODE=exchange 에서는 workers=1 로 실행합니다.")
+        workers = 1
+    if workers > 1 and settings.REPLICATION_ROLE != "off":
+        # 복제는 이 프로세스의 store 변경만 보내므로 워커가 여러 개면 다른 워커의 변경이 빠진다.
+        print("REPLICATION_ROLE 사용 시 workers=1 로 실행합니다.")
+        workers = 1
+    if workers > 1:
+        # 워커끼리 전략 상태를 공유해야 하므로 sqlite store 사용 (워커 프로세스는 환경변수를 물려받는다)
+        if settings.STATE_BACKEND != "sqlite":
+            print(f"workers={workers} : STATE_BACKEND를 sqlite로 변경합니다. ({settings.STATE_PATH})")
+            os.environ["STATE_BACKEND"] = "sqlite"
+        # 워커는 main을 새로 import하므로 app.state 대신 환경변수로 넘긴다
+        os.environ["BOOT_STARTED_AT"] = str(boot_started_at)
+        os.environ["PORT"] = str(port)
+        uvicorn.run("main:app", host=host, port=port, reload=False, workers=workers)
+        return
+
+    from main import app
+
     app.state.port = port
+    app.state.boot_started = boot_started
     uvicorn.run("main:app", host=host, port=port, reload=False)
 
 
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# exchange.utility.settings는 import 시점에 환경변수를 읽는다
+os.environ.setdefault("PASSWORD", "test")
+os.environ.setdefault("WHITELIST", "[]")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
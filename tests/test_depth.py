@@ -0,0 +1,60 @@
+import pytest
+from exchange import depth
+
+
+class FakeClient:
+    id = "fake"
+
+    def __init__(self, bids, asks):
+        self.book = {"bids": bids, "asks": asks}
+        self.calls = 0
+
+    def fetch_order_book(self, symbol, limit=None):
+        self.calls += 1
+        return self.book
+
+    def price_to_precision(self, symbol, price):
+        return f"{price:.2f}"
+
+
+@pytest.fixture(autouse=True)
+def clear_books():
+    depth._books.clear()
+    yield
+    depth._books.clear()
+
+
+def client():
+    return FakeClient(
+        bids=[[99.9, 1], [99.8, 2], [99.0, 5]],
+        asks=[[100.0, 1], [100.1, 2], [100.2, 0], [100.3, 3], [101.0, 10]],
+    )
+
+
+def test_max_slice_within_slippage():
+    c = client()
+    # buy는 asks를 먹는다 : 100.0 ~ 100.3 (0.3%) 까지
+    assert depth.max_slice(c, "BTC/USDT", "buy", slippage=0.003) == 6
+    assert depth.max_slice(c, "BTC/USDT", "buy", slippage=0.0015) == 3
+    assert depth.max_slice(c, "BTC/USDT", "buy", slippage=0) == 1
+    # sell은 bids를 먹는다
+    assert depth.max_slice(c, "BTC/USDT", "sell", slippage=0.002) == 3
+
+
+def test_max_slice_empty_book():
+    assert depth.max_slice(FakeClient([], []), "BTC/USDT", "buy", slippage=0.01) is None
+
+
+def test_book_is_cached():
+    c = client()
+    depth.max_slice(c, "BTC/USDT", "buy", slippage=0.01)
+    depth.max_slice(c, "BTC/USDT", "sell", slippage=0.01)
+    assert c.calls == 1
+
+
+def test_kill_price_capped_by_slippage():
+    c = client()
+    assert depth.kill_price(c, "BTC/USDT", "buy", 3, slippage=0.01) == 100.1
+    # 호가가 부족하거나 slippage 밖이면 제한 가격
+    assert depth.kill_price(c, "BTC/USDT", "buy", 100, slippage=0.005) == 100.5
+    assert depth.kill_price(c, "BTC/USDT", "sell", 8, slippage=0.005) == 99.4
@@ -0,0 +1,59 @@
+from collections import namedtuple
+import pytest
+from exchange.order_state import OrderState, LevelState, IDLE, TRANSITIONS, next_state, state_key
+
+Signal = namedtuple("Signal", "side level")
+
+LEGAL = [(current, to) for current, targets in TRANSITIONS.items() for to in targets]
+ILLEGAL = [(current, to) for current in OrderState for to in OrderState if to not in TRANSITIONS[current]]
+
+
+def test_every_state_has_transitions():
+    assert set(TRANSITIONS) == set(OrderState)
+
+
+@pytest.mark.parametrize("current, to", LEGAL)
+def test_legal_transition(current, to):
+    state = next_state(LevelState(current, ("1",)), to)
+    assert state is not None
+    assert state.state == to
+    assert state.since > 0
+
+
+@pytest.mark.parametrize("current, to", ILLEGAL)
+def test_illegal_transition_is_rejected(current, to):
+    assert next_state(LevelState(current, ("1",)), to) is None
+
+
+@pytest.mark.parametrize("current, to", [
+    (OrderState.IDLE, OrderState.ENTRY_FILLED),
+    (OrderState.IDLE, OrderState.CLOSING),
+    (OrderState.ENTRY_FILLED, OrderState.NEAR_PENDING),
+    (OrderState.KILL_PENDING, OrderState.NEAR_PENDING),
+])
+def test_known_illegal_transitions(current, to):
+    assert (current, to) in ILLEGAL
+
+
+def test_order_ids_kept_unless_given():
+    near = next_state(IDLE, OrderState.NEAR_PENDING, ["a", "b"])
+    assert near.order_ids == ("a", "b")
+    assert next_state(near, OrderState.ENTRY_FILLED).order_ids == ("a", "b")
+    assert next_state(near, OrderState.NEAR_PENDING, ["c"]).order_ids == ("c",)
+
+
+def test_idle_clears_order_ids():
+    near = LevelState(OrderState.NEAR_PENDING, ("a",))
+    assert next_state(near, OrderState.IDLE).order_ids == ()
+
+
+def test_expect_guards_current_state():
+    near = LevelState(OrderState.NEAR_PENDING, ("a",))
+    assert next_state(near, OrderState.CLOSING, expect=(OrderState.ENTRY_FILLED,)) is None
+    assert next_state(near, OrderState.CLOSING, expect=(OrderState.NEAR_PENDING, OrderState.ENTRY_FILLED)).state == OrderState.CLOSING
+
+
+def test_state_key():
+    assert state_key("BTC", Signal("Long", 1)) == "BTC:Long1"
+    assert state_key("BTC", Signal("Short", None)) == "BTC"
+    assert state_key("BTC") == "BTC"
@@ -0,0 +1,45 @@
+from exchange.stock.quote import QuoteCache, REALTIME_TR_ID, REALTIME_LAST
+
+
+def record(symbol: str, last: str) -> list[str]:
+    fields = [""] * (REALTIME_LAST + 3)
+    fields[0], fields[REALTIME_LAST] = symbol, last
+    return fields
+
+
+def message(*records, tr_id=REALTIME_TR_ID) -> str:
+    data = "^".join(field for fields in records for field in fields)
+    return f"0|{tr_id}|{len(records):03d}|{data}"
+
+
+def test_feed_realtime_updates_cache():
+    cache = QuoteCache()
+    assert cache.feed_realtime(message(record("DNASAAPL", "190.5"))) == 1
+    assert cache.get("NAS", "AAPL") == 190.5
+    assert cache.quotes[("NAS", "AAPL")].source == "ws"
+
+
+def test_feed_realtime_multiple_records():
+    cache = QuoteCache()
+    assert cache.feed_realtime(message(record("DNASAAPL", "190.5"), record("DNYSKO", "60.1"))) == 2
+    assert cache.get("NYS", "KO") == 60.1
+
+
+def test_feed_realtime_skips_bad_price():
+    cache = QuoteCache()
+    assert cache.feed_realtime(message(record("DNASAAPL", ""), record("DNASMSFT", "400"))) == 1
+    assert cache.get("NAS", "AAPL") is None
+    assert cache.get("NAS", "MSFT") == 400
+
+
+def test_feed_realtime_ignores_other_messages():
+    cache = QuoteCache()
+    assert cache.feed_realtime(message(record("DNASAAPL", "1"), tr_id="H0GSCNI0")) == 0
+    assert cache.feed_realtime('{"header": {"tr_id": "PINGPONG"}}') == 0
+    assert cache.quotes == {}
+
+
+def test_quote_expires_after_ttl():
+    cache = QuoteCache()
+    cache.feed_realtime(message(record("DNASAAPL", "190.5")))
+    assert cache.get("NAS", "AAPL", ttl=0) is None
@@ -0,0 +1,89 @@
+import math
+import pytest
+from exchange.slicing import plan_slices, SliceMode
+
+
+def floor_to(digits: int):
+    # ccxt amount_to_precision(TRUNCATE)과 같은 내림
+    scale = 10 ** digits
+    return lambda amount: math.floor(amount * scale) / scale
+
+
+def test_immediate_splits_by_max_amount():
+    plan = plan_slices(25, 1, 10)
+    assert plan.mode == SliceMode.IMMEDIATE
+    assert plan.amounts == (10, 10, 5)
+    assert plan.delays == (0.0, 0.0, 0.0)
+    assert plan.dropped == 0
+
+
+def test_rest_below_min_is_merged_into_last_slice():
+    plan = plan_slices(10.5, 1, 10.5)
+    assert plan.amounts == (10.5,)
+    plan = plan_slices(20.5, 1, 11, precision=floor_to(1))
+    assert plan.amounts == (11, 9.5)
+
+
+def test_rest_is_dropped_when_merge_exceeds_max():
+    plan = plan_slices(20.5, 1, 10)
+    assert plan.amounts == (10, 10)
+    assert plan.dropped == pytest.approx(0.5)
+
+
+def test_total_below_min_places_nothing():
+    plan = plan_slices(0.5, 1, 10)
+    assert plan.amounts == ()
+    assert plan.dropped == 0.5
+    assert plan_slices(0, 1, 10).amounts == ()
+
+
+def test_precision_dust_is_reported_as_dropped():
+    plan = plan_slices(10.05, 0.1, 5, precision=floor_to(1))
+    assert plan.amounts == (5, 5)
+    assert plan.dropped == pytest.approx(0.05)
+
+
+def test_float_rest_survives_truncation():
+    # 10 - 3.33 * 3 = 0.00999... -> 내림해도 0.01이 남아야 한다
+    plan = plan_slices(10, 1, 5, precision=floor_to(2), mode="twap", duration=60, count=3)
+    assert plan.amounts == (3.33, 3.33, 3.34)
+    assert plan.dropped == 0
+    assert plan.total == pytest.approx(10)
+
+
+def test_twap_count_and_delays():
+    plan = plan_slices(9, 1, 10, mode="twap", duration=60, count=3)
+    assert plan.amounts == (3, 3, 3)
+    assert plan.delays == (0.0, 30.0, 60.0)
+
+
+def test_twap_count_raised_to_respect_max_amount():
+    plan = plan_slices(12, 1, 5, precision=floor_to(1), mode="twap", duration=30, count=1)
+    assert len(plan.amounts) == 3
+    assert max(plan.amounts) <= 5
+    assert plan.delays == (0.0, 15.0, 30.0)
+
+
+def test_twap_count_lowered_to_respect_min_amount():
+    plan = plan_slices(10, 3, 10, precision=floor_to(1), mode="twap", duration=30, count=5)
+    assert plan.amounts == (3.3, 3.3, 3.4)
+    assert min(plan.amounts) >= 3
+
+
+def test_twap_single_slice_has_no_delay():
+    plan = plan_slices(2, 1, 10, mode="twap", duration=60, count=1)
+    assert plan.amounts == (2,)
+    assert plan.delays == (0.0,)
+
+
+def test_iceberg_uses_visible_size():
+    plan = plan_slices(10, 1, 5, precision=floor_to(1), mode="iceberg", visible=3)
+    assert plan.amounts == (3, 3, 3, 1)
+    assert plan.delays == (0.0,) * 4
+
+
+@pytest.mark.parametrize("visible, size", [(0.5, 1), (8, 5), (None, 5)])
+def test_iceberg_visible_clamped_to_min_max(visible, size):
+    plan = plan_slices(10, 1, 5, mode="iceberg", visible=visible)
+    assert set(plan.amounts) == {size}
+    assert plan.total == 10
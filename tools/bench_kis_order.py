@@ -0,0 +1,255 @@
+"""
+KIS 주문 요청 생성 비용 측정 / 검증 (네트워크 호출 없음)
+
+verify : 모든 (실전/모의, 거래소, side, order_type) 조합에서 템플릿 결과가
+         기존 방식(deepcopy + pydantic 모델)과 같은지 비교한다
+bench  : 주문 하나의 요청(endpoint, body, headers)을 만드는 데 걸리는 시간 비교
+submit : 로컬 대체 서버(응답 지연 latency ms)에 acreate_order를 보내서 hashkey 없음 / hashkey 포함(KIS_HASHKEY=true) 지연 비교
+
+실행 : python tools/bench_kis_order.py verify
+       python tools/bench_kis_order.py bench --n 100000
+       python tools/bench_kis_order.py submit --n 200 --latency 20
+"""
+import os
+import sys
+import copy
+import time
+import asyncio
+import hashlib
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PASSWORD", "bench")
+
+import fire
+from pydantic import ValidationError
+from exchange.stock.schemas import *
+from exchange.stock.template import MARKETS, SIDES, ORDER_TYPES
+
+
+def legacy_order_request(
+    bot,
+    exchange: str,
+    ticker: str,
+    order_type: str,
+    side: str,
+    amount: int,
+    price: int = 0,
+    mintick=0.01,
+    current_price: float | None = None,
+) -> tuple[str, dict, dict]:
+    """
+    템플릿 이전의 KoreaInvestment.order_request (pydantic 모델로 매번 생성)
+    """
+    endpoint = (
+        Endpoints.korea_order.value
+        if exchange == "KRX"
+        else Endpoints.usa_order.value
+    )
+    body = bot.base_order_body.dict()
+    headers = copy.deepcopy(bot.base_headers)
+    price = str(price)
+
+    amount = str(int(amount))
+
+    if exchange == "KRX":
+        if bot.base_url == BaseUrls.base_url:
+            headers |= (
+                KoreaBuyOrderHeaders(**headers)
+                if side == "buy"
+                else KoreaSellOrderHeaders(**headers)
+            )
+        elif bot.base_url == BaseUrls.paper_base_url:
+            headers |= (
+                KoreaPaperBuyOrderHeaders(**headers)
+                if side == "buy"
+                else KoreaPaperSellOrderHeaders(**headers)
+            )
+
+        if order_type == "market":
+            body |= KoreaMarketOrderBody(**body, PDNO=ticker, ORD_QTY=amount)
+        elif order_type == "limit":
+            body |= KoreaOrderBody(
+                **body,
+                PDNO=ticker,
+                ORD_DVSN=KoreaOrderType.limit,
+                ORD_QTY=amount,
+                ORD_UNPR=price,
+            )
+    elif exchange in ("NASDAQ", "NYSE", "AMEX"):
+        exchange_code = bot.order_exchange_code.get(exchange)
+        price = (
+            current_price + mintick * 50
+            if side == "buy"
+            else current_price - mintick * 50
+        )
+        if price < 1:
+            price = 1.0
+        price = float("{:.2f}".format(price))
+        if bot.base_url == BaseUrls.base_url:
+            headers |= (
+                UsaBuyOrderHeaders(**headers)
+                if side == "buy"
+                else UsaSellOrderHeaders(**headers)
+            )
+        elif bot.base_url == BaseUrls.paper_base_url:
+            headers |= (
+                UsaPaperBuyOrderHeaders(**headers)
+                if side == "buy"
+                else UsaPaperSellOrderHeaders(**headers)
+            )
+
+        if order_type == "market":
+            body |= UsaOrderBody(
+                **body,
+                PDNO=ticker,
+                ORD_DVSN=UsaOrderType.limit.value,
+                ORD_QTY=amount,
+                OVRS_ORD_UNPR=price,
+                OVRS_EXCG_CD=exchange_code,
+            )
+        elif order_type == "limit":
+            body |= UsaOrderBody(
+                **body,
+                PDNO=ticker,
+                ORD_DVSN=UsaOrderType.limit.value,
+                ORD_QTY=amount,
+                OVRS_ORD_UNPR=price,
+                OVRS_EXCG_CD=exchange_code,
+            )
+    return endpoint, body, headers
+
+
+def make_bot(kis_number: int):
+    from exchange.stock.token import token_manager, KisToken
+    from exchange.stock.kis import KoreaInvestment
+
+    token_manager.loaded = True
+    token_manager.tokens[f"KIS{kis_number}"] = KisToken("bench-token", time.time() + 86400, "")
+    return KoreaInvestment("app-key", "app-secret", "12345678", "01", kis_number)
+
+
+def cases():
+    for market in MARKETS:
+        for side in SIDES:
+            for order_type in ORDER_TYPES:
+                yield market, "AAPL" if market != "KRX" else "005930", order_type, side, 3, 70000, 0.01, 187.35 if market != "KRX" else None
+
+
+def verify():
+    checked = skipped = 0
+    for kis_number, name in ((1, "real"), (4, "paper")):
+        bot = make_bot(kis_number)
+        for case in cases():
+            try:
+                expected = legacy_order_request(bot, *case)
+            except ValidationError:
+                # KoreaOrderBody.ORD_DVSN Literal이 enum 이름 문자열이라 기존 방식은 KRX 지정가에서 항상 실패한다
+                print(f"skip {name} {case[:4]} : 기존 방식 ValidationError")
+                skipped += 1
+                continue
+            endpoint, body, headers = bot.order_request(*case)
+            assert endpoint == expected[0], (name, case, endpoint, expected[0])
+            assert body == expected[1] and list(body) == list(expected[1]), (name, case, body, expected[1])
+            assert dict(headers) == expected[2], (name, case, dict(headers), expected[2])
+            checked += 1
+    print(f"verify ok : {checked} 조합 일치, {skipped} 조합 비교 불가")
+
+
+def bench(n: int = 100000):
+    bot = make_bot(1)
+    for case in ((c for c in cases() if c[0] == "KRX" and c[2] == "market"), (c for c in cases() if c[0] == "NASDAQ")):
+        case = next(case)
+        for name, build in (("legacy", lambda: legacy_order_request(bot, *case)), ("template", lambda: bot.order_request(*case))):
+            for _ in range(min(n, 1000)):
+                build()  # warm up
+            started = time.perf_counter()
+            for _ in range(n):
+                build()
+            elapsed = time.perf_counter() - started
+            print(f"{case[0]:<7} {case[3]:<5} {case[2]:<7} {name:<9} {elapsed / n * 1e6:8.2f}us/order")
+
+
+def create_standin(latency: float):
+    """
+    hashkey / 국내·해외 주문 / 해외 현재가만 흉내내는 KIS REST 대체 서버 (요청마다 latency ms 지연)
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import ORJSONResponse
+
+    app = FastAPI()
+    app.state.stats = {"hashkey": 0, "order": 0}
+
+    def hash_body(body: bytes) -> str:
+        return hashlib.sha256(body).hexdigest()
+
+    @app.post("/uapi/hashkey")
+    async def hashkey(request: Request):
+        await asyncio.sleep(latency / 1000)
+        app.state.stats["hashkey"] += 1
+        return ORJSONResponse({"HASH": hash_body(await request.body())})
+
+    @app.post(Endpoints.korea_order.value)
+    @app.post(Endpoints.usa_order.value)
+    async def order(request: Request):
+        await asyncio.sleep(latency / 1000)
+        app.state.stats["order"] += 1
+        hashkey = request.headers.get("hashkey")
+        if hashkey is not None and hashkey != hash_body(await request.body()):
+            return ORJSONResponse({"rt_cd": "1", "msg_cd": "EGW00215", "msg1": "hashkey 불일치"})
+        return ORJSONResponse({"rt_cd": "0", "msg_cd": "APBK0013", "msg1": "주문 전송 완료", "output": {"ODNO": "0000012345"}})
+
+    @app.get(Endpoints.usa_ticker.value)
+    async def ticker():
+        await asyncio.sleep(latency / 1000)
+        return ORJSONResponse({"rt_cd": "0", "output": {"last": "187.35"}})
+
+    return app
+
+
+async def _submit(n: int, latency: float, port: int):
+    import uvicorn
+    from exchange.utility import settings
+
+    app = create_standin(latency)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    bot = make_bot(1)
+    bot.base_url = f"http://127.0.0.1:{port}"
+
+    def call():
+        return bot.acreate_order("KRX", "005930", "market", "buy", 1)
+
+    modes = (("no hashkey", False), ("hashkey", True))
+    try:
+        for name, hashkey in modes:
+            settings.KIS_HASHKEY = hashkey
+            for _ in range(min(n, 20)):
+                await call()  # warm up (연결 생성)
+            latencies = []
+            for _ in range(n):
+                started = time.perf_counter()
+                result = await call()
+                latencies.append(time.perf_counter() - started)
+                assert result["rt_cd"] == "0", result
+            latencies.sort()
+            print(
+                f"{name:<11} n={n:<5} mean={statistics.mean(latencies) * 1000:7.2f}ms "
+                f"p50={latencies[len(latencies) // 2] * 1000:7.2f}ms p99={latencies[min(int(n * 0.99), n - 1)] * 1000:7.2f}ms"
+            )
+        print(f"stand-in : {app.state.stats}")
+    finally:
+        settings.KIS_HASHKEY = False
+        await bot.aclose_session()
+        server.should_exit = True
+        await task
+
+
+def submit(n: int = 200, latency: float = 20.0, port: int = 18443):
+    asyncio.run(_submit(n, latency, port))
+
+
+if __name__ == "__main__":
+    fire.Fire({"verify": verify, "bench": bench, "submit": submit})
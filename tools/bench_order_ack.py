@@ -0,0 +1,208 @@
+"""
+ACK 주문(exchange.ack) 검증 / 클라이언트 비용 측정 (네트워크 호출 없음)
+
+Binance client의 requests 세션에 대체 adapter를 붙여서, 주문 요청은 기록하고 응답은 미리 만든 JSON을 돌려준다.
+  현물 : newOrderRespType FULL(ccxt 기본값, 체결 내역 fills 포함) / ACK
+  선물 : newOrderRespType RESULT(ccxt 기본값) / ACK
+
+verify : ACK 경로의 요청 body가 ccxt create_order와 newOrderRespType만 다르고, 결과 id / 수량이 같은지 확인
+bench  : 주문 하나당 클라이언트 시간(요청 생성 + 서명 + 응답 JSON 파싱 + 결과 변환)과 응답 크기 비교
+         거래소 서버에서 줄어드는 시간(체결 내역 조회 / 직렬화)은 여기서 측정할 수 없다.
+
+실행 : python tools/bench_order_ack.py verify
+       python tools/bench_order_ack.py bench --n 5000 --fills 5
+"""
+import os
+import sys
+import time
+import statistics
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("PASSWORD", "bench")
+
+import fire
+import ccxt
+import orjson
+from requests import Response
+from requests.adapters import HTTPAdapter
+from exchange import ack
+
+SPOT_SYMBOL, SWAP_SYMBOL = "BTC/USDT", "BTC/USDT:USDT"
+
+
+def lot_filters(tick: str, step: str) -> list[dict]:
+    return [
+        {"filterType": "PRICE_FILTER", "minPrice": tick, "maxPrice": "1000000", "tickSize": tick},
+        {"filterType": "LOT_SIZE", "minQty": step, "maxQty": "9000", "stepSize": step},
+        {"filterType": "MARKET_LOT_SIZE", "minQty": step, "maxQty": "9000", "stepSize": step},
+        {"filterType": "MIN_NOTIONAL", "minNotional": "5", "notional": "5"},
+    ]
+
+
+SPOT_INFO = {
+    "timezone": "UTC",
+    "serverTime": 1700000000000,
+    "symbols": [{
+        "symbol": "BTCUSDT", "status": "TRADING", "baseAsset": "BTC", "baseAssetPrecision": 8, "quoteAsset": "USDT",
+        "quotePrecision": 8, "quoteAssetPrecision": 8, "orderTypes": ["LIMIT", "MARKET"], "icebergAllowed": True,
+        "ocoAllowed": True, "quoteOrderQtyMarketAllowed": True, "isSpotTradingAllowed": True, "isMarginTradingAllowed": True,
+        "filters": lot_filters("0.01", "0.00001"), "permissions": ["SPOT"], "permissionSets": [["SPOT"]],
+    }],
+}
+
+FUTURES_INFO = {
+    "timezone": "UTC",
+    "serverTime": 1700000000000,
+    "symbols": [{
+        "symbol": "BTCUSDT", "pair": "BTCUSDT", "contractType": "PERPETUAL", "deliveryDate": 4133404800000,
+        "onboardDate": 1569398400000, "status": "TRADING", "baseAsset": "BTC", "quoteAsset": "USDT", "marginAsset": "USDT",
+        "pricePrecision": 2, "quantityPrecision": 3, "baseAssetPrecision": 8, "quotePrecision": 8, "underlyingType": "COIN",
+        "settlePlan": 0, "triggerProtect": "0.0500", "filters": lot_filters("0.10", "0.001"),
+        "orderTypes": ["LIMIT", "MARKET"], "timeInForce": ["GTC", "IOC", "FOK", "GTX"],
+    }],
+}
+
+
+def spot_response(body: dict, fills: int) -> dict:
+    ack_response = {
+        "symbol": body["symbol"], "orderId": 28, "orderListId": -1,
+        "clientOrderId": body.get("newClientOrderId", "6gCrw2kRUAF9CvJDGP16IP"), "transactTime": 1700000000000,
+    }
+    if body["newOrderRespType"] == "ACK":
+        return ack_response
+    qty = float(body["quantity"])
+    return ack_response | {
+        "price": body.get("price", "0.00000000"), "origQty": body["quantity"], "executedQty": body["quantity"],
+        "origQuoteOrderQty": "0.00000000", "cummulativeQuoteQty": f"{qty * 37000:.8f}", "status": "FILLED",
+        "timeInForce": "GTC", "type": body["type"], "side": body["side"], "workingTime": 1700000000000,
+        "selfTradePreventionMode": "NONE",
+        "fills": [
+            {"price": f"{37000 + i:.8f}", "qty": f"{qty / fills:.8f}", "commission": "0.00000010", "commissionAsset": "BNB", "tradeId": 56 + i}
+            for i in range(fills)
+        ],
+    }
+
+
+def futures_response(body: dict) -> dict:
+    filled = body["newOrderRespType"] != "ACK"
+    return {
+        "orderId": 22542179, "symbol": body["symbol"], "status": "FILLED" if filled else "NEW",
+        "clientOrderId": body.get("newClientOrderId", "testOrder"), "price": body.get("price", "0.00"),
+        "avgPrice": "37000.00" if filled else "0.00", "origQty": body["quantity"],
+        "executedQty": body["quantity"] if filled else "0", "cumQty": body["quantity"] if filled else "0",
+        "cumQuote": "370.00" if filled else "0", "timeInForce": "GTC", "type": body["type"],
+        "reduceOnly": body.get("reduceOnly", "false") == "true", "closePosition": False, "side": body["side"],
+        "positionSide": body.get("positionSide", "BOTH"), "stopPrice": "0", "workingType": "CONTRACT_PRICE",
+        "priceProtect": False, "origType": body["type"], "priceMatch": "NONE", "selfTradePreventionMode": "NONE",
+        "goodTillDate": 0, "updateTime": 1700000000000,
+    }
+
+
+class StandinAdapter(HTTPAdapter):
+    """
+    Binance 대체 응답. 주문 요청(body)은 self.orders에 기록
+    """
+
+    def __init__(self, fills: int = 5):
+        super().__init__()
+        self.fills = fills
+        self.orders = []
+        self.response_bytes = []
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        if url.path in ("/api/v3/exchangeInfo",):
+            payload = SPOT_INFO
+        elif url.path in ("/fapi/v1/exchangeInfo",):
+            payload = FUTURES_INFO
+        elif url.path in ("/api/v3/order", "/fapi/v1/order"):
+            query = request.body.decode() if isinstance(request.body, bytes) else request.body
+            body = {key: value[0] for key, value in parse_qs(query or url.query).items()}
+            self.orders.append(body)
+            payload = spot_response(body, self.fills) if url.path == "/api/v3/order" else futures_response(body)
+        else:
+            payload = {}
+        response = Response()
+        response.status_code = 200
+        response._content = orjson.dumps(payload)
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        self.response_bytes.append(len(response._content))
+        return response
+
+
+def make_client(fills: int = 5):
+    client = ccxt.binance({
+        "apiKey": "bench-key",
+        "secret": "bench-secret",
+        "enableRateLimit": False,
+        "options": {"fetchMarkets": ["spot", "linear"], "fetchCurrencies": False},
+    })
+    adapter = StandinAdapter(fills)
+    client.session.mount("https://", adapter)
+    client.load_markets()
+    return client, adapter
+
+
+# (symbol, type, side, amount, price, params)
+CASES = [
+    (SPOT_SYMBOL, "market", "buy", 0.01, None, {}),
+    (SPOT_SYMBOL, "limit", "sell", 0.01, 37000, {}),
+    (SWAP_SYMBOL, "market", "buy", 0.01, None, {}),
+    (SWAP_SYMBOL, "limit", "sell", 0.01, 37000, {"reduceOnly": True}),
+    (SWAP_SYMBOL, "market", "sell", 0.01, None, {"positionSide": "SHORT"}),
+]
+
+# 매 요청마다 바뀌는 값
+VOLATILE = ("timestamp", "signature", "newClientOrderId", "newOrderRespType")
+
+
+def verify():
+    client, adapter = make_client()
+    for symbol, type, side, amount, price, params in CASES:
+        full = client.create_order(symbol, type, side, amount, price, dict(params))
+        full_body = adapter.orders[-1]
+        slim = ack.create_order(client, symbol, type, side, amount, price, dict(params))
+        ack_body = adapter.orders[-1]
+        assert ack_body["newOrderRespType"] == "ACK", ack_body
+        assert {k: v for k, v in full_body.items() if k not in VOLATILE} == {k: v for k, v in ack_body.items() if k not in VOLATILE}, (full_body, ack_body)
+        assert slim["id"] == full["id"] and slim["symbol"] == full["symbol"] and slim["side"] == full["side"], (slim, full)
+        assert float(slim["amount"]) == float(full["amount"]), (slim, full)
+        assert set(slim) == set(ack.SLIM_KEYS)
+        print(f"ok  {symbol:14} {type:6} {side:4} {params}  full={full_body['newOrderRespType']:6} -> ack (status={slim['status']})")
+    # 직접 호출 경로에서 처리하지 않는 params는 ccxt create_order로 보내고 결과만 줄인다
+    slim = ack.create_order(client, SPOT_SYMBOL, "market", "buy", 0.01, None, {"test": False})
+    assert adapter.orders[-1]["newOrderRespType"] == "FULL" and slim["status"] == "closed", slim
+    print("ok  fallback (params 외) -> ccxt create_order + slim_order")
+
+
+def measure(order, n: int) -> list[float]:
+    samples = []
+    for _ in range(n):
+        started = time.perf_counter()
+        order()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def bench(n: int = 5000, fills: int = 5):
+    client, adapter = make_client(fills)
+    for symbol, type, side, amount, price, params in CASES[:3]:
+        print(f"{symbol} {type} {side}")
+        for name, order in (
+            ("ccxt create_order", lambda: client.create_order(symbol, type, side, amount, price, dict(params))),
+            ("ack.create_order ", lambda: ack.create_order(client, symbol, type, side, amount, price, dict(params))),
+        ):
+            measure(order, min(n, 200))     # warm-up
+            adapter.response_bytes.clear()
+            samples = measure(order, n)
+            print(
+                f"  {name} : median {statistics.median(samples):7.1f}µs  p99 {statistics.quantiles(samples, n=100)[98]:7.1f}µs"
+                f"  응답 {statistics.mean(adapter.response_bytes):6.0f} bytes"
+            )
+
+
+if __name__ == "__main__":
+    fire.Fire({"verify": verify, "bench": bench})
@@ -0,0 +1,71 @@
+"""
+shard 라우팅 오버헤드 측정
+
+같은 요청(GET /hi)을
+  1) 메인 프로세스 안에서 바로 처리 (SHARD_MODE=off 와 같은 경로)
+  2) shard 프로세스로 전달 후 응답 수신 (Pipe + framing + shard 안의 ASGI 호출)
+로 n번씩 보내서 요청당 시간을 비교한다. (거래소 API는 호출하지 않음)
+
+실행 : python tools/bench_shard.py --n 2000 --concurrency 1
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fire
+from exchange.shard import ShardManager, call_asgi
+
+
+async def measure(call, n: int, concurrency: int) -> list[float]:
+    latencies = []
+
+    async def worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            status_code, _, _ = await call()
+            latencies.append(time.perf_counter() - started)
+            assert status_code == 200, status_code
+
+    await asyncio.gather(*[worker(n // concurrency) for _ in range(concurrency)])
+    return latencies
+
+
+def summary(name: str, latencies: list[float], elapsed: float):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(int(len(latencies) * q), len(latencies) - 1)] * 1e6
+    print(
+        f"{name:<10} n={len(latencies):<6} mean={statistics.mean(latencies) * 1e6:8.1f}us "
+        f"p50={p(0.5):8.1f}us p99={p(0.99):8.1f}us throughput={len(latencies) / elapsed:8.0f}/s"
+    )
+
+
+async def run(n: int, concurrency: int):
+    from main import app
+
+    manager = ShardManager(["BENCH"])
+    await manager.start()
+    while manager.shards["BENCH"].last_heartbeat is None:
+        await asyncio.sleep(0.1)
+
+    local = lambda: call_asgi(app, "GET", "/hi")
+    sharded = lambda: manager.forward("BENCH", "GET", "/hi", "", [], b"")
+
+    for name, call in (("local", local), ("shard", sharded)):
+        await measure(call, min(n, 200), concurrency)  # warm up
+        started = time.perf_counter()
+        latencies = await measure(call, n, concurrency)
+        summary(name, latencies, time.perf_counter() - started)
+
+    await manager.stop()
+
+
+def main(n: int = 2000, concurrency: int = 1):
+    asyncio.run(run(n, concurrency))
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
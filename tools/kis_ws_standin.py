@@ -0,0 +1,204 @@
+"""
+로컬 KIS WebSocket 대체 서버 (테스트용)
+
+exchange/stock/realtime.py가 사용하는 부분만 흉내낸다.
+  POST /oauth2/Approval          접속키 발급
+  WS   /                         구독(tr_type=1) -> key / iv 응답, PINGPONG, 체결통보 push (AES-256-CBC)
+  POST /standin/notice           연결된 클라이언트에 체결통보 전송 {"tr_id", "records": [[field, ...], ...]}
+  POST /standin/quote            실시간 시세(HDFSCNT0, 평문) 전송 {"symbol": "DNASAAPL", "price": 187.3}
+  POST /standin/drop             모든 연결 끊기 (재연결 확인용)
+
+실행 : python tools/kis_ws_standin.py serve --port 21000
+확인 : python tools/kis_ws_standin.py selftest   (대체 서버를 띄우고 KisRealtime으로 구독/복호화/체결 집계/재연결 확인)
+"""
+import os
+import sys
+import uuid
+import random
+import string
+import asyncio
+from base64 import b64encode
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fire
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import ORJSONResponse
+
+
+def encrypt(key: str, iv: str, text: str) -> str:
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    padder = padding.PKCS7(128).padder()
+    data = padder.update(text.encode()) + padder.finalize()
+    encryptor = Cipher(algorithms.AES(key.encode()), modes.CBC(iv.encode())).encryptor()
+    return b64encode(encryptor.update(data) + encryptor.finalize()).decode()
+
+
+def random_text(length: int) -> str:
+    return "".join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def create_app(ping_interval: float = 10.0) -> FastAPI:
+    app = FastAPI()
+    app.state.sockets = {}      # WebSocket -> {tr_id: (key, iv)}
+    app.state.stats = {"approval": 0, "connects": 0, "subscribes": 0, "pongs": 0}
+
+    @app.post("/oauth2/Approval")
+    async def approval(request: Request):
+        body = orjson.loads(await request.body())
+        if not body.get("appkey") or not body.get("secretkey"):
+            return ORJSONResponse({"error_code": "EGW00103", "error_description": "유효하지 않은 AppKey입니다."}, status_code=403)
+        app.state.stats["approval"] += 1
+        return ORJSONResponse({"approval_key": str(uuid.uuid4())})
+
+    @app.websocket("/")
+    async def websocket(ws: WebSocket):
+        await ws.accept()
+        app.state.stats["connects"] += 1
+        subscriptions = app.state.sockets[ws] = {}
+
+        async def ping():
+            while True:
+                await asyncio.sleep(ping_interval)
+                await ws.send_text(orjson.dumps({"header": {"tr_id": "PINGPONG", "datetime": "20260101000000"}}).decode())
+
+        pinger = asyncio.create_task(ping())
+        try:
+            while True:
+                message = orjson.loads(await ws.receive_text())
+                header = message.get("header", {})
+                if header.get("tr_id") == "PINGPONG":
+                    app.state.stats["pongs"] += 1
+                    continue
+                tr_id = message["body"]["input"]["tr_id"]
+                tr_key = message["body"]["input"]["tr_key"]
+                key, iv = random_text(32), random_text(16)
+                subscriptions[tr_id] = (key, iv)
+                app.state.stats["subscribes"] += 1
+                await ws.send_text(orjson.dumps({
+                    "header": {"tr_id": tr_id, "tr_key": tr_key, "encrypt": "N"},
+                    "body": {"rt_cd": "0", "msg_cd": "OPSP0000", "msg1": "SUBSCRIBE SUCCESS", "output": {"iv": iv, "key": key}},
+                }).decode())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            pinger.cancel()
+            app.state.sockets.pop(ws, None)
+
+    @app.post("/standin/notice")
+    async def notice(request: Request):
+        body = orjson.loads(await request.body())
+        tr_id, records = body["tr_id"], body["records"]
+        data = "^".join("^".join(str(field) for field in record) for record in records)
+        sent = 0
+        for ws, subscriptions in list(app.state.sockets.items()):
+            if tr_id in subscriptions:
+                await ws.send_text(f"1|{tr_id}|{len(records):03d}|{encrypt(*subscriptions[tr_id], data)}")
+                sent += 1
+        return {"sent": sent}
+
+    @app.post("/standin/quote")
+    async def quote(request: Request):
+        body = orjson.loads(await request.body())
+        record = [body["symbol"], body["symbol"][4:], "4", "", "", "", "", "", "", "", "", str(body["price"])] + ["0"] * 14
+        sent = 0
+        for ws, subscriptions in list(app.state.sockets.items()):
+            if "HDFSCNT0" in subscriptions:
+                await ws.send_text(f"0|HDFSCNT0|001|{'^'.join(record)}")
+                sent += 1
+        return {"sent": sent}
+
+    @app.post("/standin/drop")
+    async def drop():
+        sockets = list(app.state.sockets)
+        for ws in sockets:
+            await ws.close()
+        return {"dropped": len(sockets)}
+
+    return app
+
+
+def korea_notice(order_no: str, side: str, ticker: str, qty: int, price: int, order_qty: int, filled: bool, refused: bool = False, revise: str = "0", original_order_no: str = "") -> list:
+    """
+    H0STCNI0 필드 순서 (exchange.stock.realtime.KOREA_FIELDS)
+    """
+    return [
+        "hts-id", "12345678", order_no, original_order_no, "01" if side == "sell" else "02", revise, "00", "0", ticker,
+        qty if filled else 0, price if filled else 0, "093001", "1" if refused else "0", "2" if filled else "1", "Y", "01234",
+        order_qty, "홍길동", "삼성전자", "", "", "", "",
+    ]
+
+
+async def _selftest(port: int):
+    import httpx
+    import uvicorn
+    from exchange.stock import realtime
+    from exchange.stock.quote import quote_cache
+
+    app = create_app(ping_interval=0.3)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+    realtime.RECONNECT_DELAYS = (0.2,)
+    client = realtime.KisRealtime("KIS1", "app-key", "app-secret", "hts-id", False, base, f"ws://127.0.0.1:{port}/", ["DNASAAPL"])
+    client.start()
+    try:
+        async with httpx.AsyncClient(base_url=base) as http:
+            async def wait_for(condition, timeout: float = 5.0):
+                for _ in range(int(timeout / 0.02)):
+                    if condition():
+                        return
+                    await asyncio.sleep(0.02)
+                raise AssertionError("timeout")
+
+            await wait_for(lambda: all(tr_id in client.ciphers for tr_id in client.notice_tr_ids))
+            # 주문 접수 -> 부분 체결 2건(한 메시지에 2건) -> 전량 체결
+            waiter = asyncio.create_task(client.book.wait("0000012345", timeout=5))
+            await http.post("/standin/notice", json={"tr_id": "H0STCNI0", "records": [korea_notice("0000012345", "buy", "005930", 0, 0, 10, False)]})
+            await http.post("/standin/notice", json={"tr_id": "H0STCNI0", "records": [
+                korea_notice("0000012345", "buy", "005930", 3, 70000, 10, True),
+                korea_notice("0000012345", "buy", "005930", 3, 70100, 10, True),
+            ]})
+            await wait_for(lambda: client.book.order("12345") is not None and client.book.order("12345").filled_qty == 6)
+            assert client.book.order("12345").status == "partial"
+            await http.post("/standin/notice", json={"tr_id": "H0STCNI0", "records": [korea_notice("0000012345", "buy", "005930", 4, 70200, 10, True)]})
+            state = await waiter
+            assert state.status == "filled" and state.filled_qty == 10, state.dict()
+            assert abs(state.average - (3 * 70000 + 3 * 70100 + 4 * 70200) / 10) < 1e-9, state.average
+            # 실시간 시세 -> 현재가 캐시
+            await http.post("/standin/quote", json={"symbol": "DNASAAPL", "price": 187.35})
+            await wait_for(lambda: quote_cache.get("NAS", "AAPL", ttl=5) == 187.35)
+            # PINGPONG 응답
+            await wait_for(lambda: app.state.stats["pongs"] >= 1)
+            # 연결이 끊기면 다시 연결하고 다시 구독한다 (접속키는 재사용)
+            await http.post("/standin/drop")
+            await wait_for(lambda: client.connects == 2 and client.connected and len(app.state.sockets) == 1)
+            await wait_for(lambda: app.state.stats["subscribes"] == 6)
+            await http.post("/standin/notice", json={"tr_id": "H0STCNI0", "records": [korea_notice("0000012346", "sell", "005930", 0, 0, 5, False, refused=True)]})
+            await wait_for(lambda: client.book.order("12346") is not None and client.book.order("12346").status == "refused")
+            assert app.state.stats["approval"] == 1, app.state.stats
+            print(f"selftest ok : {app.state.stats}, orders={[state.dict()['status'] for state in client.book.orders.values()]}")
+    finally:
+        await client.stop()
+        server.should_exit = True
+        await task
+
+
+def serve(host: str = "127.0.0.1", port: int = 21000, ping_interval: float = 10.0):
+    import uvicorn
+
+    uvicorn.run(create_app(ping_interval), host=host, port=port, log_level="warning")
+
+
+def selftest(port: int = 18021):
+    os.environ.setdefault("PASSWORD", "selftest")
+    asyncio.run(_selftest(port))
+
+
+if __name__ == "__main__":
+    fire.Fire({"serve": serve, "selftest": selftest})
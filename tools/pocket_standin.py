@@ -0,0 +1,147 @@
+"""
+로컬 PocketBase 대체 서버 (테스트용, 메모리 저장)
+
+exchange/pocket.py가 사용하는 API만 흉내낸다.
+  POST   /api/admins/auth-with-password, /api/admins/auth-refresh
+  GET    /api/collections/{collection}/records  (page, perPage, filter: 'a = "x" && b = "y"')
+  POST   /api/collections/{collection}/records
+  DELETE /api/collections/{collection}/records/{id}
+
+실행 : python tools/pocket_standin.py serve --port 8090 --token_ttl 3600
+확인 : python tools/pocket_standin.py selftest   (대체 서버를 띄우고 exchange.pocket 클라이언트로 생성/조회/삭제/재인증 확인)
+"""
+import os
+import re
+import sys
+import time
+import uuid
+import base64
+import asyncio
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fire
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import ORJSONResponse
+
+FILTER = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+
+
+def make_token(ttl: float) -> str:
+    encode = lambda data: base64.urlsafe_b64encode(orjson.dumps(data)).rstrip(b"=").decode()
+    return f"{encode({'alg': 'HS256'})}.{encode({'exp': int(time.time() + ttl), 'id': uuid.uuid4().hex})}.standin"
+
+
+def create_app(identity: str = "poa@admin.com", password: str = "poabot!@#$", token_ttl: float = 3600) -> FastAPI:
+    app = FastAPI()
+    app.state.records = {}      # collection -> {id: record}
+    app.state.tokens = set()
+    app.state.stats = {"auth": 0, "refresh": 0, "requests": 0}
+
+    def issue() -> ORJSONResponse:
+        token = make_token(token_ttl)
+        app.state.tokens.add(token)
+        return ORJSONResponse({"token": token, "admin": {"email": identity}})
+
+    def authorized(request: Request) -> bool:
+        app.state.stats["requests"] += 1
+        return request.headers.get("Authorization") in app.state.tokens
+
+    @app.post("/api/admins/auth-with-password")
+    async def auth_with_password(request: Request):
+        body = orjson.loads(await request.body())
+        if body.get("identity") != identity or body.get("password") != password:
+            return ORJSONResponse({"message": "Failed to authenticate."}, status_code=400)
+        app.state.stats["auth"] += 1
+        return issue()
+
+    @app.post("/api/admins/auth-refresh")
+    async def auth_refresh(request: Request):
+        if not authorized(request):
+            return ORJSONResponse({"message": "unauthorized"}, status_code=401)
+        app.state.stats["refresh"] += 1
+        return issue()
+
+    @app.get("/api/collections/{collection}/records")
+    async def list_records(collection: str, request: Request, page: int = 1, perPage: int = 30, filter: str = ""):
+        if not authorized(request):
+            return ORJSONResponse({"message": "unauthorized"}, status_code=401)
+        conditions = FILTER.findall(filter)
+        items = [
+            record for record in app.state.records.get(collection, {}).values()
+            if all(str(record.get(field)) == value for field, value in conditions)
+        ]
+        total_pages = max(1, -(-len(items) // perPage))
+        return ORJSONResponse({
+            "page": page, "perPage": perPage, "totalItems": len(items), "totalPages": total_pages,
+            "items": items[(page - 1) * perPage: page * perPage],
+        })
+
+    @app.post("/api/collections/{collection}/records")
+    async def create_record(collection: str, request: Request):
+        if not authorized(request):
+            return ORJSONResponse({"message": "unauthorized"}, status_code=401)
+        record = orjson.loads(await request.body()) | {"id": uuid.uuid4().hex[:15], "collectionName": collection}
+        app.state.records.setdefault(collection, {})[record["id"]] = record
+        return ORJSONResponse(record)
+
+    @app.delete("/api/collections/{collection}/records/{id}")
+    async def delete_record(collection: str, id: str, request: Request):
+        if not authorized(request):
+            return ORJSONResponse({"message": "unauthorized"}, status_code=401)
+        if app.state.records.get(collection, {}).pop(id, None) is None:
+            return ORJSONResponse({"message": "not found"}, status_code=404)
+        return Response(status_code=204)
+
+    return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 8090, token_ttl: float = 3600):
+    import uvicorn
+
+    uvicorn.run(create_app(token_ttl=token_ttl), host=host, port=port, log_level="warning")
+
+
+async def _selftest(port: int):
+    import uvicorn
+    from exchange import pocket
+
+    app = create_app(token_ttl=pocket.REFRESH_MARGIN + 2)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        client = pocket.PocketBaseClient(f"http://127.0.0.1:{port}", "poa@admin.com", "poabot!@#$")
+        pocket.pb = client
+        started = time.perf_counter()
+        await asyncio.gather(*[pocket.create("kimp", {"exchange": "BINANCE", "base": "BTC", "amount": 0.1}) for _ in range(250)])
+        await pocket.create("kimp", {"exchange": "UPBIT", "base": "BTC", "amount": 0.1})
+        records = await pocket.get_full_list("kimp", query_params={"filter": 'base = "BTC" && exchange = "BINANCE"'})
+        assert len(records) == 250, len(records)
+        await pocket.delete_many("kimp", [record.id for record in records])
+        assert len(await pocket.get_full_list("kimp")) == 1
+        elapsed = time.perf_counter() - started
+        assert app.state.stats["auth"] == 1, app.state.stats     # 동시 요청 250개에도 인증은 한 번
+        # 만료 REFRESH_MARGIN초 전 -> 백그라운드 갱신
+        await asyncio.sleep(2.5)
+        assert app.state.stats["refresh"] >= 1, app.state.stats
+        # 서버에서 토큰이 사라지면 (재시작 등) 401 -> 재인증 후 재시도
+        app.state.tokens.clear()
+        await pocket.create("kimp", {"exchange": "UPBIT", "base": "ETH", "amount": 1})
+        assert app.state.stats["auth"] == 2, app.state.stats
+        print(f"selftest ok : {app.state.stats}, 252 create + list + 250 delete {elapsed * 1000:.0f}ms")
+    finally:
+        await pocket.close()
+        server.should_exit = True
+        await task
+
+
+def selftest(port: int = 18090):
+    os.environ.setdefault("PASSWORD", "selftest")
+    asyncio.run(_selftest(port))
+
+
+if __name__ == "__main__":
+    fire.Fire({"serve": serve, "selftest": selftest})